@@ -1,5 +1,6 @@
-# Visualization packages
-import altair as alt
+import datetime
+import os
+import time
 
 # Dashboard packages
 import dash
@@ -7,22 +8,41 @@ import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
+from flask import Response, g, request
 
-# Import functions from data_wrangling script
-from data_wrangling import (
-    get_year_stats,
-    get_month_stats,
-    get_year_data,
-    get_month_data,
-    left_hist_data,
-    right_hist_data,
+from background import (
+    BACKGROUND_CALLBACKS,
+    background_callback,
+    background_components,
 )
+from callback_cache import LRUCache, memoize
+from metrics import observe, register_cache, timed_callback
+from metrics import render as render_metrics
+from profiling import profiled
+import query_api
+from revalidation import revalidate
+from startup import STARTUP_WARM, LazyModule, logger, warm_in_background
+from warmup import WARM_CACHE, describe, warm
+
+# "iframe" sends every chart as a full html page for an `html.Iframe`, "vega"
+# draws the charts with the vega runtime bundled in `assets/vega` and only
+# sends the chart data, see `assets/vega_charts.js`
+CHART_MODE = os.environ.get("CHART_MODE", "iframe")
+CHART_PROP = "data" if CHART_MODE == "vega" else "srcDoc"
 
 app = dash.Dash(
-    external_stylesheets=[dbc.themes.BOOTSTRAP], title="Super Hotel Management"
+    __name__,
+    external_stylesheets=[dbc.themes.BOOTSTRAP],
+    title="Super Hotel Management",
+    assets_ignore="" if CHART_MODE == "vega" else "vega",
 )
 server = app.server  # to deploy the app
 
+# pandas, altair and the data are only imported when a callback first needs
+# them, so that the layout is served at once, see `startup.py`
+data_wrangling = LazyModule("data_wrangling")
+charts = LazyModule("charts")
+
 
 # Global variables
 columns = [
@@ -63,7 +83,56 @@ months_short = [
     "Nov",
     "Dec",
 ]
-years = [2015, 2016, 2017]
+hotel_types = ["All", "Resort", "City"]
+default_range = ("2016-01-01", "2016-03-31")
+# days drawn at most by `range-plot`, one every two pixels of its 680 px, longer
+# windows are downsampled, see `data_wrangling.downsample()`
+RANGE_POINTS = 340
+
+
+def range_days(start, end):
+    """returns the number of days after `start` up to `end`, ex) 90 for a quarter"""
+    first = datetime.date.fromisoformat(start[:10])
+    return max((datetime.date.fromisoformat(end[:10]) - first).days, 0)
+
+
+def zoom_window(start, end, zoom=None):
+    """returns the first and last dates drawn by `range-plot`
+    ----------
+     start:       the first date selected from "date-range"
+     end:         the last date selected from "date-range"
+     zoom:        the days after `start` selected from "range-zoom", None for
+                  all the selected dates
+    Returns
+    -------
+    the first and last dates, ex) ("2016-01-01", "2016-03-31")
+    """
+    first = datetime.date.fromisoformat(start[:10])
+    if not zoom:
+        return first.isoformat(), end[:10]
+    days = range_days(start, end)
+    low, high = sorted(min(max(int(day), 0), days) for day in zoom)
+    return (
+        (first + datetime.timedelta(days=low)).isoformat(),
+        (first + datetime.timedelta(days=high)).isoformat(),
+    )
+
+
+def chart_component(chart_id, style):
+    """returns the component showing the chart `chart_id` in the current `CHART_MODE`
+    ----------
+     chart_id:    id of the component receiving the chart from its callback
+     style:       style of the chart area
+    Returns
+    -------
+    an `html.Iframe`, or a `dcc.Store` with the `html.Div` the chart is drawn in
+    """
+    if CHART_MODE == "vega":
+        return html.Div(
+            [html.Div(id=chart_id + "-view", style=style), dcc.Store(id=chart_id)]
+        )
+    return html.Iframe(id=chart_id, style=style)
+
 
 collapse = html.Div(
     [
@@ -170,9 +239,9 @@ card_top = dbc.Card(
                     [
                         dbc.Col(
                             [
-                                html.Iframe(
-                                    id="year-plot",
-                                    style={
+                                chart_component(
+                                    "year-plot",
+                                    {
                                         "border-width": "0",
                                         "width": "100%",
                                         "height": "375px",
@@ -200,9 +269,9 @@ card_top = dbc.Card(
                         ),
                         dbc.Col(
                             [
-                                html.Iframe(
-                                    id="month-plot",
-                                    style={
+                                chart_component(
+                                    "month-plot",
+                                    {
                                         "border-width": "0",
                                         "width": "100%",
                                         "height": "375px",
@@ -241,12 +310,98 @@ card_top = dbc.Card(
     },
 )
 
+card_range = dbc.Card(
+    [
+        dbc.CardHeader(
+            [
+                dbc.Row(
+                    [
+                        dbc.Col(md=1),
+                        dbc.Col(
+                            [
+                                html.H5(
+                                    "Select dates to plot:",
+                                    style={"margin-top": "15px"},
+                                ),
+                            ],
+                            md=4,
+                        ),
+                        dbc.Col(
+                            [
+                                # the dates with data, see `update_data_bounds()`
+                                dcc.DatePickerRange(
+                                    id="date-range",
+                                    start_date=default_range[0],
+                                    end_date=default_range[1],
+                                    display_format="YYYY-MM-DD",
+                                    style={"margin-top": "5px"},
+                                ),
+                            ],
+                            md=6,
+                        ),
+                    ]
+                )
+            ],
+            style={
+                "background-color": "white",
+            },
+        ),
+        dbc.CardBody(
+            [
+                chart_component(
+                    "range-plot",
+                    {
+                        "border-width": "0",
+                        "width": "100%",
+                        "height": "375px",
+                    },
+                ),
+                # zooms into the selected dates, reset by `reset_range_zoom()`
+                dcc.RangeSlider(
+                    id="range-zoom",
+                    min=0,
+                    max=range_days(*default_range),
+                    step=1,
+                    value=[0, range_days(*default_range)],
+                    marks={
+                        "0": default_range[0],
+                        str(range_days(*default_range)): default_range[1],
+                    },
+                    allowCross=False,
+                ),
+                html.P(
+                    id="range_stats_card",
+                    children="",
+                    style={
+                        "text-align": "center",
+                        "color": "#537aaa",
+                    },
+                ),
+                html.P(
+                    id="range_stats_card2",
+                    children="",
+                    style={
+                        "text-align": "center",
+                        "color": "#f9a200",
+                    },
+                ),
+            ],
+        ),
+    ],
+    className="w-100 mb-3",
+    style={
+        "border": "1.5px solid #d3d3d3",
+        "margin-left": "15px",
+        "margin-right": "15px",
+    },
+)
+
 card_left = dbc.Card(
     [
         dbc.CardBody(
-            html.Iframe(
-                id="hist1",
-                style={
+            chart_component(
+                "hist1",
+                {
                     "border-width": "0",
                     "width": "120%",
                     "height": "300px",
@@ -261,9 +416,9 @@ card_left = dbc.Card(
 card_right = dbc.Card(
     [
         dbc.CardBody(
-            html.Iframe(
-                id="hist2",
-                style={
+            chart_component(
+                "hist2",
+                {
                     "border-width": "0",
                     "width": "100%",
                     "height": "300px",
@@ -329,10 +484,9 @@ info_area = dbc.Container(
                         ),
                         html.Br(),
                         html.H5("Select year", style={"color": "#023047"}),
+                        # the years with data, see `update_data_bounds()`
                         dcc.Dropdown(
                             id="year-dropdown",
-                            options=[{"label": year, "value": year} for year in years],
-                            value=2015,
                             multi=False,
                             searchable=False,
                             clearable=False,
@@ -364,6 +518,16 @@ info_area = dbc.Container(
                             value="All",
                             labelStyle={"display": "block"},
                         ),
+                        html.Br(),
+                        html.H5("Select properties"),
+                        # searched and filled by `update_property_dropdown()`
+                        dcc.Dropdown(
+                            id="property-selection",
+                            value=[],
+                            multi=True,
+                            searchable=True,
+                            placeholder="All properties",
+                        ),
                     ],
                     md=2,
                     style={
@@ -378,6 +542,7 @@ info_area = dbc.Container(
                 dbc.Col(
                     [
                         dbc.Row([card_top]),
+                        dbc.Row([card_range]),
                         dbc.Row(
                             [
                                 dbc.Col([card_left]),
@@ -396,14 +561,114 @@ footer = dcc.Markdown(
     """This dashboard was made by Group 20 of MDS DSCI 532 [Link to GitHub source](https://github.com/UBC-MDS/dsci-532_group-20). The data has been sourced from [Link to data source](https://github.com/rfordatascience/tidytuesday/tree/master/data/2020/2020-02-11).""",
     style={"text-align": "center"},
 )
-app.layout = html.Div([jumbotron, info_area, html.Hr(), footer])
+app.layout = html.Div(
+    [dcc.Location(id="url", refresh=False), jumbotron, info_area, html.Hr(), footer]
+)
+if CHART_MODE == "vega":
+    # the chart templates are sent once, with the layout
+    app.layout.children.append(
+        dcc.Store(id="chart-templates", data=charts.template_specs())
+    )
+
+
+def data_version():
+    """returns the content hash of the data being served, see `data_wrangling.py`"""
+    return data_wrangling.data_version()
 
 
-click = alt.selection_multi(fields=["Line"], bind="legend")
+def draw(kind, df, title, y_col=None):
+    """returns the chart output of the plotting callbacks, html or data for the
+    browser, see `charts.py`
+    """
+    if CHART_MODE == "vega":
+        return charts.payload(kind, df, title, y_col=y_col)
+    return charts.render(kind, df, title, y_col=y_col)
+
+
+# outputs of the plotting callbacks, which only depend on their inputs and the data
+chart_cache = LRUCache(max_entries=2048, max_bytes=64 * 2**20)
+register_cache("chart", chart_cache)
+
+
+@server.before_request
+def start_timer():
+    g.start = time.perf_counter()
+
+
+@server.after_request
+def record_callback_request(response):
+    """records the time and response size of the dash callback requests"""
+    if request.path.endswith("/_dash-update-component") and "start" in g:
+        body = request.get_json(silent=True) or {}
+        output = body.get("output") if isinstance(body, dict) else None
+        # a label per registered callback, whatever the clients send
+        if not isinstance(output, str) or output not in app.callback_map:
+            output = "unknown"
+        observe(
+            "dashboard_request_seconds", time.perf_counter() - g.start, output=output
+        )
+        size = response.calculate_content_length() or 0
+        observe("dashboard_response_bytes", size, output=output)
+    return response
+
+
+# registered after `record_callback_request`, so that it runs before it
+@server.after_request
+def revalidate_callback_response(response):
+    """answers the dash callback requests with outputs the page already has
+    with a 304 or with unchanged markers, see `revalidation.py`
+    """
+    if request.path.endswith("/_dash-update-component"):
+        return revalidate(response, request.headers)
+    return response
+
+
+@server.route("/metrics")
+def prometheus_metrics():
+    """stage timings, response sizes and cache counters for Prometheus"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@server.route("/api/query", methods=["POST"])
+def api_query():
+    """answers a batch of queries for the numbers behind the charts, see
+    `query_api.py`
+    """
+    status, mimetype, body = query_api.answer(
+        request.get_json(silent=True), request.headers.get("Accept", "")
+    )
+    return Response(body, status=status, mimetype=mimetype)
+
 
 # Callbacks and back-end
 
 
+@app.callback(
+    Output("year-dropdown", "options"),
+    Output("year-dropdown", "value"),
+    Output("date-range", "min_date_allowed"),
+    Output("date-range", "max_date_allowed"),
+    Input("url", "pathname"),
+    State("year-dropdown", "value"),
+)
+def update_data_bounds(pathname, year):
+    """lists the years with data in the year-dropdown and limits the date-range
+    to the dates with data when the page opens, as the layout is served
+    without reading the data
+    ----------
+     pathname:    the path of the page, which opens it
+     year:        the year selected from "year-dropdown", None at first
+    Returns
+    -------
+    year-dropdown options and value, the first and last date-range dates
+    """
+    years = data_wrangling.available_years()
+    if year not in years:
+        year = years[0] if years else None
+    first, last = data_wrangling.available_dates()
+    return [{"label": y, "value": y} for y in years], year, first, last
+
+
 @app.callback(Output("month-dropdown", "options"), [Input("year-dropdown", "value")])
 def update_date_dropdown(year):
     """removes the months from the month-dropdown for which no data is  available
@@ -413,11 +678,38 @@ def update_date_dropdown(year):
     -------
     updated month-dropdown options
     """
-    if year == 2015:
-        return [{"label": months[i], "value": i + 1} for i in range(6, 12)]
-    if year == 2017:
-        return [{"label": months[i], "value": i + 1} for i in range(8)]
-    return [{"label": months[i], "value": i + 1} for i in range(12)]
+    return [
+        {"label": months[m - 1], "value": m}
+        for m in data_wrangling.available_months(year)
+    ]
+
+
+@app.callback(
+    Output("property-selection", "options"),
+    Output("property-selection", "value"),
+    Input("hotel-type-selection", "value"),
+    Input("property-selection", "search_value"),
+    State("property-selection", "value"),
+)
+def update_property_dropdown(hotel_type, search, selected):
+    """lists the properties of the selected hotel type matching the search, and
+    drops the selected properties of other hotel types
+    ----------
+     hotel_type:  the hotel type selected from "hotel-type-selection"
+     search:      the text typed in "property-selection"
+     selected:    the properties and groups selected in "property-selection"
+    Returns
+    -------
+    updated property-selection options and value
+    """
+    selected = selected or []
+    kept = [
+        value
+        for value in selected
+        if data_wrangling.resolve_properties([value], hotel_type)
+    ]
+    options = data_wrangling.property_options(hotel_type, search, kept)
+    return options, kept if kept != selected else dash.no_update
 
 
 @app.callback(
@@ -456,130 +748,214 @@ def toggle_collapse(n, is_open):
     return is_open
 
 
+def pending_chart(status):
+    """returns the chart output shown while a background job draws the chart
+    ----------
+     status:      status of the job, ex) "Running"
+    Returns
+    -------
+    html page with the status, or no update of the chart in the "vega" mode
+    """
+    if CHART_MODE == "vega":
+        return dash.no_update
+    return (
+        '<p style="font-family: sans-serif; color: gray; text-align: center; '
+        f'margin-top: 150px">{status}...</p>'
+    )
+
+
+def pending_plot(status):
+    """returns the outputs of `plot_year` and `plot_month` while they are pending"""
+    return [pending_chart(status), status, ""]
+
+
+def pending_histogram(status):
+    """returns the output of `histogram_1` and `histogram_2` while they are pending"""
+    return [pending_chart(status)]
+
+
 ################################### Top plots ################################
-@app.callback(
-    Output("year-plot", "srcDoc"),
-    Output("year_stats_card", "children"),
-    Output("year_stats_card2", "children"),
-    Input("hotel-type-selection", "value"),
-    Input("y-axis-dropdown", "value"),
-    Input("year-dropdown", "value"),
+@background_callback(
+    app,
+    [
+        Output("year-plot", CHART_PROP),
+        Output("year_stats_card", "children"),
+        Output("year_stats_card2", "children"),
+    ],
+    [
+        Input("hotel-type-selection", "value"),
+        Input("y-axis-dropdown", "value"),
+        Input("year-dropdown", "value"),
+        Input("property-selection", "value"),
+    ],
+    placeholder=pending_plot,
+    version=data_version,
 )
-def plot_year(hotel_type="All", y_col="Reservations", year=2016):
+@timed_callback
+@memoize(chart_cache, version=data_version)
+@profiled
+def plot_year(hotel_type="All", y_col="Reservations", year=2016, properties=None):
     """Updates the `year-plot` information in `year_stats_card` and `year_stats_card2`
     Parameters
     ----------
     hotel_type : dataframe produced by `get_year_data()`
     y_col:       the variable to be plotted, selectedfrom  "y-axis-dropdown"
     year:        the year selected from "year-dropdown"
+    properties:  the properties selected from "property-selection"
     Returns
     -------
     plot for `year-plot`, 2 strings for `year_stats_card` and `year_stats_card2`
     """
-    df = get_year_data(hotel_type, y_col, year)
-    stats_current = get_year_stats(df, "current", y_col, year)
-    stats_all = get_year_stats(df, "all_time", y_col, year)
-    df = get_year_data(hotel_type, y_col, year)
+    df = data_wrangling.get_year_data(hotel_type, y_col, year, properties)
+    stats_current = data_wrangling.get_year_stats(df, "current", y_col, year)
+    stats_all = data_wrangling.get_year_stats(df, "all_time", y_col, year)
     df["Arrival month"] = df["Arrival month"].replace(
         [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12], months_short
     )
-    lines = (
-        alt.Chart(df, title=y_col + " for " + str(year))
-        .mark_line()
-        .encode(
-            alt.X(
-                "Arrival month",
-                sort=months_short,
-                title="Month",
-                axis=alt.Axis(grid=False, labelAngle=-30),
-            ),
-            alt.Y(y_col, title=y_col, scale=alt.Scale(zero=True)),
-            alt.Color("Line"),
-            alt.Tooltip(y_col),
-            opacity=alt.condition(click, alt.value(0.9), alt.value(0.2)),
-        )
-    )
-    chart = (
-        (lines + lines.mark_circle())
-        .properties(width=295, height=250)
-        .configure_axis(labelFontSize=13, titleFontSize=17, grid=False)
-        .configure_title(fontSize=23)
-        .configure_legend(
-            strokeColor="gray",
-            fillColor="#e9ecef",
-            padding=10,
-            cornerRadius=10,
-            orient="bottom-right",
-        )
-        .interactive()
-        .add_selection(click)
-    )
-    return chart.to_html(), stats_current, stats_all
+    chart = draw("year", df, y_col + " for " + str(year), y_col=y_col)
+    return chart, stats_current, stats_all
 
 
-@app.callback(
-    Output("month-plot", "srcDoc"),
-    Output("month_stats_card", "children"),
-    Output("month_stats_card2", "children"),
-    Input("hotel-type-selection", "value"),
-    Input("y-axis-dropdown", "value"),
-    Input("year-dropdown", "value"),
-    Input("month-dropdown", "value"),
+@background_callback(
+    app,
+    [
+        Output("month-plot", CHART_PROP),
+        Output("month_stats_card", "children"),
+        Output("month_stats_card2", "children"),
+    ],
+    [
+        Input("hotel-type-selection", "value"),
+        Input("y-axis-dropdown", "value"),
+        Input("year-dropdown", "value"),
+        Input("month-dropdown", "value"),
+        Input("property-selection", "value"),
+    ],
+    placeholder=pending_plot,
+    version=data_version,
 )
-def plot_month(hotel_type="All", y_col="Reservations", year=2016, month=1):
+@timed_callback
+@memoize(chart_cache, version=data_version)
+@profiled
+def plot_month(
+    hotel_type="All", y_col="Reservations", year=2016, month=1, properties=None
+):
     """Updates the `month-plot` information in `month_stats_card` and `month_stats_card2`
     Parameters
     ----------
     hotel_type : dataframe produced by `get_month_data()`
     y_col:       the variable to be plotted, selected from "y-axis-dropdown"
     month:        the month selected from "month-dropdown"
+    properties:  the properties selected from "property-selection"
     Returns
     -------
     plot for `year-plot`, 2 strings for `year_stats_card` and `year_stats_card2`
     """
-    df = get_month_data(hotel_type, y_col, year, month)
-
-    stats_current = get_month_stats(df, "current", y_col, year, month)
-    stats_all = get_month_stats(df, "all_time", y_col, year, month)
-
-    lines = (
-        alt.Chart(df, title=y_col + " for " + months_short[month - 1] + " " + str(year))
-        .mark_line()
-        .encode(
-            alt.X("Arrival day", title="Date", axis=alt.Axis(grid=False)),
-            alt.Y(y_col, title=y_col, scale=alt.Scale(zero=True)),
-            alt.Color("Line"),
-            alt.Tooltip([y_col, "Arrival day of week"]),
-            opacity=alt.condition(click, alt.value(0.9), alt.value(0.2)),
-        )
-    )
-    chart = (
-        (lines + lines.mark_circle())
-        .properties(width=300, height=250)
-        .configure_axis(labelFontSize=13, titleFontSize=17, grid=False)
-        .configure_title(fontSize=23)
-        .configure_legend(
-            strokeColor="gray",
-            fillColor="#e9ecef",
-            padding=10,
-            cornerRadius=10,
-            orient="bottom-right",
-        )
-        .interactive()
-        .add_selection(click)
+    df = data_wrangling.get_month_data(hotel_type, y_col, year, month, properties)
+
+    stats_current = data_wrangling.get_month_stats(df, "current", y_col, year, month)
+    stats_all = data_wrangling.get_month_stats(df, "all_time", y_col, year, month)
+
+    chart = draw(
+        "month",
+        df,
+        y_col + " for " + months_short[month - 1] + " " + str(year),
+        y_col=y_col,
     )
-    return chart.to_html(), stats_current, stats_all
+    return chart, stats_current, stats_all
+
+
+@app.callback(
+    Output("range-zoom", "max"),
+    Output("range-zoom", "value"),
+    Output("range-zoom", "marks"),
+    Input("date-range", "start_date"),
+    Input("date-range", "end_date"),
+)
+def reset_range_zoom(start, end):
+    """zooms `range-plot` out to all the selected dates when they change
+    ----------
+     start:       the first date selected from "date-range"
+     end:         the last date selected from "date-range"
+    Returns
+    -------
+    the last day, the value and the marks of "range-zoom"
+    """
+    days = range_days(start, end)
+    return days, [0, days], {"0": start[:10], str(days): end[:10]}
 
 
-################################### Histograms ################################
 @app.callback(
-    Output("hist1", "srcDoc"),
+    Output("range-plot", CHART_PROP),
+    Output("range_stats_card", "children"),
+    Output("range_stats_card2", "children"),
     Input("hotel-type-selection", "value"),
-    Input("year-dropdown", "value"),
-    Input("month-dropdown", "value"),
+    Input("y-axis-dropdown", "value"),
+    Input("date-range", "start_date"),
+    Input("date-range", "end_date"),
+    Input("property-selection", "value"),
+    Input("range-zoom", "value"),
+)
+@timed_callback
+@memoize(chart_cache, version=data_version)
+@profiled
+def plot_range(
+    hotel_type="All",
+    y_col="Reservations",
+    start="2016-01-01",
+    end="2016-03-31",
+    properties=None,
+    zoom=None,
+):
+    """Updates the `range-plot` information in `range_stats_card` and `range_stats_card2`
+    Parameters
+    ----------
+    hotel_type : the hotel type selected from "hotel-type-selection"
+    y_col:       the variable to be plotted, selected from "y-axis-dropdown"
+    start:       the first date selected from "date-range"
+    end:         the last date selected from "date-range"
+    properties:  the properties selected from "property-selection"
+    zoom:        the days of the selected dates drawn, from "range-zoom"
+    Returns
+    -------
+    plot for `range-plot`, 2 strings for `range_stats_card` and `range_stats_card2`
+    """
+    # the chart draws the zoomed dates, downsampled to `RANGE_POINTS` days
+    # until zoomed in enough, and the stats are of all the selected dates
+    first, last = zoom_window(start, end, zoom)
+    df = data_wrangling.get_range_data(
+        hotel_type, y_col, first, last, properties, RANGE_POINTS
+    )
+    title = f"{y_col} from {first} to {last}"
+    if range_days(first, last) >= RANGE_POINTS and len(df) == RANGE_POINTS:
+        title += f" (downsampled to {RANGE_POINTS} days)"
+    stats_current = data_wrangling.get_range_stats(
+        hotel_type, y_col, start, end, "current", properties
+    )
+    stats_previous = data_wrangling.get_range_stats(
+        hotel_type, y_col, start, end, "previous", properties
+    )
+    chart = draw("range", df, title, y_col=y_col)
+    return chart, stats_current, stats_previous
+
+
+################################### Histograms ################################
+@background_callback(
+    app,
+    [Output("hist1", CHART_PROP)],
+    [
+        Input("hotel-type-selection", "value"),
+        Input("year-dropdown", "value"),
+        Input("month-dropdown", "value"),
+        Input("property-selection", "value"),
+    ],
+    placeholder=pending_histogram,
+    version=data_version,
 )
 # Function to plot the bottom left histogram using selected hotel type and dates
-def histogram_1(hotel_type, year, month):
+@timed_callback
+@memoize(chart_cache, version=data_version)
+@profiled
+def histogram_1(hotel_type, year, month, properties=None):
     """Updates the `hist1` histogram on the bottom left of the app, showing the
     country of origin of guests
     Parameters
@@ -587,41 +963,37 @@ def histogram_1(hotel_type, year, month):
     hotel_type : dataframe produced by `get_month_data()`
     year:        the year selected from "year-dropdown"
     month:        the month selected from "month-dropdown"
+    properties:  the properties selected from "property-selection"
     Returns
     -------
     plot for `hist1`
     """
-    df = left_hist_data(hotel_type, year, month)
-    top_countries = (
-        alt.Chart(
-            df,
-            title="Countries of origin "
-            + str(months_short[month - 1])
-            + " "
-            + str(year),
-        )
-        .mark_bar(color="orange", size=15)
-        .encode(
-            alt.Y("Country of origin", sort="-x", title="Country"),
-            alt.X("counts", title="Reservations"),
-            alt.Tooltip("Country of origin"),
-        )
-        .properties(width=300, height=200)
-        .configure_axis(labelFontSize=10, titleFontSize=15, grid=False)
-        .configure_title(fontSize=19)
+    df = data_wrangling.left_hist_data(hotel_type, year, month, properties)
+    return draw(
+        "countries",
+        df,
+        "Countries of origin " + str(months_short[month - 1]) + " " + str(year),
     )
-    return top_countries.to_html()
 
 
-@app.callback(
-    Output("hist2", "srcDoc"),
-    Input("hotel-type-selection", "value"),
-    Input("year-dropdown", "value"),
-    Input("month-dropdown", "value"),
+@background_callback(
+    app,
+    [Output("hist2", CHART_PROP)],
+    [
+        Input("hotel-type-selection", "value"),
+        Input("year-dropdown", "value"),
+        Input("month-dropdown", "value"),
+        Input("property-selection", "value"),
+    ],
+    placeholder=pending_histogram,
+    version=data_version,
 )
 
 # Function to plot the bottom right plot using selected hotel type
-def histogram_2(hotel_type, year, month):
+@timed_callback
+@memoize(chart_cache, version=data_version)
+@profiled
+def histogram_2(hotel_type, year, month, properties=None):
     """Updates the `hist2` histogram on the bottom left of the app, showing the
     duration of guest stay
     Parameters
@@ -629,32 +1001,100 @@ def histogram_2(hotel_type, year, month):
     hotel_type : dataframe produced by `get_month_data()`
     year:        the year selected from "year-dropdown"
     month:        the month selected from "month-dropdown"
+    properties:  the properties selected from "property-selection"
     Returns
     -------
     plot for `hist2`
     """
-    df = right_hist_data(hotel_type, year, month)
-    stay = (
-        alt.Chart(
-            df,
-            title="Lengths of Stay " + str(months_short[month - 1]) + " " + str(year),
-        )
-        .mark_bar(clip=True, color="orange", size=25)
-        .encode(
-            alt.X(
-                "Total nights",
-                title="Length of stay",
-                scale=alt.Scale(domain=(1, 7)),
-            ),
-            alt.Y("Percent of Reservations", title="Percent of Reservations"),
-            alt.Tooltip("Percent of Reservations"),
+    df = data_wrangling.right_hist_data(hotel_type, year, month, properties)
+    return draw(
+        "stay", df, "Lengths of Stay " + str(months_short[month - 1]) + " " + str(year)
+    )
+
+
+if BACKGROUND_CALLBACKS:
+    # the intervals and stores polling the jobs of the background callbacks
+    app.layout.children.extend(background_components())
+
+if CHART_MODE == "vega":
+    for chart_id in ["year-plot", "month-plot", "range-plot", "hist1", "hist2"]:
+        app.clientside_callback(
+            "function(chart, templates) {"
+            f" return window.vegaCharts.render('{chart_id}-view', chart, templates);"
+            " }",
+            Output(chart_id + "-view", "className"),
+            Input(chart_id, "data"),
+            State("chart-templates", "data"),
         )
-        .properties(width=300, height=200)
-        .configure_axis(labelFontSize=10, titleFontSize=15, grid=False)
-        .configure_title(fontSize=19)
+
+
+def input_space():
+    """returns every input of the chart callbacks the controls can produce
+    Returns
+    -------
+    dictionary of callback name -> list of input tuples, ex)
+    {"histogram_1": [("All", 2015, 7, ()), ...], ...}, every property
+    being selected, as there are too many subsets of properties
+    """
+    years = data_wrangling.available_years()
+    periods = [
+        (year, month)
+        for year in years
+        for month in data_wrangling.available_months(year)
+    ]
+    return {
+        "plot_year": [
+            (h, c, y, ()) for h in hotel_types for c in columns for y in years
+        ],
+        "plot_month": [
+            (h, c, y, m, ()) for h in hotel_types for c in columns for y, m in periods
+        ],
+        # only the date range shown when the page opens
+        "plot_range": [
+            (h, c, *default_range, (), (0, range_days(*default_range)))
+            for h in hotel_types
+            for c in columns
+        ],
+        "histogram_1": [(h, y, m, ()) for h in hotel_types for y, m in periods],
+        "histogram_2": [(h, y, m, ()) for h in hotel_types for y, m in periods],
+    }
+
+
+# the callbacks of `input_space()`
+chart_callbacks = {
+    "plot_year": plot_year,
+    "plot_month": plot_month,
+    "plot_range": plot_range,
+    "histogram_1": histogram_1,
+    "histogram_2": histogram_2,
+}
+
+
+def warm_chart_cache(processes=None):
+    """computes the charts of every choice of the controls in a process pool
+    and puts them in `chart_cache`, see `warmup.py`
+    ----------
+     processes:   number of processes of the pool, the number of CPUs if None
+    Returns
+    -------
+    the report of `warmup.warm()`, with the wall time and memory used
+    """
+    data_version()  # read the data before forking the pool
+    return warm(chart_callbacks, input_space(), processes)
+
+
+if WARM_CACHE:
+    logger.info(describe(warm_chart_cache()))
+elif STARTUP_WARM:
+    warm_in_background(
+        [
+            ("import", lambda: (data_wrangling.load(), charts.load())),
+            ("data", data_version),
+            # the Vega-Lite template of each chart type, built once
+            ("templates", lambda: charts.precompile_templates()),
+        ]
     )
-    return stay.to_html()
 
 
 if __name__ == "__main__":
-    app.run_server(debug=True)
\ No newline at end of file
+    app.run_server(debug=True)
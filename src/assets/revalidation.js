@@ -0,0 +1,121 @@
+// Revalidates the dash callback responses instead of downloading them again,
+// see src/revalidation.py.
+//
+// The requests to _dash-update-component are sent with the ETag of the last
+// response to the same request, and with the hashes of the outputs the page
+// holds. A 304 response is answered with the body kept from last time, and
+// the outputs the server marked unchanged get back the values they had when
+// the request was sent, so dash always reads a complete response. A marker
+// whose hash is not the one sent, which should not happen, gets the request
+// sent again without the hashes.
+(function () {
+  var UNCHANGED = "__dash_unchanged__";
+  var MAX_RESPONSES = 200;
+  var nativeFetch = window.fetch.bind(window);
+  var responses = new Map(); // request body -> {etag, text}
+  var outputs = {}; // "id.property" -> {hash, value}
+
+  function requestedOutputs(request) {
+    var list = Array.isArray(request.outputs) ? request.outputs : [request.outputs];
+    return list.map(function (output) {
+      var id = typeof output.id === "string" ? output.id : JSON.stringify(output.id);
+      return id + "." + output.property;
+    });
+  }
+
+  function remember(body, etag, text) {
+    responses.delete(body);
+    responses.set(body, { etag: etag, text: text });
+    if (responses.size > MAX_RESPONSES) {
+      responses.delete(responses.keys().next().value);
+    }
+  }
+
+  // returns the payload with the unchanged markers replaced by the values in
+  // `sent`, "id.property" -> {hash, value} of the request, or null if one of
+  // them is not there
+  function restore(payload, hashes, sent) {
+    var response = payload.response || {};
+    var complete = true;
+    Object.keys(response).forEach(function (component) {
+      Object.keys(response[component]).forEach(function (prop) {
+        var key = component + "." + prop;
+        var value = response[component][prop];
+        if (value && typeof value === "object" && UNCHANGED in value) {
+          if (sent[key] && sent[key].hash === value[UNCHANGED]) {
+            response[component][prop] = sent[key].value;
+          } else {
+            complete = false;
+          }
+        } else if (hashes[key]) {
+          outputs[key] = { hash: hashes[key], value: value };
+        }
+      });
+    });
+    return complete ? payload : null;
+  }
+
+  function jsonResponse(text) {
+    return new Response(text, {
+      status: 200,
+      headers: { "Content-Type": "application/json" },
+    });
+  }
+
+  window.fetch = function (input, init) {
+    var url = typeof input === "string" ? input : input.url;
+    if (
+      url.indexOf("_dash-update-component") === -1 ||
+      !init ||
+      typeof init.body !== "string"
+    ) {
+      return nativeFetch(input, init);
+    }
+    var body = init.body;
+    var cached = responses.get(body);
+    var headers = new Headers(init.headers || {});
+    if (cached) {
+      headers.set("If-None-Match", cached.etag);
+    }
+    // the outputs as they are now: a response to an earlier request may
+    // replace them before the response to this one arrives
+    var sent = {};
+    var known = {};
+    try {
+      requestedOutputs(JSON.parse(body)).forEach(function (key) {
+        if (outputs[key]) {
+          sent[key] = outputs[key];
+          known[key] = outputs[key].hash;
+        }
+      });
+    } catch (error) {
+      return nativeFetch(input, init);
+    }
+    headers.set("X-Dash-Outputs", JSON.stringify(known));
+    return nativeFetch(input, Object.assign({}, init, { headers: headers })).then(
+      function (response) {
+        if (response.status === 304 && cached) {
+          return jsonResponse(cached.text);
+        }
+        if (response.status !== 200) {
+          return response;
+        }
+        var etag = response.headers.get("ETag");
+        var hashes = JSON.parse(response.headers.get("X-Dash-Output-Hashes") || "{}");
+        return response.text().then(function (text) {
+          var payload = restore(JSON.parse(text), hashes, sent);
+          if (!payload) {
+            headers.delete("X-Dash-Outputs");
+            headers.delete("If-None-Match");
+            return nativeFetch(input, Object.assign({}, init, { headers: headers }));
+          }
+          var full = JSON.stringify(payload);
+          if (etag) {
+            remember(body, etag, full);
+          }
+          return jsonResponse(full);
+        });
+      }
+    );
+  };
+})();
@@ -0,0 +1,78 @@
+// Draws the charts of the "vega" chart mode of app.py (CHART_MODE=vega).
+//
+// The Vega-Lite templates of the chart types arrive once, in the
+// "chart-templates" store of the layout, and every callback update only
+// carries the title, plotted variable and data of one chart. A chart whose
+// template, variable and title did not change keeps its mounted view and only
+// gets its data replaced; otherwise it is embedded again from its template.
+// With `window.VEGA_CHART_DEBUG = true`, set from the console of the browser,
+// the render times are logged and the last MAX_TIMINGS of them are kept in
+// `window.vegaChartTimings` for comparison.
+window.vegaChartTimings = [];
+
+window.vegaCharts = (function () {
+  var MAX_TIMINGS = 200;
+  var views = {}; // element id -> {key, view, pending}
+
+  function buildSpec(template, chart) {
+    var text = template
+      .split('"@@Y_COL@@"').join(JSON.stringify(chart.y_col))
+      .split('"@@TITLE@@"').join(JSON.stringify(chart.title));
+    var spec = JSON.parse(text);
+    spec.datasets = { table: chart.values };
+    return spec;
+  }
+
+  function record(id, mode, start) {
+    if (!window.VEGA_CHART_DEBUG) {
+      return;
+    }
+    var timing = { chart: id, mode: mode, ms: performance.now() - start };
+    var timings = window.vegaChartTimings;
+    timings.push(timing);
+    if (timings.length > MAX_TIMINGS) {
+      timings.splice(0, timings.length - MAX_TIMINGS);
+    }
+    console.debug("vega chart", timing);
+  }
+
+  function render(id, chart, templates) {
+    if (!chart || !templates) {
+      return "vega-chart";
+    }
+    var start = performance.now();
+    var key = [chart.kind, chart.y_col, chart.title].join("|");
+    var current = views[id] || {};
+    if (current.view && current.key === key && !current.pending) {
+      try {
+        current.view
+          .change("table", vega.changeset().remove(vega.truthy).insert(chart.values))
+          .run();
+        record(id, "data", start);
+        return "vega-chart";
+      } catch (error) {
+        // fall back to embedding the chart again
+      }
+    }
+    var state = { key: key, view: null, pending: true };
+    views[id] = state;
+    vegaEmbed("#" + id, buildSpec(templates[chart.kind], chart), {})
+      .then(function (result) {
+        if (views[id] !== state) {
+          // a newer update replaced this chart while it was being embedded
+          result.view.finalize();
+          return;
+        }
+        if (current.view) {
+          current.view.finalize();
+        }
+        state.view = result.view;
+        state.pending = false;
+        record(id, "spec", start);
+      })
+      .catch(console.error);
+    return "vega-chart";
+  }
+
+  return { render: render, buildSpec: buildSpec };
+})();
@@ -0,0 +1,318 @@
+"""Background execution of the heavy dashboard callbacks
+
+With BACKGROUND_CALLBACKS=1, a callback registered with `background_callback()`
+does not compute its outputs on the web request. The request queues a job on a
+pool of BACKGROUND_WORKERS processes forked from the web worker and answers at
+once with placeholder outputs showing the job status, then a `dcc.Interval`
+polls the job until its outputs are ready. The web workers are only busy for
+the time of a few SQLite queries.
+
+The jobs and their outputs are kept in the SQLite database JOB_DB, so every
+gunicorn worker sees the jobs queued by the others and identical requests,
+from any page, share one job. A job whose inputs were changed on every page
+waiting for it is cancelled: it is dropped if it has not started, and its
+outputs are discarded otherwise. Jobs left queued or running by a worker that
+died are queued again after `JOB_TIMEOUT` seconds.
+
+Without BACKGROUND_CALLBACKS, the callbacks are registered with dash unchanged.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import dash
+import dash_core_components as dcc
+from dash.dependencies import Input, Output, State
+
+BACKGROUND_CALLBACKS = os.environ.get("BACKGROUND_CALLBACKS", "0") == "1"
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", "1"))
+JOB_DB = os.environ.get("JOB_DB", "data/jobs.sqlite")
+# milliseconds between two polls of a pending job by the browser
+POLL_MS = 500
+# seconds after which a queued or running job is considered lost
+JOB_TIMEOUT = 300
+# seconds after which finished jobs are deleted
+JOB_TTL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    callback TEXT NOT NULL,
+    args TEXT NOT NULL,
+    status TEXT NOT NULL,
+    watchers INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated REAL NOT NULL
+)
+"""
+
+_callbacks = {}  # callback name -> function run by the jobs
+_components = []  # the polling interval and job store of every callback
+_pool = {"pid": None, "executor": None, "futures": {}}
+
+
+def _connect():
+    """returns a connection to the job database, created if needed"""
+    os.makedirs(os.path.dirname(JOB_DB) or ".", exist_ok=True)
+    db = sqlite3.connect(JOB_DB, timeout=30, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(SCHEMA)
+    return db
+
+
+def _executor():
+    """returns the process pool of the current process, started on first use
+    so that each gunicorn worker forks its own after being forked itself
+    """
+    if _pool["pid"] != os.getpid():
+        # the workers are forked, so they have the callbacks and loaded data
+        context = multiprocessing.get_context("fork")
+        _pool.update(
+            pid=os.getpid(),
+            executor=ProcessPoolExecutor(BACKGROUND_WORKERS, mp_context=context),
+            futures={},
+        )
+    return _pool["executor"]
+
+
+def job_key(name, args, version):
+    """returns the key of the job of the callback `name` with the inputs `args`
+    on the data `version`
+    """
+    text = json.dumps([name, list(args), version])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def run_job(key):
+    """runs the job `key` in a pool process, unless it was cancelled, and
+    stores its outputs as json
+    """
+    from plotly.utils import PlotlyJSONEncoder  # slow to import, see `startup.py`
+
+    db = _connect()
+    try:
+        row = db.execute(
+            "SELECT callback, args FROM jobs WHERE key = ?", (key,)
+        ).fetchone()
+        started = db.execute(
+            "UPDATE jobs SET status = 'running', updated = ? "
+            "WHERE key = ? AND status = 'queued'",
+            (time.time(), key),
+        ).rowcount
+        if row is None or not started:
+            return
+        name, args = row
+        try:
+            result = json.dumps(
+                _callbacks[name](*json.loads(args)), cls=PlotlyJSONEncoder
+            )
+        except Exception as error:
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated = ? "
+                "WHERE key = ? AND status = 'running'",
+                (repr(error), time.time(), key),
+            )
+            return
+        # a job cancelled while running keeps its status and drops its outputs
+        db.execute(
+            "UPDATE jobs SET status = 'done', result = ?, updated = ? "
+            "WHERE key = ? AND status = 'running'",
+            (result, time.time(), key),
+        )
+    finally:
+        db.close()
+
+
+def submit(key, name, args):
+    """counts the caller as waiting for the job `key` running the callback
+    `name` with the inputs `args`, queueing it unless it is already queued,
+    running or done
+    """
+    now = time.time()
+    db = _connect()
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        # before looking the job up, so that an old finished job is queued again
+        # rather than deleted once watched
+        db.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') "
+            "AND updated < ?",
+            (now - JOB_TTL,),
+        )
+        row = db.execute(
+            "SELECT status, updated FROM jobs WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            db.execute(
+                "INSERT INTO jobs (key, callback, args, status, watchers, updated) "
+                "VALUES (?, ?, ?, 'queued', 1, ?)",
+                (key, name, json.dumps(list(args)), now),
+            )
+            queue = True
+        else:
+            status, updated = row
+            queue = status == "cancelled" or (
+                status in ("queued", "running") and now - updated > JOB_TIMEOUT
+            )
+            if queue:
+                # the pages still waiting for a lost job keep waiting for it
+                db.execute(
+                    "UPDATE jobs SET status = 'queued', "
+                    "watchers = MAX(watchers, 0) + 1, updated = ? WHERE key = ?",
+                    (now, key),
+                )
+            else:
+                db.execute(
+                    "UPDATE jobs SET watchers = watchers + 1 WHERE key = ?", (key,)
+                )
+        db.execute("COMMIT")
+    finally:
+        db.close()
+    if queue:
+        executor = _executor()
+        futures = _pool["futures"]
+        future = executor.submit(run_job, key)
+        futures[key] = future
+        future.add_done_callback(lambda _, key=key: futures.pop(key, None))
+
+
+def release(key):
+    """stops waiting for the job `key`, cancelling it if nobody else waits"""
+    db = _connect()
+    try:
+        db.execute("UPDATE jobs SET watchers = watchers - 1 WHERE key = ?", (key,))
+        cancelled = db.execute(
+            "UPDATE jobs SET status = 'cancelled', updated = ? WHERE key = ? "
+            "AND watchers <= 0 AND status IN ('queued', 'running')",
+            (time.time(), key),
+        ).rowcount
+    finally:
+        db.close()
+    future = _pool["futures"].get(key)
+    if cancelled and future is not None:
+        future.cancel()
+
+
+def job_status(key):
+    """returns the status of the job `key`
+
+    Returns
+    -------
+    tuple:       the status, "queued", "running", "done", "failed",
+                 "cancelled" or "missing" for a job deleted after `JOB_TTL`,
+                 the json outputs or error, and the number of jobs queued
+                 before it
+    """
+    db = _connect()
+    try:
+        row = db.execute(
+            "SELECT status, result, error, updated FROM jobs WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return "missing", None, 0
+        status, result, error, updated = row
+        ahead = 0
+        if status == "queued":
+            ahead = db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running') "
+                "AND updated < ?",
+                (updated,),
+            ).fetchone()[0]
+    finally:
+        db.close()
+    return status, result if status == "done" else error, ahead
+
+
+def _poll(name, args, previous, placeholder, version, n_outputs):
+    """returns the outputs of the callback `name` for `args` if its job is
+    done, or else the placeholder outputs, with the state of the polling
+    """
+    key = job_key(name, args, version())
+    if previous.get("key") != key:
+        # the inputs changed, the job of the previous ones is not waited for
+        if previous.get("waiting"):
+            release(previous["key"])
+        submit(key, name, args)
+    status, result, ahead = job_status(key)
+    if status in ("cancelled", "missing"):
+        # cancelled by the other pages waiting for it, or deleted
+        submit(key, name, args)
+        status, result, ahead = job_status(key)
+    if status == "done":
+        release(key)
+        outputs = json.loads(result)
+        outputs = [outputs] if n_outputs == 1 else outputs
+        return (*outputs, True, {"key": key, "status": status, "waiting": False})
+    if status == "failed":
+        release(key)
+        message = f"Failed: {result}"
+    elif status == "queued":
+        message = f"Queued, {ahead} jobs ahead" if ahead else "Queued"
+    else:
+        message = status.capitalize()
+    state = {"key": key, "status": message, "waiting": status != "failed"}
+    if previous.get("key") == key and previous.get("status") == message:
+        outputs = [dash.no_update] * n_outputs
+    else:
+        outputs = placeholder(message)
+    return (*outputs, status == "failed", state)
+
+
+def background_callback(app, outputs, inputs, placeholder, version):
+    """registers the decorated function as the dash callback of `outputs` and
+    `inputs`, computed in the background with BACKGROUND_CALLBACKS
+
+    Parameters
+    ----------
+    app :         the dash app
+    outputs :     list of the `Output` of the callback
+    inputs :      list of the `Input` of the callback
+    placeholder : function of a status message, ex) "Running", returning the
+                  list of outputs shown while the job is pending
+    version :     function returning the version of the data, so that jobs
+                  of older data are not reused
+
+    Returns
+    -------
+    decorator returning the decorated function, or its dash callback without
+    BACKGROUND_CALLBACKS
+    """
+
+    def decorator(func):
+        if not BACKGROUND_CALLBACKS:
+            return app.callback(*outputs, *inputs)(func)
+        name = func.__name__
+        _callbacks[name] = func
+        poll, job = f"{name}-poll", f"{name}-job"
+        _components.extend(
+            [dcc.Interval(id=poll, interval=POLL_MS, disabled=True), dcc.Store(id=job)]
+        )
+
+        @app.callback(
+            *outputs,
+            Output(poll, "disabled"),
+            Output(job, "data"),
+            *inputs,
+            Input(poll, "n_intervals"),
+            State(job, "data"),
+        )
+        def poll_job(*values):
+            *args, _, previous = values
+            return _poll(name, args, previous or {}, placeholder, version, len(outputs))
+
+        return func
+
+    return decorator
+
+
+def background_components():
+    """returns the components the background callbacks poll their jobs with,
+    to add to the layout
+    """
+    return list(_components)
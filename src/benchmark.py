@@ -0,0 +1,383 @@
+"""Times the data wrangling functions and the chart callbacks of the dashboard,
+on the cleaned data in `data/processed` or on synthetic data of given sizes,
+and saves the results as json so runs can be compared across commits
+
+Every callback is timed without its output cache and with the cubes of the
+selected properties cleared, so the times are those of a first request. The
+charts are also timed with Altair building each chart from scratch, the way the
+callbacks used to render them, for comparison with the templates of `charts.py`,
+and, with node, drawn the way the browser draws them, see `client_render.js`.
+
+Usage: python benchmark.py [--rows ROWS [ROWS ...]] [--work WORK]
+                           [--repeat REPEAT] [--cases CASES] [--out OUT]
+                           [--compare COMPARE] [--properties PROPERTIES]
+
+ex) python src/benchmark.py --rows 100k 1M 10M
+    python src/benchmark.py --rows 1M --properties 5000
+    python src/benchmark.py --compare results/benchmarks/old.json
+"""
+
+import argparse
+import datetime
+import inspect
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+RESULTS = os.path.join(SRC, os.pardir, "results", "benchmarks")
+
+
+def summarise(times):
+    """returns the statistics of a list of times in seconds, in milliseconds"""
+    ms = np.array(times) * 1000
+    return {
+        "n": len(ms),
+        "median_ms": float(np.median(ms)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "mean_ms": float(ms.mean()),
+        "min_ms": float(ms.min()),
+        "max_ms": float(ms.max()),
+    }
+
+
+def time_calls(func, cases, repeat, setup=None):
+    """times `func(*args)` `repeat` times for each of `cases`, calling `setup`
+    before every call
+
+    Returns
+    -------
+    dictionary:  statistics produced by `summarise()`
+    """
+    times = []
+    for args in cases:
+        for _ in range(repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - start)
+    return summarise(times)
+
+
+def prepare(rows, work, seed=0, properties=0):
+    """generates and cleans `rows` synthetic bookings of `properties`
+    properties, see `synthetic_hotels.py`, under `work`, unless it was done
+    before, and returns the directory to run the dashboard from
+    """
+    from hotel_cleaner import main as clean
+    from synthetic_hotels import parse_rows, write_hotels
+
+    n = parse_rows(rows)
+    root = os.path.join(work, f"{n}-{seed}" + (f"-{properties}" if properties else ""))
+    raw = os.path.join(root, "data", "raw", "hotels.csv")
+    if not os.path.exists(raw):
+        print(f"Generating {n} bookings in {raw}")
+        write_hotels(n, raw, seed, properties)
+    # only cleans again if the raw data changed, see `hotel_cleaner.py`
+    clean(
+        [raw],
+        os.path.join(root, "data", "processed"),
+        csv=False,
+        properties=os.path.join(root, "data", "raw", "properties.csv"),
+    )
+    return root
+
+
+def run(root, repeat, n_cases):
+    """times everything on the cleaned data of the dashboard run from `root`
+
+    Returns
+    -------
+    dictionary:  benchmark name -> statistics produced by `summarise()`
+    """
+    os.chdir(root)
+    import altair as alt  # noqa: F401, imported before timing anything
+
+    import app
+    import charts
+    import data_wrangling as dw
+
+    dw.invalidate_cache()
+    dw._selections.clear()
+    results = {"load": time_calls(dw.load_hotels, [()], repeat, dw.invalidate_cache)}
+    rows = len(dw.load_hotels())
+
+    rng = random.Random(0)
+    years = dw.available_years()
+    hotels = ["All", "City", "Resort"]
+    periods = [
+        (year, option["value"])
+        for year in years
+        for option in inspect.unwrap(app.update_date_dropdown)(year)
+    ]
+
+    def sample(cases):
+        return rng.sample(cases, min(n_cases, len(cases)))
+
+    year_cases = sample([(h, c, y) for h in hotels for c in app.columns for y in years])
+    month_cases = sample(
+        [(h, c, y, m) for h in hotels for c in app.columns for y, m in periods]
+    )
+    hist_cases = sample([(h, y, m) for h in hotels for y, m in periods])
+    # quarters, and windows of a week to the whole data
+    windows = [(f"{y}-{m:02d}-01", f"{y}-{m + 2:02d}-28") for y, m in periods if m < 11]
+    whole = (f"{years[0]}-01-01", f"{years[-1]}-12-31")
+    windows += [whole]
+    windows += [(f"{y}-{m:02d}-01", f"{y}-{m:02d}-07") for y, m in periods]
+    range_cases = sample(
+        [(h, c, *w) for h in hotels for c in app.columns for w in windows]
+    )
+
+    results["get_year_data"] = time_calls(dw.get_year_data, year_cases, repeat)
+    results["get_month_data"] = time_calls(dw.get_month_data, month_cases, repeat)
+    results["get_range_data"] = time_calls(dw.get_range_data, range_cases, repeat)
+    results["get_range_stats"] = time_calls(dw.get_range_stats, range_cases, repeat)
+    # the whole data downsampled to the days `range-plot` draws
+    results["get_range_data[downsampled]"] = time_calls(
+        dw.get_range_data,
+        [(h, c, *whole, None, app.RANGE_POINTS) for h in hotels for c in app.columns],
+        repeat,
+    )
+    year_frames = [(dw.get_year_data(*args), args) for args in year_cases]
+    month_frames = [(dw.get_month_data(*args), args) for args in month_cases]
+    for scope in ["current", "all_time"]:
+        results[f"get_year_stats[{scope}]"] = time_calls(
+            dw.get_year_stats,
+            [(df, scope, c, y) for df, (h, c, y) in year_frames],
+            repeat,
+        )
+        results[f"get_month_stats[{scope}]"] = time_calls(
+            dw.get_month_stats,
+            [(df, scope, c, y, m) for df, (h, c, y, m) in month_frames],
+            repeat,
+        )
+    clear_selections = dw._selections.clear
+    for func in [dw.left_hist_data, dw.right_hist_data]:
+        results[func.__name__] = time_calls(func, hist_cases, repeat)
+
+    spans = [(None, None), ((years[0], 1), (years[-1], 6))]
+    results["top_countries"] = time_calls(
+        dw.top_countries, [(h, *span) for h in hotels for span in spans], repeat
+    )
+
+    results["get_stay_quantiles"] = time_calls(
+        dw.get_stay_quantiles, [(h, *span) for h in hotels for span in spans], repeat
+    )
+
+    # one, a tenth and all of the properties, added up from the per-property
+    # tables of the cube for every call
+    properties = list(dw.load_properties()["Property"])
+    subsets = [properties[:1], properties[::10], properties]
+    for label, subset in zip(["one", "tenth", "all"], subsets):
+        results[f"get_year_data[properties:{label}]"] = time_calls(
+            dw.get_year_data,
+            [(h, c, y, subset) for h, c, y in year_cases],
+            repeat,
+            clear_selections,
+        )
+
+    # full renders, bypassing dash and the output cache of the callbacks
+    callbacks = [
+        (app.plot_year, year_cases),
+        (app.plot_month, month_cases),
+        (app.plot_range, range_cases),
+        (app.histogram_1, hist_cases),
+        (app.histogram_2, hist_cases),
+    ]
+    for callback, cases in callbacks:
+        name = f"callback:{callback.__name__}[{app.CHART_MODE}]"
+        results[name] = time_calls(
+            inspect.unwrap(callback), cases, repeat, clear_selections
+        )
+
+    # chart rendering alone, Altair against the templates
+    charts_data = {
+        "year": (charts.year_chart, year_frames[0][0], year_frames[0][1][1]),
+        "month": (charts.month_chart, month_frames[0][0], month_frames[0][1][1]),
+        "countries": (charts.countries_chart, dw.left_hist_data(*hist_cases[0]), None),
+        "stay": (charts.stay_chart, dw.right_hist_data(*hist_cases[0]), None),
+    }
+    for kind, (builder, df, y_col) in charts_data.items():
+        args = (df, y_col, "Title") if y_col else (df, "Title")
+        results[f"chart:{kind}[altair]"] = time_calls(
+            lambda: builder(*args).to_html(), [()], repeat
+        )
+        results[f"chart:{kind}[template]"] = time_calls(
+            charts.render, [(kind, df, "Title", y_col)], repeat
+        )
+        results[f"chart:{kind}[payload]"] = time_calls(
+            charts.payload, [(kind, df, "Title", y_col)], repeat
+        )
+
+    # the browser side, from the payloads of two cases of every chart type
+    frames = {
+        "year": [year_frames[i][0] for i in (0, -1)],
+        "month": [month_frames[i][0] for i in (0, -1)],
+        "range": [dw.get_range_data(*range_cases[i]) for i in (0, -1)],
+        "countries": [dw.left_hist_data(*hist_cases[i]) for i in (0, -1)],
+        "stay": [dw.right_hist_data(*hist_cases[i]) for i in (0, -1)],
+    }
+    y_cols = {"year": year_cases[0][1], "month": month_cases[0][1]}
+    y_cols["range"] = range_cases[0][1]
+    charts_payloads = {
+        kind: [charts.payload(kind, df, "Title", y_cols.get(kind)) for df in dfs]
+        for kind, dfs in frames.items()
+    }
+    results.update(client_render(charts.template_specs(), charts_payloads, repeat))
+    return {"rows": rows, "results": results}
+
+
+def client_render(templates, payloads, repeat):
+    """times drawing the charts in a browser, headless with `client_render.js`,
+    see there for what is timed
+
+    Parameters
+    ----------
+    templates :  chart type -> Vega-Lite template, see `charts.template_specs()`
+    payloads :   chart type -> two payloads of `charts.payload()`, the first
+                 drawn from its template and the second replacing its data
+    repeat :     draws per chart type
+
+    Returns
+    -------
+    dictionary:  benchmark name -> statistics produced by `summarise()`, empty
+                 without node
+    """
+    if shutil.which("node") is None:
+        print("node not found, the client render times are skipped")
+        return {}
+    for kind, (first, second) in payloads.items():
+        # the mounted view keeps the y_col of the template
+        second["y_col"] = first["y_col"]
+    output = subprocess.run(
+        ["node", os.path.join(SRC, "client_render.js")],
+        input=json.dumps(
+            {"templates": templates, "charts": payloads, "repeat": repeat}
+        ),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    timings = json.loads(output)
+    results = {"client:runtime_load": summarise([ms / 1000 for ms in timings["load"]])}
+    for kind, times in timings["charts"].items():
+        for mode, ms in times.items():
+            results[f"client:{kind}[{mode}]"] = summarise([t / 1000 for t in ms])
+    return results
+
+
+def _git(*args):
+    """returns the output of a git command run in the repository, or None"""
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=SRC, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """returns the commit and versions the benchmarks ran with"""
+    import altair
+    import dash
+    import pandas
+
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "packages": {
+            "pandas": pandas.__version__,
+            "numpy": np.__version__,
+            "altair": altair.__version__,
+            "dash": dash.__version__,
+        },
+        "chart_mode": os.environ.get("CHART_MODE", "iframe"),
+    }
+
+
+def compare(old, new):
+    """prints the median times of two benchmark results side by side"""
+    print(
+        f"{'dataset':>10} {'benchmark':<40} {'old ms':>10} {'new ms':>10} {'ratio':>7}"
+    )
+    for dataset, result in new["datasets"].items():
+        before = old["datasets"].get(dataset, {}).get("results", {})
+        for name, stats in result["results"].items():
+            if name in before:
+                a, b = before[name]["median_ms"], stats["median_ms"]
+                ratio = b / a if a else float("nan")
+                print(f"{dataset:>10} {name:<40} {a:10.3f} {b:10.3f} {ratio:7.2f}")
+
+
+def main(rows, work, repeat, n_cases, out, properties=0):
+    sys.path.insert(0, SRC)
+    report = environment()
+    report["repeat"] = repeat
+    report["cases"] = n_cases
+    report["datasets"] = {}
+    cwd = os.getcwd()
+    roots = {"current": cwd}
+    if rows:
+        roots = {n: prepare(n, work, properties=properties) for n in rows}
+    for label, root in roots.items():
+        print(f"Benchmarking {label}")
+        report["datasets"][label] = run(os.path.abspath(root), repeat, n_cases)
+        os.chdir(cwd)
+    if out is None:
+        stamp = report["timestamp"].replace(":", "").replace("-", "")
+        name = f"{stamp}-{(report['commit'] or 'unknown')[:7]}.json"
+        out = os.path.join(RESULTS, name)
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"Saved {out}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the dashboard")
+    parser.add_argument(
+        "--rows",
+        nargs="*",
+        help="synthetic data sizes, ex) 100k 1M 10M, "
+        "instead of the data in data/processed",
+    )
+    parser.add_argument(
+        "--work", default="data/benchmark", help="directory of the synthetic data"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="calls per case")
+    parser.add_argument(
+        "--cases", type=int, default=20, help="argument combinations per function"
+    )
+    parser.add_argument("--out", help="json file, by default in results/benchmarks")
+    parser.add_argument("--compare", help="earlier json file to compare with")
+    parser.add_argument(
+        "--properties",
+        type=int,
+        default=0,
+        help="properties of the synthetic data, ex) 5000",
+    )
+    args = parser.parse_args()
+    report = main(
+        args.rows,
+        os.path.abspath(args.work),
+        args.repeat,
+        args.cases,
+        args.out,
+        args.properties,
+    )
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
@@ -0,0 +1,142 @@
+"""Bounded least-recently-used memoization of the dashboard callback outputs"""
+
+import functools
+import sys
+import threading
+from collections import OrderedDict
+
+
+def _size_of(value):
+    """returns the approximate number of bytes held by a callback output"""
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_size_of(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            _size_of(k) + _size_of(v) for k, v in value.items()
+        )
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """thread-safe mapping that evicts the least recently used entries once it
+    holds more than `max_entries` entries or more than `max_bytes` bytes
+
+    Parameters
+    ----------
+    max_entries : maximum number of cached outputs
+    max_bytes :   maximum total size of the cached outputs
+    """
+
+    def __init__(self, max_entries=2048, max_bytes=64 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """returns the value cached for `key` and marks it as recently used"""
+        with self._lock:
+            try:
+                value, _ = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """caches `value` for `key`, evicting old entries to stay within the bounds"""
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        """drops every cached entry, keeping the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """returns the hit, miss and eviction counters and the current usage
+
+        Returns
+        -------
+        dictionary:  ex) {"hits": 90, "misses": 10, "evictions": 0,
+                     "hit_rate": 0.9, "entries": 10, "bytes": 254000}
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_MISSING = object()
+
+
+def memoize(cache, version=None):
+    """decorates a pure callback so that its outputs are kept in `cache`
+
+    Parameters
+    ----------
+    cache :      `LRUCache` shared by the decorated callbacks
+    version :    optional function returning the version of the underlying
+                 data, made part of the key so new data is never served stale
+
+    Returns
+    -------
+    decorator for functions taking hashable arguments or lists of them, ex)
+    the values of a multi-select dropdown, which adds a
+    `prime(value, *args, **kwargs)` method to fill the cache
+    """
+
+    def decorator(func):
+        def key_of(args, kwargs):
+            args = tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args)
+            key = (func.__name__, version() if version else None, args)
+            if kwargs:
+                key += (tuple(sorted(kwargs.items())),)
+            return key
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = key_of(args, kwargs)
+            value = cache.get(key, _MISSING)
+            if value is _MISSING:
+                value = func(*args, **kwargs)
+                cache.put(key, value)
+            return value
+
+        def prime(value, *args, **kwargs):
+            """caches `value` as the output of the call with `args` and `kwargs`,
+            ex) computed in another process
+            """
+            cache.put(key_of(args, kwargs), value)
+
+        wrapper.cache = cache
+        wrapper.prime = prime
+        return wrapper
+
+    return decorator
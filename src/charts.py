@@ -0,0 +1,363 @@
+"""Altair charts of the dashboard and the Vega-Lite templates used to render them
+
+Each chart type is built once with Altair from placeholder data, and the
+resulting Vega-Lite spec and HTML are kept as templates. A request then only
+substitutes its data values, plotted variable and title into the template,
+skipping the per-request Altair construction, validation and serialization.
+The substitution happens here for the iframe charts, and in the browser for
+the "vega" chart mode of `app.py`.
+"""
+
+import json
+import re
+
+import altair as alt
+import pandas as pd
+from altair.utils import sanitize_dataframe
+
+from metrics import stage
+
+months_short = [
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+]
+
+click = alt.selection_multi(fields=["Line"], bind="legend")
+
+
+def year_chart(df, y_col, title):
+    """returns the Altair line chart of `y_col` per month for `year-plot`
+
+    Parameters
+    ----------
+    df :         dataframe produced by `get_year_data()` with month names
+    y_col:       the variable selected from "y-axis-dropdown"
+    title:       chart title
+
+    Returns
+    -------
+    altair chart
+    """
+    lines = (
+        alt.Chart(df, title=title)
+        .mark_line()
+        .encode(
+            alt.X(
+                "Arrival month",
+                sort=months_short,
+                title="Month",
+                axis=alt.Axis(grid=False, labelAngle=-30),
+            ),
+            alt.Y(y_col, title=y_col, scale=alt.Scale(zero=True)),
+            alt.Color("Line"),
+            alt.Tooltip(y_col),
+            opacity=alt.condition(click, alt.value(0.9), alt.value(0.2)),
+        )
+    )
+    return (
+        (lines + lines.mark_circle())
+        .properties(width=295, height=250)
+        .configure_axis(labelFontSize=13, titleFontSize=17, grid=False)
+        .configure_title(fontSize=23)
+        .configure_legend(
+            strokeColor="gray",
+            fillColor="#e9ecef",
+            padding=10,
+            cornerRadius=10,
+            orient="bottom-right",
+        )
+        .interactive()
+        .add_selection(click)
+    )
+
+
+def month_chart(df, y_col, title):
+    """returns the Altair line chart of `y_col` per day for `month-plot`
+
+    Parameters
+    ----------
+    df :         dataframe produced by `get_month_data()`
+    y_col:       the variable selected from "y-axis-dropdown"
+    title:       chart title
+
+    Returns
+    -------
+    altair chart
+    """
+    lines = (
+        alt.Chart(df, title=title)
+        .mark_line()
+        .encode(
+            alt.X("Arrival day", title="Date", axis=alt.Axis(grid=False)),
+            alt.Y(y_col, title=y_col, scale=alt.Scale(zero=True)),
+            alt.Color("Line"),
+            alt.Tooltip([y_col, "Arrival day of week"]),
+            opacity=alt.condition(click, alt.value(0.9), alt.value(0.2)),
+        )
+    )
+    return (
+        (lines + lines.mark_circle())
+        .properties(width=300, height=250)
+        .configure_axis(labelFontSize=13, titleFontSize=17, grid=False)
+        .configure_title(fontSize=23)
+        .configure_legend(
+            strokeColor="gray",
+            fillColor="#e9ecef",
+            padding=10,
+            cornerRadius=10,
+            orient="bottom-right",
+        )
+        .interactive()
+        .add_selection(click)
+    )
+
+
+def range_chart(df, y_col, title):
+    """returns the Altair line chart of `y_col` per date for `range-plot`
+
+    Parameters
+    ----------
+    df :         dataframe produced by `get_range_data()`
+    y_col:       the variable selected from "y-axis-dropdown"
+    title:       chart title
+
+    Returns
+    -------
+    altair chart
+    """
+    lines = (
+        alt.Chart(df, title=title)
+        .mark_line()
+        .encode(
+            alt.X("Arrival date", title="Date", axis=alt.Axis(grid=False)),
+            alt.Y(y_col, title=y_col, scale=alt.Scale(zero=True)),
+            alt.Tooltip(["Arrival date", y_col, "Arrival day of week"]),
+        )
+    )
+    return (
+        lines.properties(width=680, height=250)
+        .configure_axis(labelFontSize=13, titleFontSize=17, grid=False)
+        .configure_title(fontSize=23)
+        .interactive()
+    )
+
+
+def countries_chart(df, title):
+    """returns the Altair bar chart of the top countries of origin for `hist1`
+
+    Parameters
+    ----------
+    df :         dataframe produced by `left_hist_data()`
+    title:       chart title
+
+    Returns
+    -------
+    altair chart
+    """
+    return (
+        alt.Chart(df, title=title)
+        .mark_bar(color="orange", size=15)
+        .encode(
+            alt.Y("Country of origin", sort="-x", title="Country"),
+            alt.X("counts", title="Reservations"),
+            alt.Tooltip("Country of origin"),
+        )
+        .properties(width=300, height=200)
+        .configure_axis(labelFontSize=10, titleFontSize=15, grid=False)
+        .configure_title(fontSize=19)
+    )
+
+
+def stay_chart(df, title):
+    """returns the Altair bar chart of the lengths of stay for `hist2`
+
+    Parameters
+    ----------
+    df :         dataframe produced by `right_hist_data()`
+    title:       chart title
+
+    Returns
+    -------
+    altair chart
+    """
+    return (
+        alt.Chart(df, title=title)
+        .mark_bar(clip=True, color="orange", size=25)
+        .encode(
+            alt.X(
+                "Total nights",
+                title="Length of stay",
+                scale=alt.Scale(domain=(1, 7)),
+            ),
+            alt.Y("Percent of Reservations", title="Percent of Reservations"),
+            alt.Tooltip("Percent of Reservations"),
+        )
+        .properties(width=300, height=200)
+        .configure_axis(labelFontSize=10, titleFontSize=15, grid=False)
+        .configure_title(fontSize=19)
+    )
+
+
+# Placeholders substituted per request. The sample frames only need the column
+# types of the real data, as Altair infers the encoding types from them.
+Y_COL = "@@Y_COL@@"
+TITLE = "@@TITLE@@"
+VALUES = "@@VALUES@@"
+DATASET = "table"
+
+_builders = {
+    "year": lambda: year_chart(
+        pd.DataFrame({"Arrival month": ["Jan"], "Line": ["Average"], Y_COL: [0.0]}),
+        Y_COL,
+        TITLE,
+    ),
+    "month": lambda: month_chart(
+        pd.DataFrame(
+            {
+                "Arrival day": [1],
+                "Line": ["Average"],
+                Y_COL: [0.0],
+                "Arrival day of week": ["Mon"],
+            }
+        ),
+        Y_COL,
+        TITLE,
+    ),
+    "range": lambda: range_chart(
+        pd.DataFrame(
+            {
+                "Arrival date": [pd.Timestamp("2016-01-01")],
+                Y_COL: [0.0],
+                "Arrival day of week": ["Fri"],
+            }
+        ),
+        Y_COL,
+        TITLE,
+    ),
+    "countries": lambda: countries_chart(
+        pd.DataFrame({"Country of origin": ["PRT"], "counts": [0]}), TITLE
+    ),
+    "stay": lambda: stay_chart(
+        pd.DataFrame({"Total nights": [1], "Percent of Reservations": [0.0]}), TITLE
+    ),
+}
+_placeholder = re.compile(
+    '"(' + "|".join(map(re.escape, [Y_COL, TITLE, VALUES])) + ')"'
+)
+_templates = {}
+
+
+def _rename_data(spec):
+    """points every named data reference of `spec` at the template dataset"""
+    if isinstance(spec, dict):
+        if set(spec) == {"name"}:
+            spec["name"] = DATASET
+        for value in spec.values():
+            _rename_data(value)
+    elif isinstance(spec, list):
+        for value in spec:
+            _rename_data(value)
+
+
+def compile_template(kind):
+    """builds the template of the chart type `kind` from its Altair definition
+
+    Returns
+    -------
+    dictionary:  "spec", the Vega-Lite json text with placeholders, and
+                 "html", alternating literal HTML and placeholder strings
+    """
+    spec = _builders[kind]().to_dict()
+    _rename_data(spec)
+    spec["datasets"] = {DATASET: VALUES}
+    html = alt.utils.spec_to_html(
+        spec,
+        mode="vega-lite",
+        vegalite_version=alt.VEGALITE_VERSION,
+        vegaembed_version=alt.VEGAEMBED_VERSION,
+        vega_version=alt.VEGA_VERSION,
+    )
+    return {"spec": json.dumps(spec), "html": _placeholder.split(html)}
+
+
+def precompile_templates():
+    """builds the templates of every chart type, done once at startup"""
+    for kind in _builders:
+        if kind not in _templates:
+            _templates[kind] = compile_template(kind)
+
+
+def template_specs():
+    """returns the Vega-Lite json text with placeholders of every chart type,
+    sent once to the browser by the "vega" chart mode
+    """
+    precompile_templates()
+    return {kind: template["spec"] for kind, template in _templates.items()}
+
+
+def values(df):
+    """returns the records of `df` the way Altair embeds them in a chart"""
+    return sanitize_dataframe(df).to_dict(orient="records")
+
+
+def render(kind, df, title, y_col=None):
+    """returns the HTML of the chart type `kind` showing `df`
+
+    Parameters
+    ----------
+    kind :       "year", "month", "range", "countries" or "stay"
+    df :         the data of the chart
+    title:       chart title
+    y_col:       the plotted variable of the "year" and "month" charts
+
+    Returns
+    -------
+    string:      html document for an `html.Iframe` srcDoc
+    """
+    if kind not in _templates:
+        _templates[kind] = compile_template(kind)
+    with stage("chart_build"):
+        records = values(df)
+    with stage("serialize"):
+        substitutes = {
+            Y_COL: json.dumps(y_col),
+            TITLE: json.dumps(title),
+            VALUES: json.dumps(records),
+        }
+        parts = _templates[kind]["html"]
+        # the placeholders are at the odd positions of the split template
+        return "".join(
+            substitutes[part] if i % 2 else part for i, part in enumerate(parts)
+        )
+
+
+def payload(kind, df, title, y_col=None):
+    """returns what the browser needs to draw the chart type `kind` from its
+    template, see `assets/vega_charts.js`
+
+    Parameters
+    ----------
+    kind :       "year", "month", "range", "countries" or "stay"
+    df :         the data of the chart
+    title:       chart title
+    y_col:       the plotted variable of the "year" and "month" charts
+
+    Returns
+    -------
+    dictionary:  ex) {"kind": "stay", "title": "Lengths of Stay Jan 2016",
+                 "y_col": None, "values": [{"Total nights": 1, ...}, ...]}
+    """
+    with stage("chart_build"):
+        records = values(df)
+    # serialized to json by dash, counted in "dashboard_request_seconds"
+    return {"kind": kind, "title": title, "y_col": y_col, "values": records}
@@ -0,0 +1,94 @@
+// Times the browser side of drawing the charts, headless in node, for
+// src/benchmark.py.
+//
+// Reads {"templates": {kind: Vega-Lite json text}, "charts": {kind: [chart,
+// chart]}, "repeat": n} on stdin, where each chart is a payload of
+// charts.payload(), and prints the milliseconds of:
+// - "load": evaluating the bundled vega, vega-lite and vega-embed runtime,
+//   which the iframe mode does for every update and the vega mode once
+// - "spec": building the spec from its template the way
+//   assets/vega_charts.js does, compiling it, and running a new view to SVG,
+//   which both modes do when a chart is drawn from scratch
+// - "data": replacing the data of a mounted view and running it to SVG, which
+//   the vega mode does when only the data of a chart changed
+// The views have no renderer, so the time to paint the SVG is not counted.
+var fs = require("fs");
+var path = require("path");
+var vm = require("vm");
+
+var VEGA = path.join(__dirname, "assets", "vega");
+
+function loadRuntime() {
+  global.window = global;
+  global.self = global;
+  // the interactions of the charts listen to the window, which never fires
+  global.addEventListener = global.removeEventListener = function () {};
+  var start = performance.now();
+  fs.readdirSync(VEGA)
+    .filter(function (name) {
+      return name.endsWith(".js");
+    })
+    .sort()
+    .forEach(function (name) {
+      vm.runInThisContext(fs.readFileSync(path.join(VEGA, name), "utf8"), {
+        filename: name,
+      });
+    });
+  var ms = performance.now() - start;
+  vm.runInThisContext(
+    fs.readFileSync(path.join(__dirname, "assets", "vega_charts.js"), "utf8")
+  );
+  return ms;
+}
+
+async function draw(template, chart) {
+  var spec = window.vegaCharts.buildSpec(template, chart);
+  var runtime = vega.parse(vegaLite.compile(spec).spec);
+  var view = new vega.View(runtime, { renderer: "none" });
+  await view.runAsync();
+  await view.toSVG();
+  return view;
+}
+
+async function update(view, chart) {
+  view.change("table", vega.changeset().remove(vega.truthy).insert(chart.values));
+  await view.runAsync();
+  await view.toSVG();
+}
+
+async function main(input) {
+  var timings = { load: [loadRuntime()], charts: {} };
+  for (var kind of Object.keys(input.charts)) {
+    var charts = input.charts[kind];
+    var template = input.templates[kind];
+    var times = { spec: [], data: [] };
+    // one untimed draw, so that the first timed one is not the warm-up
+    (await draw(template, charts[0])).finalize();
+    for (var i = 0; i < input.repeat; i++) {
+      var start = performance.now();
+      var view = await draw(template, charts[0]);
+      times.spec.push(performance.now() - start);
+      start = performance.now();
+      await update(view, charts[1]);
+      times.data.push(performance.now() - start);
+      view.finalize();
+    }
+    timings.charts[kind] = times;
+  }
+  return timings;
+}
+
+var text = "";
+process.stdin.on("data", function (chunk) {
+  text += chunk;
+});
+process.stdin.on("end", function () {
+  main(JSON.parse(text))
+    .then(function (timings) {
+      process.stdout.write(JSON.stringify(timings));
+    })
+    .catch(function (error) {
+      process.stderr.write(String(error && error.stack) + "\n");
+      process.exit(1);
+    });
+});
@@ -0,0 +1,161 @@
+"""Cold-start budget of the dashboard: the time from a new process to the
+imported app, to the first layout served and to the first chart served, with
+the import time of each module
+
+Every run starts a new Python process in the current directory, which imports
+`app.py` and requests the layout and then the chart of `plot_year` for the
+default controls through the Flask test client, the way the first visitor of a
+restarted dyno would. The per-module import times come from one more run with
+`python -X importtime` and without the warm-up thread of `startup.py`.
+
+Usage: python cold_start.py [--runs RUNS] [--modules MODULES] [--out OUT]
+
+ex) python src/cold_start.py --runs 5
+
+Exits with status 1 if a median time is over its budget in `BUDGET`, or if
+importing the app imports one of `LAZY_MODULES`, so that slower startups are
+caught.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+# seconds from the start of the process, on the cleaned data of `data/processed`
+BUDGET = {"import": 1.0, "first_layout": 1.25, "first_chart": 3.0}
+# modules only imported when a callback needs them, see `startup.py`
+LAZY_MODULES = ["pandas", "numpy", "altair"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {src!r})
+import app
+times = {{"import": time.perf_counter() - start}}
+client = app.server.test_client()
+client.get("/")
+client.get("/_dash-layout")
+client.get("/_dash-dependencies")
+times["first_layout"] = time.perf_counter() - start
+outputs = [("year-plot", app.CHART_PROP), ("year_stats_card", "children"),
+           ("year_stats_card2", "children")]
+year = app.data_wrangling.available_years()[0]
+inputs = [("hotel-type-selection", "All"), ("y-axis-dropdown", app.columns[0]),
+          ("year-dropdown", year), ("property-selection", [])]
+body = {{
+    "output": ".." + "...".join(f"{{i}}.{{p}}" for i, p in outputs) + "..",
+    "outputs": [{{"id": i, "property": p}} for i, p in outputs],
+    "inputs": [{{"id": i, "property": "value", "value": v}} for i, v in inputs],
+    "changedPropIds": [],
+    "state": [],
+}}
+response = client.post("/_dash-update-component", json=body)
+assert response.status_code == 200, response.status_code
+times["first_chart"] = time.perf_counter() - start
+print(json.dumps(times))
+"""
+
+
+def _environment(**changes):
+    """returns the environment of the probes, without the options that change
+    what the first chart request does
+    """
+    env = dict(os.environ, **changes)
+    for name in ["BACKGROUND_CALLBACKS", "WARM_CACHE", "PROFILE_CALLBACKS"]:
+        env.pop(name, None)
+    return env
+
+
+def probe():
+    """returns the times of one cold start, see `BUDGET`"""
+    code = PROBE.format(src=SRC)
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=_environment(),
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def import_times():
+    """returns the modules imported with the app and the time they took
+
+    Returns
+    -------
+    list:        of {"module", "self_ms", "cumulative_ms", "depth"}, by
+                 decreasing cumulative time
+    """
+    code = f"import sys; sys.path.insert(0, {SRC!r}); import app"
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-W", "ignore", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=_environment(STARTUP_WARM="0"),
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append(
+            {
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            }
+        )
+    modules.sort(key=lambda module: -module["cumulative_ms"])
+    return modules
+
+
+def main(runs, n_modules, out):
+    results = [probe() for _ in range(runs)]
+    medians = {
+        name: statistics.median(result[name] for result in results) for name in BUDGET
+    }
+    modules = import_times()
+    lazy = sorted({module["module"] for module in modules} & set(LAZY_MODULES))
+    report = {
+        "runs": runs,
+        "budget": BUDGET,
+        "median_seconds": medians,
+        "lazy_imported": lazy,
+        "modules": modules[:n_modules],
+    }
+    print(f"{'module':<45} {'self ms':>9} {'cumul. ms':>10}")
+    for module in report["modules"]:
+        name = "  " * module["depth"] + module["module"]
+        print(f"{name:<45} {module['self_ms']:9.1f} {module['cumulative_ms']:10.1f}")
+    print()
+    over = []
+    for name, seconds in medians.items():
+        status = "ok" if seconds <= BUDGET[name] else "OVER BUDGET"
+        print(f"{name:<15} {seconds:7.3f} s  budget {BUDGET[name]:5.2f} s  {status}")
+        if seconds > BUDGET[name]:
+            over.append(name)
+    if lazy:
+        print(f"importing app imported {', '.join(lazy)}, see startup.py")
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"Saved {out}")
+    return 1 if over or lazy else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the cold-start budget")
+    parser.add_argument("--runs", type=int, default=3, help="cold starts to time")
+    parser.add_argument(
+        "--modules", type=int, default=20, help="slowest module imports to list"
+    )
+    parser.add_argument("--out", help="json file to save the report to")
+    args = parser.parse_args()
+    sys.exit(main(args.runs, args.modules, args.out))
@@ -0,0 +1,521 @@
+"""Reads and writes the cleaned hotels data as a binary column store: one
+`.npy` file per column plus a `schema.json` file, so that readers get fixed
+dtypes without re-parsing text
+
+The rows are stored sorted by hotel type, arrival year, month and day, with an
+index of the row offsets of every (hotel type, year, month, day), so that the
+bookings of any hotel type, year, month or day are contiguous rows.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import struct
+
+import numpy as np
+import pandas as pd
+
+BLOCK_ROWS = 1 << 20
+INDEX_FILE = "row_index.npy"
+# the columns the rows are sorted by, and that the row index is over
+SORT_COLUMNS = ["Hotel type", "Arrival year", "Arrival month", "Arrival day"]
+DAYS_OF_WEEK = ["Mon", "Tues", "Wed", "Thur", "Fri", "Sat", "Sun"]
+
+# column name -> storage dtype, categoricals are stored as integer codes
+SCHEMA = {
+    "Hotel type": {
+        "dtype": "category",
+        "codes": "int8",
+        "categories": ["City", "Resort"],
+    },
+    # the property ids, thousands of them in a large portfolio
+    "Property": {"dtype": "category", "codes": "int32", "categories": None},
+    "Cancelled": {"dtype": "int8"},
+    "Arrival year": {"dtype": "int16"},
+    "Arrival month": {"dtype": "int8"},
+    "Arrival week": {"dtype": "int8"},
+    "Arrival day": {"dtype": "int8"},
+    "Weekend nights": {"dtype": "int16"},
+    "Week nights": {"dtype": "int16"},
+    "Adults": {"dtype": "int16"},
+    "Children": {"dtype": "float32"},
+    "Babies": {"dtype": "int8"},
+    "Country of origin": {"dtype": "category", "codes": "int16", "categories": None},
+    "Booking changes": {"dtype": "int8"},
+    "Average daily rate": {"dtype": "float32"},
+    "Required parking spaces": {"dtype": "int8"},
+    "Special requests": {"dtype": "int8"},
+    "Arrival date": {"dtype": "datetime64[ns]"},
+    "Arrival day of week": {
+        "dtype": "category",
+        "codes": "int8",
+        "categories": DAYS_OF_WEEK,
+    },
+    "Total nights": {"dtype": "int16"},
+}
+
+
+def column_file(column):
+    """returns the file name used to store `column`, ex) "Hotel type" -> "hotel_type.npy" """
+    return column.lower().replace(" ", "_") + ".npy"
+
+
+def version_file(path):
+    """returns the file whose changes mark a new version of the data at `path`,
+    `schema.json` for a column store directory and the file itself for a csv
+    """
+    if os.path.isdir(path):
+        return os.path.join(path, "schema.json")
+    return path
+
+
+def data_digest(path):
+    """returns the sha1 hex digest identifying the version of the data at `path`"""
+    digest = hashlib.sha1()
+    with open(version_file(path), "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _to_integer(values, column, dtype):
+    """casts `values` to the integer `dtype`, refusing to silently wrap around"""
+    info = np.iinfo(dtype)
+    values = np.asarray(values)
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        raise ValueError(f"{column} has values outside the {dtype} range of the schema")
+    return values.astype(dtype)
+
+
+def apply_schema(hotels, categories=None):
+    """returns a copy of the cleaned hotels data frame with the column store dtypes
+
+    Parameters
+    ----------
+    hotels :     dataframe with the columns written by `hotel_cleaner.py`
+    categories : optional column -> categories of the categorical columns whose
+                 categories are not fixed by the schema, sorted values by default
+
+    Returns
+    -------
+    dataframe:   same data with categorical, small integer and float32 columns
+    """
+    categories = categories or {}
+    typed = {}
+    for column, spec in SCHEMA.items():
+        if column == "Property" and column not in hotels:
+            # data cleaned before there were properties, one per hotel type
+            continue
+        values = hotels[column]
+        if spec["dtype"] == "category":
+            fixed = spec["categories"] or categories.get(column)
+            if fixed is None:
+                fixed = sorted(values.dropna().unique())
+            typed[column] = pd.Categorical(values, categories=fixed)
+        elif spec["dtype"].startswith("int"):
+            typed[column] = _to_integer(values, column, spec["dtype"])
+        elif spec["dtype"].startswith("datetime"):
+            typed[column] = pd.to_datetime(values).values.astype(spec["dtype"])
+        else:
+            typed[column] = np.asarray(values, dtype=spec["dtype"])
+    return pd.DataFrame(typed)
+
+
+# fixed size reserved for the `.npy` headers, so the row count can be written
+# once all the rows have been appended
+HEADER_BYTES = 128
+
+
+def _npy_header(dtype, rows):
+    """returns a version 1.0 `.npy` header of exactly `HEADER_BYTES` bytes"""
+    header = repr(
+        {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            "fortran_order": False,
+            "shape": (rows,),
+        }
+    )
+    header = header.ljust(HEADER_BYTES - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode()
+
+
+def _header_bytes(f):
+    """returns the size of the header of the open `.npy` file `f`"""
+    f.seek(0)
+    if np.lib.format.read_magic(f) != (1, 0):
+        return None
+    np.lib.format.read_array_header_1_0(f)
+    return f.tell()
+
+
+class ColumnWriter:
+    """writes the column store directory `path` incrementally, one data frame of
+    cleaned hotels at a time, so that its size is not bounded by memory
+
+    Parameters
+    ----------
+    path :       directory to write the column store into
+    append :     whether to add rows to the column store already at `path`
+                 instead of replacing it
+    """
+
+    def __init__(self, path, append=False):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.rows = 0
+        self.categories = {
+            column: []
+            for column, spec in SCHEMA.items()
+            if spec.get("codes") and spec["categories"] is None
+        }
+        if append:
+            with open(os.path.join(path, "schema.json")) as f:
+                schema = json.load(f)
+            self.rows = schema["rows"]
+            for column in self.categories:
+                self.categories[column] = list(schema["columns"][column]["categories"])
+        # the columns are written to new files that replace the old ones on
+        # close, so that readers with the old files memory mapped are unaffected
+        self._files = {}
+        for column, spec in SCHEMA.items():
+            file = self._new_file(column)
+            if append:
+                shutil.copyfile(os.path.join(path, column_file(column)), file)
+                f = open(file, "r+b")
+                if _header_bytes(f) != HEADER_BYTES:
+                    f.close()
+                    raise ValueError(f"{file} was not written by a ColumnWriter")
+                # drops whatever an interrupted run appended after the last close
+                f.truncate(
+                    HEADER_BYTES + self.rows * np.dtype(self._dtype(column)).itemsize
+                )
+                f.seek(0, os.SEEK_END)
+            else:
+                f = open(file, "wb")
+                f.write(_npy_header(self._dtype(column), 0))
+            self._files[column] = f
+
+    def _new_file(self, column):
+        """returns the file `column` is written to until the writer is closed"""
+        return os.path.join(self.path, column_file(column) + ".new")
+
+    @staticmethod
+    def _dtype(column):
+        """returns the dtype of the values stored for `column`"""
+        spec = SCHEMA[column]
+        return spec["codes"] if spec["dtype"] == "category" else spec["dtype"]
+
+    def append(self, hotels):
+        """appends the rows of the cleaned hotels data frame `hotels`"""
+        for column, known in self.categories.items():
+            seen = set(known)
+            known.extend(
+                sorted(v for v in hotels[column].dropna().unique() if v not in seen)
+            )
+        typed = apply_schema(hotels, categories=self.categories)
+        for column, spec in SCHEMA.items():
+            values = typed[column]
+            if spec["dtype"] == "category":
+                values = values.cat.codes.values
+            else:
+                values = values.values
+            self._files[column].write(
+                np.ascontiguousarray(values, dtype=self._dtype(column)).tobytes()
+            )
+        self.rows += len(typed)
+
+    def _sort_categories(self, column):
+        """sorts the categories of `column`, which were kept in order of first
+        appearance, and rewrites its codes to match
+        """
+        categories = self.categories[column]
+        order = np.argsort(np.array(categories, dtype=object))
+        if (order == np.arange(len(order))).all():
+            return
+        remap = np.empty(len(order) + 1, dtype=self._dtype(column))
+        remap[order] = np.arange(len(order))
+        remap[-1] = -1  # missing values keep the code -1
+        codes = self._column(column, mode="r+")
+        for start in range(0, self.rows, BLOCK_ROWS):
+            block = codes[start : start + BLOCK_ROWS]
+            block[:] = remap[block]
+        codes.flush()
+        del codes
+        self.categories[column] = [categories[i] for i in order]
+
+    def _column(self, column, mode="r"):
+        """returns the memory mapped values written for `column`"""
+        return np.memmap(
+            self._new_file(column),
+            dtype=self._dtype(column),
+            mode=mode,
+            offset=HEADER_BYTES,
+            shape=(self.rows,),
+        )
+
+    def _sort_keys(self, sort_columns, start, years, cells):
+        """returns the row index cell of the rows of a block starting at `start`,
+        `cells` for the rows without a hotel type
+        """
+        hotel, year, month, day = [
+            np.asarray(values[start : start + BLOCK_ROWS], dtype="int64")
+            for values in sort_columns
+        ]
+        key = (hotel * len(years) + year - years[0]) * 12 + month - 1
+        key = key * 31 + day - 1
+        # rows without a hotel type go after all the indexed rows
+        key[hotel < 0] = cells
+        return key
+
+    def _sort_rows(self):
+        """sorts the rows by `SORT_COLUMNS`, keeping the order of the rows of a
+        same day, and writes the row index
+
+        The sort is a counting sort over the cells of the index, done in blocks
+        of `BLOCK_ROWS` rows: the memory used is a few int64 arrays of a block
+        and the histogram of the cells, whatever the number of rows. The
+        position of every row in the sorted order is kept in a temporary
+        memory mapped file, 8 bytes per row, and each column is scattered
+        block by block into a new file.
+
+        Returns
+        -------
+        dictionary:  the "index" entry of `schema.json`: its file, the sort
+                     columns, the "hotels" and "years" of its axes and "rows",
+                     the number of rows it covers
+        """
+        sort_columns = [self._column(column) for column in SORT_COLUMNS]
+        hotels = SCHEMA["Hotel type"]["categories"]
+        blocks = range(0, self.rows, BLOCK_ROWS)
+        years = []
+        if self.rows:
+            first = min(int(sort_columns[1][i : i + BLOCK_ROWS].min()) for i in blocks)
+            last = max(int(sort_columns[1][i : i + BLOCK_ROWS].max()) for i in blocks)
+            years = list(range(first, last + 1))
+        cells = len(hotels) * len(years) * 12 * 31
+        counts = np.zeros(cells + 1, dtype="int64")
+        is_sorted, previous = True, -1
+        for start in blocks:
+            key = self._sort_keys(sort_columns, start, years, cells)
+            counts += np.bincount(key, minlength=cells + 1)
+            if is_sorted:
+                is_sorted = key[0] >= previous and not (np.diff(key) < 0).any()
+                previous = key[-1]
+        offsets = np.zeros(cells + 1, dtype="int64")
+        np.cumsum(counts[:cells], out=offsets[1:])
+        if not is_sorted:
+            order_file = os.path.join(self.path, "row_order.new")
+            order = np.memmap(order_file, dtype="int64", mode="w+", shape=(self.rows,))
+            # the next free position of every cell
+            free = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            for start in blocks:
+                key = self._sort_keys(sort_columns, start, years, cells)
+                within = np.argsort(key, kind="stable")
+                cell, first, n = np.unique(
+                    key[within], return_index=True, return_counts=True
+                )
+                rank = np.arange(len(key)) - np.repeat(first, n)
+                order[start + within] = free[key[within]] + rank
+                free[cell] += n
+            del sort_columns
+            for column in SCHEMA:
+                self._scatter(column, order)
+            del order
+            os.remove(order_file)
+        with open(os.path.join(self.path, INDEX_FILE + ".new"), "wb") as f:
+            np.save(f, offsets, allow_pickle=False)
+        return {
+            "file": INDEX_FILE,
+            "by": SORT_COLUMNS,
+            "hotels": hotels,
+            "years": years,
+            "rows": int(offsets[-1]),
+        }
+
+    def _scatter(self, column, order):
+        """moves the values written for `column` to their positions `order`,
+        block by block, into a new file that replaces the written one
+        """
+        dtype = self._dtype(column)
+        file = self._new_file(column) + ".sorted"
+        with open(file, "wb") as f:
+            f.write(_npy_header(dtype, self.rows))
+            f.truncate(HEADER_BYTES + self.rows * np.dtype(dtype).itemsize)
+        values = self._column(column)
+        moved = np.memmap(
+            file, dtype=dtype, mode="r+", offset=HEADER_BYTES, shape=(self.rows,)
+        )
+        for start in range(0, self.rows, BLOCK_ROWS):
+            stop = start + BLOCK_ROWS
+            moved[order[start:stop]] = values[start:stop]
+        moved.flush()
+        del moved, values
+        os.replace(file, self._new_file(column))
+
+    def close(self):
+        """completes the `.npy` headers and writes `schema.json`, which records
+        a content hash of every column so that readers can detect a new version
+        of the data
+        """
+        for column, f in self._files.items():
+            f.seek(0)
+            f.write(_npy_header(self._dtype(column), self.rows))
+            f.close()
+        for column in self.categories:
+            self._sort_categories(column)
+        index = self._sort_rows()
+        schema = {"rows": self.rows, "columns": {}, "index": index}
+        for column, spec in SCHEMA.items():
+            entry = {"file": column_file(column), "dtype": spec["dtype"]}
+            if spec["dtype"] == "category":
+                entry["categories"] = self.categories.get(column, spec["categories"])
+            entry["sha1"] = _data_sha1(self._new_file(column))
+            schema["columns"][column] = entry
+        for column in SCHEMA:
+            os.replace(
+                self._new_file(column), os.path.join(self.path, column_file(column))
+            )
+        os.replace(
+            os.path.join(self.path, INDEX_FILE + ".new"),
+            os.path.join(self.path, INDEX_FILE),
+        )
+        replace_json(schema, os.path.join(self.path, "schema.json"))
+
+
+def replace_json(value, path):
+    """writes `value` as json to a new file that then replaces `path`"""
+    with open(path + ".new", "w") as f:
+        json.dump(value, f, indent=1)
+    os.replace(path + ".new", path)
+
+
+def _data_sha1(path):
+    """returns the sha1 hex digest of the values of the `.npy` file `path`"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        f.seek(HEADER_BYTES)
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_columns(hotels, path):
+    """writes `hotels` to the column store directory `path`
+
+    Parameters
+    ----------
+    hotels :     dataframe with the columns written by `hotel_cleaner.py`
+    path :       directory to write the column store into
+    """
+    writer = ColumnWriter(path)
+    writer.append(hotels)
+    writer.close()
+
+
+def read_index(path):
+    """reads the row index of the column store directory `path`
+
+    Returns
+    -------
+    dictionary:  "hotels" and "years" of the index axes and "offsets", the
+                 first row of every (hotel type, year, month, day) followed
+                 by the end of the last one, or None if the store has no index
+    """
+    with open(os.path.join(path, "schema.json")) as f:
+        schema = json.load(f)
+    index = schema.get("index")
+    # rows without a hotel type are outside of the index
+    if index is None or index["rows"] != schema["rows"]:
+        return None
+    offsets = np.load(os.path.join(path, index["file"]), allow_pickle=False)
+    return {"hotels": index["hotels"], "years": index["years"], "offsets": offsets}
+
+
+def index_ranges(index, hotel_type=None, year=None, month=None):
+    """returns the (start, stop) ranges of the rows of one hotel type, year and
+    month, any of which can be None to select all of them
+
+    Parameters
+    ----------
+    index :      dictionary produced by `read_index()`
+    hotel_type : hotel type, or None for all hotel types
+    year:        arrival year, or None for all years
+    month:       arrival month, 1 to 12, or None for all months
+
+    Returns
+    -------
+    list:        the ranges, adjacent ranges being merged, at most one per
+                 hotel type, and one per hotel type and year when selecting a
+                 month of every year
+    """
+    offsets = index["offsets"]
+    years = index["years"]
+    if hotel_type is None:
+        hotels = range(len(index["hotels"]))
+    elif hotel_type in index["hotels"]:
+        hotels = [index["hotels"].index(hotel_type)]
+    else:
+        return []
+    if year is None:
+        year_range = range(len(years))
+    elif year in years:
+        year_range = [years.index(year)]
+    else:
+        return []
+    ranges = []
+    for h in hotels:
+        if month is None:
+            # the selected years are consecutive
+            first = (h * len(years) + year_range[0]) * 12 * 31
+            last = (h * len(years) + year_range[-1] + 1) * 12 * 31
+            ranges.append((first, last))
+        else:
+            for y in year_range:
+                first = ((h * len(years) + y) * 12 + month - 1) * 31
+                ranges.append((first, first + 31))
+    rows = []
+    for a, b in ranges:
+        start, stop = int(offsets[a]), int(offsets[b])
+        if rows and rows[-1][1] == start:
+            # adjacent ranges, ex) the last year of one hotel type and the first
+            # year of the next, make one range
+            rows[-1] = (rows[-1][0], stop)
+        elif stop > start:
+            rows.append((start, stop))
+    return rows
+
+
+def read_columns(path, mmap=False):
+    """reads the column store directory `path` written by `write_columns()`
+
+    Parameters
+    ----------
+    path :       column store directory
+    mmap :       whether to memory map the column files read-only instead of
+                 reading them, so that processes reading the same files share
+                 one copy of the data in the page cache
+
+    Returns
+    -------
+    dataframe:   cleaned hotels data with the column store dtypes, backed by
+                 the memory mapped files when `mmap`
+    """
+    with open(os.path.join(path, "schema.json")) as f:
+        schema = json.load(f)
+    columns = {}
+    for column, entry in schema["columns"].items():
+        values = np.load(
+            os.path.join(path, entry["file"]),
+            mmap_mode="r" if mmap else None,
+            allow_pickle=False,
+        )
+        if entry["dtype"] == "category":
+            # the codes were checked when written, not validating them keeps
+            # memory mapped codes of the dtype pandas expects uncopied
+            values = pd.Categorical.from_codes(
+                values, categories=entry["categories"], validate=not mmap
+            )
+        columns[column] = values
+    # one block per column instead of copying columns of a dtype together
+    return pd.DataFrame(columns, copy=not mmap)
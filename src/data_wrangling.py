@@ -1,6 +1,32 @@
+import os
+import threading
+
 import pandas as pd
 import numpy as np
 
+from column_store import (
+    DAYS_OF_WEEK,
+    SCHEMA,
+    apply_schema,
+    data_digest,
+    read_columns,
+    version_file,
+)
+from hotel_cube import (
+    METRICS,
+    build_cube,
+    daily_range,
+    day_of_week,
+    property_cube,
+    range_totals,
+    read_cube,
+    stay_quantiles,
+)
+from hotel_cube import stay_histogram as stay_histogram_of_cube
+from hotel_cube import top_countries as top_countries_of_cube
+from callback_cache import LRUCache
+from metrics import register_cache, stage
+
 months_short = [
     "Jan",
     "Feb",
@@ -17,27 +43,366 @@ months_short = [
 ]
 
 
-def select_type(hotel_type="All"):
-    """Reads the "data/processed/clean_hotels.csv" source file and returns
-        a data frame filtered by hotel type
+DATA_PATH = "data/processed/clean_hotels.csv"
+COLUMNS_PATH = "data/processed/clean_hotels"
+CUBE_PATH = "data/processed/hotel_cube"
+PROPERTIES_PATH = "data/processed/properties.csv"
+# the groups of properties of the "property-selection", ex) "region:Lisbon"
+PROPERTY_GROUPS = {"region": "Region", "portfolio": "Portfolio"}
+HOTEL_TYPES = SCHEMA["Hotel type"]["categories"]
+# "1" memory maps the column store and the cube read-only instead of reading
+# them, so that every gunicorn worker shares one copy of the data
+DATA_MMAP = os.environ.get("DATA_MMAP", "0") == "1"
+
+# Process-wide, read-only copy of the cleaned data. Every callback used to
+# re-parse the csv; now it is parsed once and only re-read when the file on
+# disk changes or `invalidate_cache()` / `reload_data()` is called. A new
+# version replaces the whole dictionary, so that readers never see half of it,
+# and the "properties" derived from a version are added to its dictionary.
+_cache = {
+    "signature": None,
+    "digest": None,
+    "hotels": None,
+    "cube": None,
+    "properties": None,
+    "property_names": None,
+}
+_cache_lock = threading.Lock()
+# cubes of the selected properties shared by every callback of one interaction
+_selections = LRUCache(max_entries=128, max_bytes=256 * 2**20)
+register_cache("selections", _selections)
+# (properties table, values, hotel type) -> positions of the selected properties
+_resolved = LRUCache(max_entries=1024, max_bytes=16 * 2**20)
+register_cache("resolved_properties", _resolved)
+
+
+def _data_path():
+    """returns the column store if `hotel_cleaner.py` wrote one, else the csv file"""
+    if os.path.exists(version_file(COLUMNS_PATH)):
+        return COLUMNS_PATH
+    return DATA_PATH
+
+
+def read_hotels(path=None):
+    """reads the cleaned hotels data with the column store dtypes
+
+    Parameters
+    ----------
+    path :       column store directory or csv file, defaults to whichever
+                 `hotel_cleaner.py` wrote, memory mapped with DATA_MMAP=1 if
+                 it is a column store
+
+    Returns
+    -------
+    dataframe:   cleaned hotels data
+    """
+    path = path or _data_path()
+    if os.path.isdir(path):
+        return read_columns(path, mmap=DATA_MMAP)
+    return apply_schema(pd.read_csv(path))
+
+
+def _file_signature(path):
+    """returns the (mtime, size) pair used to detect changes to `path`"""
+    stat = os.stat(version_file(path))
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _load(path=None):
+    """returns the cache, first reading the data again if its mtime/size and
+    content hash changed on disk
+    """
+    global _cache
+    path = path or _data_path()
+    signature = _file_signature(path)
+    cache = _cache
+    if cache["signature"] == (path, signature):
+        return cache
+    with _cache_lock:
+        cache = _cache
+        if cache["signature"] == (path, signature):
+            return cache
+        digest = data_digest(path)
+        # a touched but otherwise identical file keeps the loaded data
+        if cache["hotels"] is None or cache["digest"] != (path, digest):
+            with stage("load"):
+                hotels = read_hotels(path)
+                # the cube written by `hotel_cleaner.py` is only used with its own data
+                cube = read_cube(CUBE_PATH, source=digest, mmap=DATA_MMAP)
+                if cube is None:
+                    cube = build_cube(hotels)
+            cache = dict.fromkeys(cache)
+            cache.update(hotels=hotels, cube=cube, digest=(path, digest))
+        _cache = {**cache, "signature": (path, signature)}
+        return _cache
+
+
+def load_hotels(path=None):
+    """returns the cached cleaned data
+
+    Parameters
+    ----------
+    path :       location of the cleaned hotels data, see `read_hotels()`
+
+    Returns
+    -------
+    dataframe:   the bookings, shared by all callers and not to be modified
+    """
+    return _load(path)["hotels"]
+
+
+def load_cube(path=None):
+    """returns the cached aggregate cube of the cleaned data, see `hotel_cube.py`"""
+    return _load(path)["cube"]
+
+
+def invalidate_cache():
+    """drops the cached data so that the next call to `load_hotels()` reads it again"""
+    global _cache
+    with _cache_lock:
+        _cache = dict.fromkeys(_cache)
+
+
+def reload_data(path=None):
+    """reads the cleaned data again immediately, e.g. after `hotel_cleaner.py` has run
+
+    Returns
+    -------
+    string:      content hash of the data now being served
+    """
+    invalidate_cache()
+    load_hotels(path)
+    return data_version()
+
+
+def data_version():
+    """returns the content hash of the data being served, reading it if it changed"""
+    return _load()["digest"][1]
+
+
+def available_months(year):
+    """returns the months of `year` with bookings, in the order of the calendar
+
+    Parameters
+    ----------
+    year :       the year, ex) 2015
+
+    Returns
+    -------
+    list:        ex) [7, 8, 9, 10, 11, 12]
+    """
+    cube = load_cube()
+    if year not in cube["years"]:
+        return []
+    counts = cube["month_count"][0, cube["years"].index(year)]
+    return [int(month) + 1 for month in np.flatnonzero(counts)]
+
+
+def available_years():
+    """returns the years with bookings, in order
+
+    Returns
+    -------
+    list:        ex) [2015, 2016, 2017]
+    """
+    cube = load_cube()
+    counts = cube["month_count"][0].sum(-1)
+    return [int(cube["years"][i]) for i in np.flatnonzero(counts)]
+
+
+def available_dates():
+    """returns the first and last arrival dates with bookings
+
+    Returns
+    -------
+    tuple:       ex) ("2015-07-01", "2017-08-31"), (None, None) without bookings
+    """
+    cube = load_cube()
+    days = np.flatnonzero(cube["count"][0])
+    if not len(days):
+        return None, None
+    # positions on the flattened (year, month, day) axes
+    year, month, day = np.unravel_index(days[[0, -1]], cube["count"][0].shape)
+    return tuple(
+        f"{cube['years'][y]}-{m + 1:02d}-{d + 1:02d}"
+        for y, m, d in zip(year, month, day)
+    )
+
+
+def load_properties():
+    """returns the properties of the data with their hotel type, region and
+    portfolio, read from the `properties.csv` of `hotel_cleaner.py` once per
+    version of the data and of the file
+
+    Returns
+    -------
+    dataframe:   "Property", "Hotel type", "Region" and "Portfolio", one row
+                 per property in the order of the cube, "Unknown" for the
+                 properties missing from the file
+    """
+    return _properties()[1][1]
+
+
+def _properties():
+    """returns the cache, see `_load()`, and its (version, table) entry of
+    the properties table, see `load_properties()`
+    """
+    cache = _load()
+    cube = cache["cube"]
+    try:
+        signature = _file_signature(PROPERTIES_PATH)
+    except FileNotFoundError:
+        signature = None
+    key = (cache["digest"][1], signature)
+    entry = cache["properties"]
+    if entry is None or entry[0] != key:
+        table = pd.DataFrame(
+            {
+                "Property": cube["properties"],
+                "Hotel type": np.array(HOTEL_TYPES)[cube["property_types"]],
+            }
+        )
+        if signature is not None:
+            groups = pd.read_csv(
+                PROPERTIES_PATH, dtype=str, usecols=["Property", "Region", "Portfolio"]
+            )
+            table = table.merge(groups, on="Property", how="left")
+        table = table.reindex(columns=["Property", "Hotel type", "Region", "Portfolio"])
+        entry = cache["properties"] = (key, table.fillna("Unknown"))
+    return cache, entry
+
+
+def property_names():
+    """returns the values "property-selection" can select: the property ids
+    and the groups of properties, ex) "region:Lisbon", see `PROPERTY_GROUPS`
+
+    Returns
+    -------
+    set:         of strings, built once per version of the properties table
+    """
+    cache, (version, table) = _properties()
+    names = cache["property_names"]
+    if names is None or names[0] != version:
+        values = set(table["Property"])
+        for group, column in PROPERTY_GROUPS.items():
+            values.update(f"{group}:{name}" for name in table[column].unique())
+        names = cache["property_names"] = (version, values)
+    return names[1]
+
+
+def resolve_properties(values, hotel_type="All"):
+    """returns the properties selected in "property-selection" that are of
+    `hotel_type`
+
+    Parameters
+    ----------
+    values :     property ids and groups of properties, ex) "region:Lisbon",
+                 see `PROPERTY_GROUPS`, None or empty for no selection
+    hotel_type : string, either "City", "Resort", or "Both, or a list of them
+
+    Returns
+    -------
+    tuple:       positions of the properties in the cube, sorted, or None
+                 without a selection
+    """
+    if not values:
+        return None
+    _, (version, table) = _properties()
+    types = hotel_type if isinstance(hotel_type, (list, tuple)) else [hotel_type]
+    key = (version, tuple(values), tuple(types))
+    positions = _resolved.get(key)
+    if positions is None:
+        positions = _resolve(table, values, types)
+        _resolved.put(key, positions)
+    return positions
+
+
+def _resolve(table, values, types):
+    """returns the positions of the properties selected by `values` that are
+    of one of the hotel `types`, see `resolve_properties()`
+    """
+    is_property = table["Property"].isin(values)
+    selected = is_property.to_numpy()
+    groups = set(values) - set(table["Property"][is_property])
+    for value in groups:
+        group, _, name = str(value).partition(":")
+        if group in PROPERTY_GROUPS:
+            selected |= (table[PROPERTY_GROUPS[group]] == name).to_numpy()
+    if not set(types) - set(HOTEL_TYPES):
+        selected &= table["Hotel type"].isin(types).to_numpy()
+    return tuple(int(i) for i in np.flatnonzero(selected))
+
+
+def property_options(hotel_type="All", search=None, selected=(), limit=100):
+    """returns the options of "property-selection": the regions and portfolios
+    then the properties of `hotel_type` matching `search`
 
     Parameters
     ----------
     hotel_type : string, either "City", "Resort", or "Both
+    search :     text typed in the dropdown, None for every property
+    selected :   values already selected, always in the options
+    limit :      number of properties listed, the search narrowing them down
 
     Returns
     -------
-    dataframe with hotel data filtered by hotel type
+    list:        of {"label", "value"}, ex)
+                 {"label": "C00012 · City · Lisbon · Urban", "value": "C00012"}
     """
-    hotels = pd.read_csv("data/processed/clean_hotels.csv")
-    # filter based on hotel type selection
-    if hotel_type == "Resort":
-        hotels = hotels[hotels["Hotel type"] == "Resort"]
-    if hotel_type == "City":
-        hotels = hotels[hotels["Hotel type"] == "City"]
-    return hotels
+    table = load_properties()
+    if hotel_type in HOTEL_TYPES:
+        table = table[table["Hotel type"] == hotel_type]
+    search = (search or "").strip().lower()
+    options = []
+    for group, column in PROPERTY_GROUPS.items():
+        for name, count in table[column].value_counts().sort_index().items():
+            value = f"{group}:{name}"
+            if search in value.lower() or value in selected:
+                options.append(
+                    {"label": f"{column} {name} ({count} properties)", "value": value}
+                )
+    labels = table["Property"].str.cat(
+        table[["Hotel type", "Region", "Portfolio"]], sep=" · "
+    )
+    matches = labels.str.lower().str.contains(search, regex=False)
+    shown = table["Property"].isin(selected) | (matches & (matches.cumsum() <= limit))
+    options += [
+        {"label": label, "value": value}
+        for label, value in zip(labels[shown], table["Property"][shown])
+    ]
+    return options
+
+
+def _selection(hotel_type="All", properties=None):
+    """returns the cube of the bookings of `hotel_type` and of the selected
+    `properties`, and the position of `hotel_type` on its hotel axis
+
+    Without properties, that is the cube of the data. Otherwise the cube of the
+    properties, see `hotel_cube.property_cube()`, with only the "All" hotel
+    at position 0, shared between callers.
+    """
+    cube = load_cube()
+    positions = resolve_properties(properties, hotel_type)
+    if positions is None:
+        return cube, _hotel_index(cube, hotel_type)
+    key = (data_version(), "properties", positions)
+    selected = _selections.get(key)
+    if selected is None:
+        with stage("aggregate"):
+            selected = property_cube(cube, positions)
+        _selections.put(key, selected)
+    return selected, 0
+
+
+def _has_bookings(data, scope, ycol):
+    """returns whether the "Average" rows, or else the selected year rows, of
+    `data` have values, which a small selection of properties may not have
+    """
+    lines = data["Line"] == "Average"
+    return data[lines if scope == "all_time" else ~lines][ycol].notna().any()
 
 
+@stage("stats")
 def get_year_stats(data, scope="all_time", ycol="Reservations", year=2016):
     """creates a string with summary stats from the selected year
     Parameters
@@ -50,14 +415,22 @@ def get_year_stats(data, scope="all_time", ycol="Reservations", year=2016):
     -------
     string:      ex) "Year 2016: Ave=4726, Max=6203(Oct), Min=2248(Jan)"
     """
+    # a selection of properties without bookings in the year
+    if not _has_bookings(data, scope, ycol):
+        return "No bookings"
     if scope == "all_time":
         max_ind = data[data["Line"] == "Average"][ycol].argmax()
         min_ind = data[data["Line"] == "Average"][ycol].argmin()
         ave = round(data[data["Line"] == "Average"][ycol].mean())
         string = f"Historical "
     else:
-        max_ind = data[data["Line"] != "Average"][ycol].argmax() + 12
-        min_ind = data[data["Line"] != "Average"][ycol].argmin() + 12
+        # the rows of the year follow the "Average" rows
+        max_ind = data[data["Line"] != "Average"][ycol].argmax() + len(
+            data[data["Line"] == "Average"]
+        )
+        min_ind = data[data["Line"] != "Average"][ycol].argmin() + len(
+            data[data["Line"] == "Average"]
+        )
         ave = round(data[data["Line"] != "Average"][ycol].mean())
         string = f"Year {year} "
     maxi = round(data.iloc[max_ind, 2])
@@ -69,6 +442,7 @@ def get_year_stats(data, scope="all_time", ycol="Reservations", year=2016):
     return string
 
 
+@stage("stats")
 def get_month_stats(data, scope="all_time", ycol="Reservations", year=2016, month=1):
     """creates a string with summary stats from the selected month and year
     Parameters
@@ -82,6 +456,13 @@ def get_month_stats(data, scope="all_time", ycol="Reservations", year=2016, mont
     -------
     string:      ex) "Jan 2016 Ave : 73, Max : 183(Jan 2), Min : 33(Jan 31)"
     """
+    if scope != "all_time" and (
+        (year < 2016 and month < 7) or (year > 2016 and month > 8)
+    ):  # if out of data range return message
+        return "No data for this month"
+    # a selection of properties without bookings in the month
+    if not _has_bookings(data, scope, ycol):
+        return "No bookings"
     short_month = months_short[month - 1]  # convert numeric month to abbreviated text
     if scope == "all_time":
         max_ind = data[data["Line"] == "Average"][ycol].argmax()
@@ -89,10 +470,6 @@ def get_month_stats(data, scope="all_time", ycol="Reservations", year=2016, mont
         ave = round(data[data["Line"] == "Average"][ycol].mean())
         string = f"Historical  "
     else:
-        if (year < 2016 and month < 7) or (
-            year > 2016 and month > 8
-        ):  # if out of data range return message
-            return "No data for this month"
         max_ind = data[data["Line"] != "Average"][ycol].argmax() + len(
             data[data["Line"] == "Average"]
         )
@@ -111,7 +488,73 @@ def get_month_stats(data, scope="all_time", ycol="Reservations", year=2016, mont
     return string
 
 
-def get_year_data(hotel_type, y_col, year):
+def _hotel_index(cube, hotel_type):
+    """returns the position of `hotel_type` on the hotel axis of the cube"""
+    if hotel_type in cube["hotels"]:
+        return cube["hotels"].index(hotel_type)
+    return 0  # anything else means all hotel types
+
+
+def _summarise(cube, y_col, year, counts, sums, means, n_years):
+    """returns the all-time "Average" and the `year` values of `y_col`
+
+    Parameters
+    ----------
+    cube :       dictionary produced by `hotel_cube.build_cube()`
+    y_col:       the variable selected from "y-axis-dropdown"
+    year:        the year selected from "year-dropdown"
+    counts :     bookings per (year, period) for the selected hotel type
+    sums :       sums of `y_col` per (year, period), None for "Reservations"
+    means :      means of `y_col` per (year, period), None for "Reservations"
+    n_years :    number of years with bookings per period
+
+    Returns
+    -------
+    tuple:       (average, selected year) arrays over the periods
+    """
+    years = cube["years"]
+    if year in years:
+        current = counts[years.index(year)]
+    else:
+        current = np.zeros(counts.shape[1], dtype=counts.dtype)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if y_col == "Reservations":  # count number of "Reservations"
+            average = counts.sum(0) / n_years
+            selected = current.astype("float64")
+        elif y_col == "Average daily rate":  # average the "Average daily rate"
+            average = sums.sum(0) / counts.sum(0)
+            selected = means[years.index(year)] if year in years else current
+        else:  # sum the other variables
+            average = sums.sum(0) / n_years
+            selected = sums[years.index(year)] if year in years else current
+    # periods without bookings in the selected year are missing, as with groupby
+    selected = np.where(current > 0, selected, np.nan)
+    return average, selected
+
+
+def _melt(period, periods, y_col, year, average, selected):
+    """returns the long data frame with the "Average" rows followed by the `year` rows"""
+    return pd.DataFrame(
+        {
+            period: np.concatenate([periods, periods]),
+            "Line": ["Average"] * len(periods) + [str(year)] * len(periods),
+            y_col: np.concatenate([average, selected]),
+        }
+    )
+
+
+def _cube_slices(cube, h, y_col, prefix=""):
+    """returns the count, sum and mean arrays of the cube for the hotel type at
+    position `h` and `y_col`
+    """
+    counts = cube[prefix + "count"][h]
+    if y_col not in METRICS:
+        return counts, None, None
+    m = METRICS.index(y_col)
+    return counts, cube[prefix + "sum"][m, h], cube[prefix + "mean"][m, h]
+
+
+def get_year_data(hotel_type, y_col, year, properties=None):
     """returns a data frame containing monthly summaries of one variable for
     the selected hotel type, for the selected year and for all-time
 
@@ -120,45 +563,24 @@ def get_year_data(hotel_type, y_col, year):
     hotel_type : string, either "City", "Resort", or "Both
     y_col:       the variable selected from "y-axis-dropdown"
     year:        the year selected from "year-dropdown"
+    properties:  the properties selected from "property-selection", see
+                 `resolve_properties()`, None for every property
 
     Returns
     -------
     dataframe:  monthly summaries of selected variable for the selected time period
     """
-    hotels = select_type(hotel_type)
-    data = pd.DataFrame()
-    if y_col == "Reservations":  # count number of "Reservations"
-        data["Average"] = (
-            hotels.groupby("Arrival month")["Hotel type"].count()
-            / hotels.groupby("Arrival month")["Arrival year"].nunique()
+    cube, h = _selection(hotel_type, properties)
+    with stage("aggregate"):
+        counts, sums, means = _cube_slices(cube, h, y_col, prefix="month_")
+        n_years = cube["month_years"][h]
+        average, selected = _summarise(cube, y_col, year, counts, sums, means, n_years)
+        # keep the months with bookings in any year
+        present = n_years > 0
+        months = np.arange(1, 13)[present]
+        data = _melt(
+            "Arrival month", months, y_col, year, average[present], selected[present]
         )
-        data[str(year)] = (
-            hotels[hotels["Arrival year"] == year]
-            .groupby("Arrival month")["Hotel type"]
-            .count()
-        )
-    elif y_col == "Average daily rate":  # average the "Average daily rate"
-        data["Average"] = hotels.groupby("Arrival month")[y_col].mean()
-        data[str(year)] = (
-            hotels[hotels["Arrival year"] == year]
-            .groupby("Arrival month")[y_col]
-            .mean()
-        )
-    else:  # sum the other variables
-        data["Average"] = (
-            hotels.groupby("Arrival month")[y_col].sum()
-            / hotels.groupby("Arrival month")["Arrival year"].nunique()
-        )
-        data[str(year)] = (
-            hotels[hotels["Arrival year"] == year].groupby("Arrival month")[y_col].sum()
-        )
-
-    # make the month_no a column
-    data = data.reset_index()
-    data = pd.melt(data, "Arrival month").rename(
-        columns={"variable": "Line", "value": y_col}
-    )
-
     return data
 
 
@@ -167,6 +589,7 @@ def get_month_data(
     y_col="Reservations",
     year=2016,
     month=1,
+    properties=None,
 ):
     """returns a data frame containing monthly summaries of one variable for
     the selected hotel type, for the selected year and for all-time
@@ -177,114 +600,348 @@ def get_month_data(
     y_col:       the variable selected from "y-axis-dropdown"
     year:        the year selected from "year-dropdown"
     month:       the month selected from "month-dropdown"
+    properties:  the properties selected from "property-selection", None for
+                 every property
 
     Returns
     -------
     dataframe:  daily summaries of selected variable for the selected time period
     """
-    hotels = select_type(hotel_type)
-    hotels = hotels[hotels["Arrival month"] == month]
-    data = pd.DataFrame()
-    if y_col == "Reservations":  # count number of "Reservations"
-        data["Average"] = (
-            hotels.groupby("Arrival day")["Hotel type"].count()
-            / hotels.groupby("Arrival day")["Arrival year"].nunique()
+    cube, h = _selection(hotel_type, properties)
+    with stage("aggregate"):
+        counts, sums, means = _cube_slices(cube, h, y_col)
+        counts = counts[:, month - 1]
+        if sums is not None:
+            sums, means = sums[:, month - 1], means[:, month - 1]
+        n_years = cube["day_years"][h, month - 1]
+        average, selected = _summarise(cube, y_col, year, counts, sums, means, n_years)
+        # keep the days with bookings in any year
+        present = n_years > 0
+        # filter out feb 29 for non-leap years
+        if (year % 4 != 0) and month == 2:
+            present[28] = False
+        days = np.arange(1, 32)[present]
+        data = _melt(
+            "Arrival day", days, y_col, year, average[present], selected[present]
         )
-        data[str(year)] = (
-            hotels[hotels["Arrival year"] == year]
-            .groupby("Arrival day")["Hotel type"]
-            .count()
+
+        # get the day of the week for the selected year
+        data["Arrival day of week"] = day_of_week(
+            cube, year, month, data["Arrival day"]
         )
-    elif y_col == "Average daily rate":  # average the "Average daily rate"
-        data["Average"] = hotels.groupby("Arrival day")[y_col].mean()
-        data[str(year)] = (
-            hotels[hotels["Arrival year"] == year].groupby("Arrival day")[y_col].mean()
+
+    return data
+
+
+def _range_values(y_col, counts, sums):
+    """returns the values of `y_col` for the number of bookings `counts` and
+    the sums of the metrics `sums`, with the same meaning as the month view:
+    the bookings, the mean "Average daily rate" or the sum of other variables
+    """
+    counts = np.asarray(counts)
+    if y_col not in METRICS:
+        return counts.astype("float64")
+    sums = sums[METRICS.index(y_col)]
+    if y_col == "Average daily rate":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, sums / counts, np.nan)
+    return sums
+
+
+def downsample(y, points):
+    """returns the positions of at most `points` values of the series `y`,
+    evenly spaced in x, that keep its shape: its first and last values and,
+    for each of the buckets of values in between, the value making the
+    largest triangle with the value kept in the previous bucket and the mean
+    of the next bucket (Largest-Triangle-Three-Buckets), so that peaks and
+    troughs survive unlike with every n-th value or bucket means
+
+    Parameters
+    ----------
+    y :          array of values, missing values are never kept
+    points :     number of values to keep, at least 3
+
+    Returns
+    -------
+    array:       increasing positions in `y`
+    """
+    y = np.asarray(y, dtype="float64")
+    known = np.flatnonzero(~np.isnan(y))
+    if len(known) <= points:
+        return known
+    x, y = known.astype("float64"), y[known]
+    n = len(y)
+    # bucket i is [edges[i], edges[i + 1]), the first and last values are kept
+    edges = (np.arange(points - 1) * (n - 2) / (points - 2)).astype("int64") + 1
+    edges = np.append(edges, n)
+    kept = np.empty(points, dtype="int64")
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for i in range(points - 2):
+        first, last = edges[i], edges[i + 1]
+        after = slice(last, edges[i + 2] if i + 3 < len(edges) else n)
+        mean_x, mean_y = x[after].mean(), y[after].mean()
+        # twice the areas of the triangles, their sign does not matter
+        areas = np.abs(
+            (x[previous] - mean_x) * (y[first:last] - y[previous])
+            - (x[previous] - x[first:last]) * (mean_y - y[previous])
         )
-    else:  # sum the other variables
-        data["Average"] = (
-            hotels.groupby("Arrival day")[y_col].sum()
-            / hotels.groupby("Arrival day")["Arrival year"].nunique()
+        previous = first + int(areas.argmax())
+        kept[i + 1] = previous
+    return known[kept]
+
+
+def get_range_data(
+    hotel_type="All",
+    y_col="Reservations",
+    start="2016-01-01",
+    end="2016-03-31",
+    properties=None,
+    max_points=None,
+):
+    """returns a data frame containing daily summaries of one variable for the
+    selected hotel type, from the start to the end of the selected dates
+
+    Parameters
+    ----------
+    hotel_type : string, either "City", "Resort", or "Both
+    y_col:       the variable selected from "y-axis-dropdown"
+    start:       the first date selected from "date-range"
+    end:         the last date selected from "date-range"
+    properties:  the properties selected from "property-selection", None for
+                 every property
+    max_points:  number of days kept at most, see `downsample()`, None for
+                 every day
+
+    Returns
+    -------
+    dataframe:  daily summaries of selected variable for the selected dates
+    """
+    cube, h = _selection(hotel_type, properties)
+    with stage("aggregate"):
+        dates, counts, sums = daily_range(cube, h, start, end)
+        values = _range_values(y_col, counts, sums)
+        if max_points is not None and len(values) > max_points:
+            kept = downsample(values, max_points)
+            dates, values = dates[kept], values[kept]
+        data = pd.DataFrame(
+            {
+                "Arrival date": dates,
+                y_col: values,
+                "Arrival day of week": np.array(DAYS_OF_WEEK)[dates.dayofweek],
+            }
         )
-        data[str(year)] = (
-            hotels[hotels["Arrival year"] == year].groupby("Arrival day")[y_col].sum()
+    return data
+
+
+def get_range_total(
+    hotel_type="All",
+    y_col="Reservations",
+    start="2016-01-01",
+    end="2016-03-31",
+    properties=None,
+):
+    """returns the value of one variable over the selected dates, from the
+    range totals of the cube
+
+    Parameters
+    ----------
+    hotel_type : string, either "City", "Resort", or "Both
+    y_col:       the variable selected from "y-axis-dropdown"
+    start:       the first date selected from "date-range"
+    end:         the last date selected from "date-range"
+    properties:  the properties selected from "property-selection", None for
+                 every property
+
+    Returns
+    -------
+    float:       the bookings, the mean "Average daily rate" or the sum of the
+                 other variables, nan without bookings
+    """
+    cube, h = _selection(hotel_type, properties)
+    with stage("aggregate"):
+        return float(_range_values(y_col, *range_totals(cube, h, start, end)))
+
+
+@stage("stats")
+def get_range_stats(
+    hotel_type="All",
+    y_col="Reservations",
+    start="2016-01-01",
+    end="2016-03-31",
+    scope="current",
+    properties=None,
+):
+    """creates a string with summary stats of the selected dates, or of as many
+    days just before them, ex) the previous quarter of a quarter
+    Parameters
+    ----------
+    hotel_type : string, either "City", "Resort", or "Both
+    y_col:       the variable selected from "y-axis-dropdown"
+    start:       the first date selected from "date-range"
+    end:         the last date selected from "date-range"
+    scope:       should the stats be for the "current" or the "previous" dates
+    properties:  the properties selected from "property-selection", None for
+                 every property
+    Returns
+    -------
+    string:      ex) "Previous 91 days  Total : 9120,  Daily ave : 100 (selected +12%)"
+    """
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    days = (end - start).days + 1
+    if days <= 0:
+        return "No dates selected"
+    value = get_range_total(hotel_type, y_col, start, end, properties)
+    if scope == "previous":
+        before = start - pd.Timedelta(days=1)
+        current = value
+        value = get_range_total(
+            hotel_type, y_col, before - pd.Timedelta(days=days - 1), before, properties
         )
-    data = data.reset_index()
-    data = pd.melt(data, "Arrival day").rename(
-        columns={"variable": "Line", "value": y_col}
-    )
+        string = f"Previous {days} days  "
+    else:
+        string = f"{start:%Y-%m-%d} to {end:%Y-%m-%d}  "
+    if np.isnan(value):
+        return string + "No bookings"
+    if y_col == "Average daily rate":
+        string += f"Ave : {round(float(value))}"
+    else:
+        string += f"Total : {round(float(value))},  Daily ave : {round(value / days)}"
+    if scope == "previous" and value:
+        string += f" (selected {(current / value - 1) * 100:+.0f}%)"
+    return string
 
-    # filter out feb 29 for non-leap years
-    if (year % 4 != 0) and month == 2:
-        data = data[data["Arrival day"] != 29]
 
-    # get the day of the week for the selected year
-    data["Arrival day of week"] = pd.to_datetime(
-        year * 10000 + month * 100 + data["Arrival day"], format="%Y%m%d"
-    )
-    data["Arrival day of week"] = data["Arrival day of week"].dt.dayofweek
-    data["Arrival day of week"] = data["Arrival day of week"].replace(
-        [0, 1, 2, 3, 4, 5, 6], ["Mon", "Tues", "Wed", "Thur", "Fri", "Sat", "Sun"]
-    )
+def top_countries(hotel_type="All", start=None, stop=None, k=10, properties=None):
+    """returns the countries of origin with the most bookings of a hotel type
+    over a span of months, from the country counts of the cube
 
-    return data
+    Parameters
+    ----------
+    hotel_type : string, either "City", "Resort", or "Both
+    start:       (year, month) of the first month, None from the first booking
+    stop:        (year, month) of the last month, None to the last booking
+    k:           number of countries
+    properties:  the properties selected from "property-selection", None for
+                 every property
+
+    Returns
+    -------
+    dataframe:  the "Country of origin" and "counts" of the top `k` countries
+    """
+    cube, h = _selection(hotel_type, properties)
+    with stage("aggregate"):
+        ids, counts = top_countries_of_cube(cube, h, start, stop, k)
+        df = pd.DataFrame(
+            {
+                "Country of origin": pd.Categorical.from_codes(
+                    ids, list(cube["countries"])
+                ),
+                "counts": counts,
+            }
+        )
+    return df
 
 
-def left_hist_data(hotel_type="All", year=2016, month=1):
+def left_hist_data(hotel_type="All", year=2016, month=1, properties=None):
     """returns a data frame containing binned counts of hotel guests' country of origin
     for the selected hotel type and time period
 
     Parameters
     ----------
     hotel_type : string, either "City", "Resort", or "Both
-    year:        the year selected from "year-dropdown"
-    month:       the month selected from "month-dropdown"
+    year:        the year selected from "year-dropdown", None for all years
+    month:       the month selected from "month-dropdown", None for the whole year
+    properties:  the properties selected from "property-selection", None for
+                 every property
 
     Returns
     -------
     dataframe:  containing binned counts of hotel guests' country of origin
     """
-    df = select_type(hotel_type)
-    df = df[df["Arrival year"] == year]
-    df = df[df["Arrival month"] == month]
-    df = (
-        df.groupby("Country of origin")
-        .size()
-        .reset_index(name="counts")
-        .sort_values(by="counts", ascending=False)[:10]
-    )
-    return df
+    return top_countries(hotel_type, *_month_range(year, month), properties=properties)
 
 
-def right_hist_data(hotel_type="All", year=2016, month=1):
+def _month_range(year, month):
+    """returns the (year, month) pairs of the first and last months of `year`
+    and `month`, None for every year / the whole year
+    """
+    if year is None:
+        return None, None
+    return (year, month or 1), (year, month or 12)
+
+
+def stay_histogram(
+    hotel_type="All", start=None, stop=None, months=None, properties=None
+):
+    """returns the number of bookings per total nights, from the histograms of
+    the cube
+
+    Parameters
+    ----------
+    hotel_type : string, either "City", "Resort", or "Both
+    start:       (year, month) of the first month, None from the first booking
+    stop:        (year, month) of the last month, None to the last booking
+    months:      calendar months to keep, ex) [6, 7, 8], None for every month
+    properties:  the properties selected from "property-selection", None for
+                 every property
+
+    Returns
+    -------
+    array:       bookings staying 0, 1, 2, ... nights
+    """
+    cube, h = _selection(hotel_type, properties)
+    with stage("aggregate"):
+        return stay_histogram_of_cube(cube, h, start, stop, months)
+
+
+def get_stay_quantiles(
+    hotel_type="All",
+    start=None,
+    stop=None,
+    quantiles=(0.25, 0.5, 0.75),
+    properties=None,
+):
+    """returns the quantiles of the total nights of the bookings, ex) the median
+    stay for 0.5, see `stay_histogram()` for the parameters
+
+    Returns
+    -------
+    list:        total nights of each of `quantiles`, None without bookings
+    """
+    histogram = stay_histogram(hotel_type, start, stop, properties=properties)
+    return stay_quantiles(histogram, quantiles)
+
+
+def right_hist_data(hotel_type="All", year=2016, month=1, properties=None):
     """returns a data frame containing binned counts of the duration of guests' stay
     for the selected hotel type and time period
 
     Parameters
     ----------
     hotel_type : string, either "City", "Resort", or "Both
-    year:        the year selected from "year-dropdown"
-    month:       the month selected from "month-dropdown"
+    year:        the year selected from "year-dropdown", None for all years
+    month:       the month selected from "month-dropdown", None for the whole year
+    properties:  the properties selected from "property-selection", None for
+                 every property
 
     Returns
     -------
     dataframe:  containing binned counts of duration of guests' stay
     """
-    df = select_type(hotel_type)
-    # select relevant columns then filter by year and month
-    df = df[["Arrival year", "Arrival month", "Total nights"]]
-    df = df[df["Arrival year"] == year]
-    df = df[df["Arrival month"] == month]
-    # calculate counts for total nights
-    df = (
-        df.groupby("Total nights").count()
-        / df.groupby("Total nights").count().sum()
-        * 100
+    counts = stay_histogram(
+        hotel_type, *_month_range(year, month), properties=properties
     )
-    df = df.reset_index().drop(columns="Arrival year")
-    df.columns = ["Total nights", "Percent of Reservations"]
-
+    with stage("aggregate"):
+        nights = np.flatnonzero(counts)
+        df = pd.DataFrame(
+            {
+                "Total nights": nights,
+                "Percent of Reservations": counts[nights] / counts.sum() * 100,
+            }
+        )
     return df
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
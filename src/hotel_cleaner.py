@@ -3,48 +3,325 @@
 # date: 2021-01-19
 
 '''This script cleans and wrangles the hotels.csv file to be used
-   in a visualization dashboard app
+   in a visualization dashboard app. The result is written both as
+   data/processed/clean_hotels.csv and as the typed column store
+   data/processed/clean_hotels/ (see column_store.py), together with
+   the aggregate cube data/processed/hotel_cube/ (see hotel_cube.py)
 
-Usage: python hotel_cleaner.py
+   The raw file is read in blocks of whole lines, so memory use is
+   bounded by the block size rather than the size of the file, and
+   the blocks can be cleaned by several processes at once. Only the
+   columns the dashboard uses are parsed, with fixed dtypes. The raw
+   file must not have line breaks inside quoted fields.
+
+   Writing the csv takes most of the time, --no-csv skips it as the
+   dashboard reads the column store when there is one.
+
+   Each booking is for a property, the raw property column, or the
+   hotel itself in the original data with its two hotels. The region
+   and portfolio of every property come from the --properties csv,
+   with columns Property, Region and Portfolio, and are written with
+   the hotel type of each property to data/processed/properties.csv.
+
+   The raw files cleaned, with how many bytes of each and their hash,
+   are recorded in data/processed/manifest.json. Running the script
+   again only cleans raw files added since, or the rows appended to
+   the ones already cleaned, and adds them to the outputs; nothing is
+   done when the raw data did not change. A raw file that was edited
+   or removed makes it clean all the raw data again, as does --full.
+
+Usage: python hotel_cleaner.py [--raw RAW [RAW ...]] [--out OUT] [--no-csv]
+                               [--full] [--block-mb BLOCK_MB]
+                               [--processes PROCESSES]
+                               [--properties PROPERTIES]
 
 '''
-import numpy as np
+import argparse
+import hashlib
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 
-# import the data
-hotels = pd.read_csv("data/raw/hotels.csv")
+from column_store import DAYS_OF_WEEK, ColumnWriter, data_digest
+from hotel_cube import (aggregate, cube_aggregate, cube_from_aggregate,
+                        merge_aggregates, read_cube, write_cube)
+
+# raw columns kept -> readable column names, in the order they are written
+COLUMNS = {"hotel": 'Hotel type',
+           "property": 'Property',
+           "is_canceled": 'Cancelled',
+           "arrival_date_year": 'Arrival year',
+           "arrival_date_month": 'Arrival month',
+           "arrival_date_week_number": 'Arrival week',
+           "arrival_date_day_of_month": 'Arrival day',
+           "stays_in_weekend_nights": 'Weekend nights',
+           "stays_in_week_nights": 'Week nights',
+           "adults": 'Adults',
+           "children": 'Children',
+           "babies": 'Babies',
+           "country": 'Country of origin',
+           "booking_changes": 'Booking changes',
+           "adr": 'Average daily rate',
+           "required_car_parking_spaces": 'Required parking spaces',
+           "total_of_special_requests": 'Special requests'}
+# the integer columns are all small, children has missing values
+DTYPES = {raw: "int32" for raw in COLUMNS}
+DTYPES.update({"hotel": "category", "property": "category", "arrival_date_month": "category",
+               "country": "category", "children": "float64", "adr": "float64"})
+CLEAN_COLUMNS = list(COLUMNS.values()) + ["Arrival date", "Arrival day of week", 'Total nights']
 
-# create new columns from other columns
 months = ["January", "February", "March", "April",
-          "May", "June", "July", "August", "September", 
+          "May", "June", "July", "August", "September",
           "October", "November", "December"]
-hotels["arrival_date_month"] = hotels["arrival_date_month"].replace(months,[1,2,3,4,5,6,7,8,9,10,11,12])
-hotels["Arrival date"] = pd.to_datetime(hotels.arrival_date_year*10000 + hotels.arrival_date_month*100 + hotels.arrival_date_day_of_month, 
-                                        format = '%Y%m%d')
-hotels["Arrival day of week"] = hotels["Arrival date"].dt.dayofweek
-hotels["Arrival day of week"] = hotels["Arrival day of week"].replace([0,1,2,3,4,5,6],["Mon", "Tues", "Wed", "Thur", "Fri", "Sat", "Sun"])
-hotels["Total nights"] = hotels["stays_in_weekend_nights"] + hotels["stays_in_week_nights"]
-# drop unused columns
-hotels = hotels.drop(columns=['agent', 'company', 'lead_time',
-                              'market_segment', 'distribution_channel',
-                              'is_repeated_guest', 'previous_cancellations',
-                              'previous_bookings_not_canceled', 'reserved_room_type',
-                              'assigned_room_type','deposit_type',
-                              'days_in_waiting_list', 'customer_type', 'reservation_status', 
-                              'reservation_status_date', 'meal'], )
-# Change values to make more readable
-hotels["hotel"] = hotels["hotel"].replace(["Resort Hotel", "City Hotel"], ["Resort", "City"])
-# change column names to make more readable
-hotels.columns = ['Hotel type', 'Cancelled', 'Arrival year',
-                  'Arrival month', 'Arrival week', 'Arrival day', 'Weekend nights', 
-                  'Week nights', 'Adults', 'Children', 'Babies', 'Country of origin', 
-                  'Booking changes', 'Average daily rate', 'Required parking spaces', 
-                  'Special requests', "Arrival date", "Arrival day of week", 'Total nights']
-                 
-# # create date index column for date slider
-# hotels["arrival_date_index"] = pd.to_numeric(hotels["Arrival date"])/60/60/24/10**9
-# start_date = hotels["arrival_date_index"][0]
-# hotels["arrival_date_index"] -= start_date
-
-#  save to file
-hotels.to_csv("data/processed/clean_hotels.csv", index = False)
\ No newline at end of file
+hotel_names = {"Resort Hotel": "Resort", "City Hotel": "City"}
+# raw files and how much of them has been cleaned, written to the output directory
+MANIFEST = "manifest.json"
+# region and portfolio of the properties, written to the output directory
+PROPERTIES = "properties.csv"
+PROPERTY_COLUMNS = ["Property", "Hotel type", "Region", "Portfolio"]
+# the two hotels of the original data
+DEFAULT_PROPERTIES = {"Resort Hotel": ("Algarve", "Portugal"),
+                      "City Hotel": ("Lisbon", "Portugal")}
+
+
+def clean(hotels):
+    """returns the cleaned dataframe of the raw hotels data `hotels`"""
+    # create new columns from other columns
+    hotels["arrival_date_month"] = (hotels["arrival_date_month"]
+                                    .map({name: i + 1 for i, name in enumerate(months)})
+                                    .astype("int32"))
+    hotels["Arrival date"] = pd.to_datetime(hotels.arrival_date_year*10000 + hotels.arrival_date_month*100 + hotels.arrival_date_day_of_month,
+                                            format = '%Y%m%d')
+    hotels["Arrival day of week"] = pd.Categorical.from_codes(hotels["Arrival date"].dt.dayofweek, DAYS_OF_WEEK)
+    hotels["Total nights"] = hotels["stays_in_weekend_nights"] + hotels["stays_in_week_nights"]
+    if "property" not in hotels:
+        # the raw data of a single property per hotel
+        hotels["property"] = hotels["hotel"].astype(str).astype("category")
+    # Change values to make more readable
+    hotels["hotel"] = hotels["hotel"].cat.rename_categories(lambda name: hotel_names.get(name, name))
+    # change column names to make more readable
+    return hotels.rename(columns=COLUMNS)[CLEAN_COLUMNS]
+
+
+def line_blocks(path, block_bytes, start=None):
+    """returns the (offset, length) byte ranges of blocks of whole lines of the
+    csv file `path`, from `start` or else the line after the header
+    """
+    blocks = []
+    with open(path, "rb") as f:
+        f.readline()
+        offset = f.tell() if start is None else start
+        size = os.fstat(f.fileno()).st_size
+        while offset < size:
+            f.seek(min(offset + block_bytes, size))
+            f.readline()
+            end = f.tell()
+            blocks.append((offset, end - offset))
+            offset = end
+    return blocks
+
+
+def clean_block(path, offset, length, csv=True):
+    """cleans the lines in the byte range `offset`, `length` of the raw csv `path`
+
+    Returns
+    -------
+    tuple:       the cleaned rows as csv text without a header (None unless
+                 `csv`), the cleaned dataframe and its cube aggregate
+    """
+    with open(path, "rb") as f:
+        names = pd.read_csv(f, nrows=0).columns
+        f.seek(offset)
+        block = f.read(length)
+    usecols = [column for column in COLUMNS if column in names]
+    hotels = clean(pd.read_csv(io.BytesIO(block), header=None, names=names,
+                               usecols=usecols, dtype=DTYPES))
+    text = hotels.to_csv(index=False, header=False) if csv else None
+    return text, hotels, aggregate(hotels)
+
+
+def cleaned_blocks(path, blocks, processes, csv=True):
+    """yields the results of `clean_block()` for `blocks` in order, cleaning
+    up to twice `processes` blocks ahead in worker processes
+    """
+    if processes <= 1:
+        for offset, length in blocks:
+            yield clean_block(path, offset, length, csv)
+        return
+    with ProcessPoolExecutor(processes) as pool:
+        pending = deque()
+        for offset, length in blocks:
+            pending.append(pool.submit(clean_block, path, offset, length, csv))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def raw_files(paths):
+    """returns the raw csv files of `paths`, which are files or directories of
+    csv files, in the order they are cleaned
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.endswith(".csv"))
+        else:
+            files.append(path)
+    return files
+
+
+def prefix_sha1(path, length):
+    """returns the sha1 hex digest of the first `length` bytes of `path`"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        while length > 0:
+            block = f.read(min(length, 2**20))
+            if not block:
+                break
+            digest.update(block)
+            length -= len(block)
+    return digest.hexdigest()
+
+
+def read_manifest(out):
+    """returns the manifest of the last run writing to `out`, or None"""
+    try:
+        with open(os.path.join(out, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def plan_update(files, out, csv):
+    """compares the raw `files` with the manifest of the last run
+
+    Returns
+    -------
+    list:        (file, offset) pairs of the raw data to append, offset None
+                 for a whole new file, or None if everything must be cleaned
+                 again because a raw file was changed or removed, or the
+                 outputs are not the ones the manifest describes
+    """
+    manifest = read_manifest(out)
+    columns_path = os.path.join(out, "clean_hotels")
+    csv_path = os.path.join(out, "clean_hotels.csv")
+    if (manifest is None or (manifest["csv"] is not None) != csv
+            or not os.path.exists(os.path.join(columns_path, "schema.json"))
+            or data_digest(columns_path) != manifest["columns"]
+            # cleaned by a version with other columns or cube arrays
+            or read_cube(os.path.join(out, "hotel_cube"), source=manifest["columns"],
+                         mmap=True) is None
+            or (csv and (not os.path.exists(csv_path)
+                         or os.path.getsize(csv_path) < manifest["csv"]))):
+        return None
+    recorded = {entry["path"]: entry for entry in manifest["inputs"]}
+    if not set(recorded) <= set(files):
+        return None
+    plan = []
+    for file in files:
+        entry = recorded.get(file)
+        if entry is None:
+            plan.append((file, None))
+            continue
+        size = os.path.getsize(file)
+        if size < entry["bytes"] or prefix_sha1(file, entry["bytes"]) != entry["sha1"]:
+            return None
+        if size > entry["bytes"]:
+            plan.append((file, entry["bytes"]))
+    return plan
+
+
+def write_properties(cube, out, path=None):
+    """writes the properties of `cube` with their hotel type, region and
+    portfolio, read from the csv `path` if there is one, to `out`
+    """
+    known = {}
+    if path and os.path.exists(path):
+        table = pd.read_csv(path, dtype=str).fillna("Unknown")
+        known = {row.Property: (row.Region, row.Portfolio) for row in table.itertuples()}
+    rows = []
+    for name, hotel in zip(cube["properties"], cube["property_types"]):
+        region, portfolio = known.get(name, DEFAULT_PROPERTIES.get(name, ("Unknown", "Unknown")))
+        rows.append((name, cube["hotels"][hotel + 1], region, portfolio))
+    pd.DataFrame(rows, columns=PROPERTY_COLUMNS).to_csv(os.path.join(out, PROPERTIES), index=False)
+
+
+def main(raw=("data/raw/hotels.csv",), out="data/processed", block_mb=64,
+         processes=1, csv=True, full=False, properties="data/raw/properties.csv"):
+    files = raw_files(raw)
+    manifest = read_manifest(out)
+    plan = None if full else plan_update(files, out, csv)
+    if plan == []:
+        # the regions and portfolios can change without the bookings
+        write_properties(read_cube(os.path.join(out, "hotel_cube")), out, properties)
+        print("The raw data has not changed since the last run")
+        return
+    columns_path = os.path.join(out, "clean_hotels")
+    cube_path = os.path.join(out, "hotel_cube")
+    cube = read_cube(cube_path, source=manifest["columns"]) if plan else None
+    append = cube is not None
+    if not append:
+        plan = [(file, None) for file in files]
+    # the new rows are added to the counts and sums of the existing cube
+    total = cube_aggregate(cube) if append else None
+    inputs = {entry["path"]: entry for entry in manifest["inputs"]} if append else {}
+    # typed binary copy read by the dashboard
+    columns = ColumnWriter(columns_path, append=append)
+    rows_before = columns.rows
+    csv_path = os.path.join(out, "clean_hotels.csv")
+    f = open(csv_path, "a" if append else "w") if csv else None
+    if csv and append:
+        # drops whatever an interrupted run appended after the last manifest
+        f.truncate(manifest["csv"])
+    elif csv:
+        f.write(pd.DataFrame(columns=CLEAN_COLUMNS).to_csv(index=False))
+    for file, start in plan:
+        blocks = line_blocks(file, int(block_mb * 2**20), start)
+        for text, hotels, part in cleaned_blocks(file, blocks, processes, csv):
+            if csv:
+                f.write(text)
+            columns.append(hotels)
+            total = merge_aggregates(total, part)
+        end = sum(blocks[-1]) if blocks else os.path.getsize(file)
+        inputs[file] = {"path": file, "bytes": end, "sha1": prefix_sha1(file, end)}
+    if csv:
+        f.close()
+    columns.close()
+    # aggregates answering the dashboard line plots
+    digest = data_digest(columns_path)
+    cube = cube_from_aggregate(total)
+    write_cube(cube, cube_path, source=digest)
+    write_properties(cube, out, properties)
+    # written last, so an interrupted run is cleaned again in full next time
+    manifest = {"inputs": list(inputs.values()), "columns": digest,
+                "csv": os.path.getsize(csv_path) if csv else None}
+    with open(os.path.join(out, MANIFEST + ".tmp"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(os.path.join(out, MANIFEST + ".tmp"), os.path.join(out, MANIFEST))
+    print(f"{'Appended' if append else 'Cleaned'} {columns.rows - rows_before} rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cleans the raw hotels data for the dashboard")
+    parser.add_argument("--raw", nargs="+", default=["data/raw/hotels.csv"],
+                        help="raw hotels csv files or directories of them")
+    parser.add_argument("--out", default="data/processed", help="output directory")
+    parser.add_argument("--no-csv", dest="csv", action="store_false",
+                        help="only write the column store and the cube")
+    parser.add_argument("--full", action="store_true",
+                        help="clean all the raw data again even if it did not change")
+    parser.add_argument("--block-mb", type=float, default=64,
+                        help="size of the blocks of the raw file cleaned at once")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of processes cleaning blocks at once")
+    parser.add_argument("--properties", default="data/raw/properties.csv",
+                        help="csv of the region and portfolio of each property")
+    args = parser.parse_args()
+    main(args.raw, args.out, args.block_mb, args.processes, args.csv, args.full,
+         args.properties)
@@ -0,0 +1,745 @@
+"""Builds, saves and loads the dense aggregate cube of the cleaned hotels data:
+bookings counted and summed per hotel type x arrival year x month x day, so the
+dashboard can answer its line plots by indexing instead of grouping bookings
+
+The bookings are also counted per hotel type x year x month x country of origin,
+so the top countries of any span of months are found by adding the count
+vectors of its months.
+
+The daily counts and sums are also kept as cumulative sums over consecutive
+days, so the totals of any range of dates are the difference of two rows.
+
+The lengths of stay are counted per hotel type x year x month x total nights,
+one bin per night up to the longest stay, so the histogram and quantiles of
+the stays of any months, years or hotel types are sums of these histograms.
+
+With thousands of properties, dense arrays per property would be mostly zeros,
+so the cube also keeps the same counts and sums per property as sparse tables,
+one row per property and day, property, month and country, and property,
+month and total nights with bookings, sorted by property. The cube of any set
+of properties, see `property_cube()`, adds up the rows of its properties.
+"""
+
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from column_store import DAYS_OF_WEEK, SCHEMA, replace_json
+
+# variables of the "y-axis-dropdown" other than "Reservations", which is the count
+METRICS = [
+    "Average daily rate",
+    "Adults",
+    "Children",
+    "Babies",
+    "Required parking spaces",
+    "Booking changes",
+    "Special requests",
+]
+# index 0 of the hotel axis holds all hotel types together
+HOTELS = ["All"] + SCHEMA["Hotel type"]["categories"]
+# cubes written with another version are built again from the data
+CUBE_VERSION = 6
+# the per-property tables: their key columns, besides "property", and values
+PROPERTY_TABLES = {
+    "day": (["cell"], ["count", "sum"]),
+    "country": (["month", "country"], ["count"]),
+    "stay": (["month", "nights"], ["count"]),
+}
+
+
+def _weekdays(years):
+    """returns the int8 (year, month, day) day of week lookup, -1 for invalid dates"""
+    weekday = np.full((len(years), 12, 31), -1, dtype="int8")
+    dates = pd.date_range(f"{years[0]}-01-01", f"{years[-1]}-12-31")
+    weekday[dates.year - years[0], dates.month - 1, dates.day - 1] = dates.dayofweek
+    return weekday
+
+
+def aggregate(hotels):
+    """counts and sums the bookings of `hotels` per hotel type, year, month and
+    day, the additive part of the cube, so that the aggregates of separate
+    parts of the data can be merged with `merge_aggregates()`
+
+    Parameters
+    ----------
+    hotels :     dataframe with the columns written by `hotel_cleaner.py`
+
+    Returns
+    -------
+    dictionary:  "years", "count" (hotel type, year, month, day), "sum"
+                 (metric, hotel type, year, month, day), "countries" and
+                 "country_count" (hotel type, year, month, country), and
+                 "stay_count" (hotel type, year, month, total nights), without
+                 the "All" type
+    """
+    year = hotels["Arrival year"].to_numpy()
+    years = list(range(int(year.min()), int(year.max()) + 1)) if len(year) else []
+    hotel = pd.Categorical(hotels["Hotel type"], categories=HOTELS[1:]).codes
+    keep = hotel >= 0
+    shape = (len(HOTELS) - 1, len(years), 12, 31)
+    cell = np.ravel_multi_index(
+        (
+            hotel[keep],
+            year[keep] - (years[0] if years else 0),
+            hotels["Arrival month"].to_numpy()[keep] - 1,
+            hotels["Arrival day"].to_numpy()[keep] - 1,
+        ),
+        shape,
+    )
+    size = int(np.prod(shape))
+    count = np.bincount(cell, minlength=size).reshape(shape)
+    sums = np.stack(
+        [
+            np.bincount(
+                cell,
+                weights=np.nan_to_num(hotels[metric].to_numpy(dtype="float64")[keep]),
+                minlength=size,
+            ).reshape(shape)
+            for metric in METRICS
+        ]
+    )
+    country = pd.Categorical(hotels["Country of origin"])
+    codes = country.codes[keep]
+    known = codes >= 0
+    countries = list(country.categories)
+    # the day is the last axis, so the month of a cell is its position // 31
+    month_cell = cell[known] // 31 * len(countries) + codes[known]
+    country_count = np.bincount(
+        month_cell, minlength=size // 31 * len(countries)
+    ).reshape(shape[:3] + (len(countries),))
+    nights = hotels["Total nights"].to_numpy()[keep]
+    bins = int(nights.max()) + 1 if len(nights) else 1
+    stay_count = np.bincount(
+        cell // 31 * bins + nights, minlength=size // 31 * bins
+    ).reshape(shape[:3] + (bins,))
+    part = {
+        "years": years,
+        "count": count,
+        "sum": sums,
+        "countries": countries,
+        "country_count": country_count,
+        "stay_count": stay_count,
+    }
+    part.update(_property_tables(hotels, keep, countries))
+    return part
+
+
+def _group(keys, values):
+    """adds up the `values` of the rows with the same `keys`
+
+    Parameters
+    ----------
+    keys :       list of the non-negative integer key columns
+    values :     list of the value columns, the rows on the last axis
+
+    Returns
+    -------
+    tuple:       the lists of the distinct keys, sorted, and of their values
+    """
+    keys = [np.asarray(key, dtype="int64") for key in keys]
+    if not len(keys[0]):
+        return keys, [np.asarray(value) for value in values]
+    dims = [int(key.max()) + 1 for key in keys]
+    unique, inverse = np.unique(np.ravel_multi_index(keys, dims), return_inverse=True)
+    keys = list(np.unravel_index(unique, dims))
+    grouped = []
+    for value in values:
+        value = np.asarray(value)
+        rows = value.reshape(-1, value.shape[-1])
+        total = np.stack(
+            [np.bincount(inverse, weights=row, minlength=len(unique)) for row in rows]
+        )
+        if value.dtype.kind in "iu":
+            total = total.astype("int64")
+        grouped.append(total.reshape(value.shape[:-1] + (len(unique),)))
+    return keys, grouped
+
+
+def _property_tables(hotels, keep, countries):
+    """returns the per-property tables of `hotels`, see `PROPERTY_TABLES`
+
+    The days and months are counted from year 0, so that the tables of data
+    spanning other years merge without shifting them.
+
+    Returns
+    -------
+    dictionary:  "properties", their "property_types", positions in `HOTELS`
+                 minus 1, and the columns of the tables, ex)
+                 "property_day_cell"
+    """
+    # data cleaned before there were properties has one per hotel type
+    column = "Property" if "Property" in hotels else "Hotel type"
+    prop = pd.Categorical(hotels[column])
+    properties = [str(name) for name in prop.categories]
+    codes = prop.codes[keep]
+    hotel = pd.Categorical(hotels["Hotel type"], categories=HOTELS[1:]).codes[keep]
+    known = codes >= 0
+    codes, hotel = codes[known], hotel[known]
+    year = hotels["Arrival year"].to_numpy()[keep][known].astype("int64")
+    month = year * 12 + hotels["Arrival month"].to_numpy()[keep][known] - 1
+    cell = month * 31 + hotels["Arrival day"].to_numpy()[keep][known] - 1
+    # the type of a property is the one of its first booking
+    types = np.zeros(len(properties), dtype="int8")
+    first = np.unique(codes, return_index=True)
+    types[first[0]] = hotel[first[1]]
+    tables = {"properties": properties, "property_types": types}
+    sums = np.stack(
+        [
+            np.nan_to_num(hotels[metric].to_numpy(dtype="float64")[keep][known])
+            for metric in METRICS
+        ]
+    )
+    ones = np.ones(len(codes), dtype="int64")
+    (tables["property_day_property"], tables["property_day_cell"]), (
+        tables["property_day_count"],
+        tables["property_day_sum"],
+    ) = _group([codes, cell], [ones, sums])
+    country = pd.Categorical(hotels["Country of origin"], categories=countries).codes[
+        keep
+    ][known]
+    has = country >= 0
+    (
+        tables["property_country_property"],
+        tables["property_country_month"],
+        tables["property_country_country"],
+    ), (tables["property_country_count"],) = _group(
+        [codes[has], month[has], country[has]], [ones[has]]
+    )
+    nights = hotels["Total nights"].to_numpy()[keep][known]
+    (
+        tables["property_stay_property"],
+        tables["property_stay_month"],
+        tables["property_stay_nights"],
+    ), (tables["property_stay_count"],) = _group([codes, month, nights], [ones])
+    return tables
+
+
+def _table_columns(table):
+    """returns the names of the columns of a per-property table, see `PROPERTY_TABLES`"""
+    keys, values = PROPERTY_TABLES[table]
+    return [f"property_{table}_{column}" for column in ["property"] + keys + values]
+
+
+def _merge_properties(first, second, countries):
+    """returns the per-property tables of both aggregates, see `_property_tables()`"""
+    properties = sorted(set(first["properties"]) | set(second["properties"]))
+    position = {name: i for i, name in enumerate(properties)}
+    types = np.zeros(len(properties), dtype="int8")
+    merged = {"properties": properties}
+    parts = []
+    for part in [second, first]:
+        remap = np.array([position[name] for name in part["properties"]], dtype="int64")
+        types[remap] = part["property_types"]
+        country_remap = np.array(
+            [countries.index(country) for country in part["countries"]], dtype="int64"
+        )
+        parts.append((part, remap, country_remap))
+    merged["property_types"] = types
+    for table, (keys, values) in PROPERTY_TABLES.items():
+        names = _table_columns(table)
+        columns = []
+        for part, remap, country_remap in parts:
+            column = [np.asarray(part[name]) for name in names]
+            column[0] = remap[column[0]]
+            if table == "country":
+                column[2] = country_remap[column[2]]
+            columns.append(column)
+        merged_keys, merged_values = _group(
+            [np.concatenate([c[i] for c in columns]) for i in range(len(keys) + 1)],
+            [
+                np.concatenate([c[i] for c in columns], axis=-1)
+                for i in range(len(keys) + 1, len(names))
+            ],
+        )
+        merged.update(zip(names, merged_keys + merged_values))
+    return merged
+
+
+def _pad(part, years, countries, bins):
+    """returns the "count", "sum", "country_count" and "stay_count" arrays of
+    `part` spread over `years`, `countries` and `bins` nights
+    """
+    start = years.index(part["years"][0]) if part["years"] else 0
+    stop = start + len(part["years"])
+    count = np.zeros(part["count"].shape[:1] + (len(years), 12, 31), dtype="int64")
+    sums = np.zeros(part["sum"].shape[:2] + (len(years), 12, 31))
+    country_count = np.zeros(
+        part["count"].shape[:1] + (len(years), 12, len(countries)), dtype="int64"
+    )
+    count[:, start:stop] = part["count"]
+    sums[:, :, start:stop] = part["sum"]
+    position = {country: i for i, country in enumerate(countries)}
+    columns = [position[country] for country in part["countries"]]
+    country_count[:, start:stop, :, columns] = part["country_count"]
+    stay_count = np.zeros(
+        part["count"].shape[:1] + (len(years), 12, bins), dtype="int64"
+    )
+    stay_count[:, start:stop, :, : part["stay_count"].shape[-1]] = part["stay_count"]
+    return count, sums, country_count, stay_count
+
+
+def merge_aggregates(first, second):
+    """returns the aggregate of the data of both aggregates `first` and `second`
+    produced by `aggregate()`, either of which can be None
+    """
+    if first is None or not first["years"]:
+        return second
+    if second is None or not second["years"]:
+        return first
+    years = list(
+        range(
+            min(first["years"][0], second["years"][0]),
+            max(first["years"][-1], second["years"][-1]) + 1,
+        )
+    )
+    countries = sorted(set(first["countries"]) | set(second["countries"]))
+    bins = max(first["stay_count"].shape[-1], second["stay_count"].shape[-1])
+    count, sums, country_count, stay_count = _pad(first, years, countries, bins)
+    more_count, more_sums, more_country_count, more_stay_count = _pad(
+        second, years, countries, bins
+    )
+    merged = {
+        "years": years,
+        "count": count + more_count,
+        "sum": sums + more_sums,
+        "countries": countries,
+        "country_count": country_count + more_country_count,
+        "stay_count": stay_count + more_stay_count,
+    }
+    merged.update(_merge_properties(first, second, countries))
+    return merged
+
+
+def cube_aggregate(cube):
+    """returns the aggregate of the data of `cube`, see `aggregate()`, so that
+    new bookings can be added to a cube without reading its data again
+    """
+    if not cube["count"].any():
+        return None
+    part = {
+        "years": list(cube["years"]),
+        "count": cube["count"][1:].astype("int64"),
+        "sum": cube["sum"][:, 1:],
+        "countries": list(cube["countries"]),
+        "country_count": cube["country_count"][1:].astype("int64"),
+        "stay_count": cube["stay_count"][1:].astype("int64"),
+        "properties": list(cube["properties"]),
+        "property_types": np.asarray(cube["property_types"]),
+    }
+    for table in PROPERTY_TABLES:
+        for name in _table_columns(table):
+            part[name] = np.asarray(cube[name])
+    return part
+
+
+def build_cube(hotels):
+    """aggregates the cleaned hotels data into the dense cube
+
+    Parameters
+    ----------
+    hotels :     dataframe with the columns written by `hotel_cleaner.py`
+
+    Returns
+    -------
+    dictionary:  labels ("hotels", "years", "metrics") and arrays, with axes
+                 [metric,] hotel, year, month, day:
+                 "count", "sum" and "mean" per day, "month_count", "month_sum"
+                 and "month_mean" per month, the number of distinct years with
+                 bookings "month_years" (hotel, month) and "day_years"
+                 (hotel, month, day), the "weekday" (year, month, day) lookup,
+                 the "countries" and their "country_count" (hotel, year,
+                 month, country), the cumulative "day_cum_count" (hotel, day) and
+                 "day_cum_sum" (metric, hotel, day) over the days from January
+                 1st of the first year, their first row being 0, the
+                 "stay_count" (hotel, year, month, total nights) histograms,
+                 and the "properties" with their "property_types" and the
+                 per-property tables, see `property_cube()`
+    """
+    return cube_from_aggregate(aggregate(hotels))
+
+
+def cube_from_aggregate(part):
+    """builds the dense cube, see `build_cube()`, from the result of `aggregate()`"""
+    if part is None or not part["years"]:
+        # one year without bookings, any year pandas has dates for
+        part = {
+            "years": [1970],
+            "count": np.zeros((len(HOTELS) - 1, 1, 12, 31), dtype="int64"),
+            "sum": np.zeros((len(METRICS), len(HOTELS) - 1, 1, 12, 31)),
+            "countries": [],
+            "country_count": np.zeros((len(HOTELS) - 1, 1, 12, 0), dtype="int64"),
+            "stay_count": np.zeros((len(HOTELS) - 1, 1, 12, 1), dtype="int64"),
+            "properties": [],
+            "property_types": np.zeros(0, dtype="int8"),
+        }
+        for table, (keys, values) in PROPERTY_TABLES.items():
+            for name in _table_columns(table):
+                part[name] = np.zeros(0, dtype="int64")
+            part[f"property_{table}_sum"] = np.zeros((len(METRICS), 0))
+    # add the "All" hotel type in front of the individual types
+    count, country_count, stay_count = [
+        np.concatenate([part[key].sum(0, keepdims=True), part[key]]).astype("int32")
+        for key in ["count", "country_count", "stay_count"]
+    ]
+    sums = np.concatenate([part["sum"].sum(1, keepdims=True), part["sum"]], axis=1)
+    cube = finish_cube(
+        count, sums, part["years"], country_count, part["countries"], stay_count
+    )
+    cube["properties"] = list(part["properties"])
+    cube["property_types"] = np.asarray(part["property_types"], dtype="int8")
+    for table, (keys, values) in PROPERTY_TABLES.items():
+        for name in _table_columns(table):
+            dtype = "float64" if name.endswith("_sum") else "int32"
+            cube[name] = np.asarray(part[name], dtype=dtype)
+    return cube
+
+
+def _property_rows(column, positions):
+    """returns the rows of a per-property table, sorted by its property
+    `column`, of the properties at `positions`
+    """
+    # of the dtype of `column`, which would be converted otherwise
+    positions = np.asarray(positions, dtype=column.dtype)
+    starts = np.searchsorted(column, positions, side="left")
+    stops = np.searchsorted(column, positions, side="right")
+    lengths = stops - starts
+    # the concatenated ranges start:stop without a python loop
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(
+        ends[-1] if len(ends) else 0
+    )
+
+
+def property_cube(cube, positions):
+    """returns the cube of the bookings of a set of properties, adding up their
+    rows of the per-property tables, whatever the number of bookings
+
+    Parameters
+    ----------
+    cube :       dictionary produced by `build_cube()`
+    positions :  positions of the properties in `cube["properties"]`
+
+    Returns
+    -------
+    dictionary:  a cube with the same arrays as `build_cube()` and the same
+                 years, countries and nights, but only the "All" hotel
+    """
+    years = cube["years"]
+    countries = len(cube["countries"])
+    bins = cube["stay_count"].shape[-1]
+    shape = (len(years), 12, 31)
+    days = int(np.prod(shape))
+    rows = _property_rows(cube["property_day_property"], positions)
+    cell = cube["property_day_cell"][rows] - years[0] * 12 * 31
+    count = np.bincount(
+        cell, weights=cube["property_day_count"][rows], minlength=days
+    ).astype("int32")
+    sums = np.stack(
+        [
+            np.bincount(cell, weights=values[rows], minlength=days)
+            for values in cube["property_day_sum"]
+        ]
+    )
+    rows = _property_rows(cube["property_country_property"], positions)
+    cell = (cube["property_country_month"][rows] - years[0] * 12) * countries
+    cell = cell + cube["property_country_country"][rows]
+    country_count = np.bincount(
+        cell,
+        weights=cube["property_country_count"][rows],
+        minlength=len(years) * 12 * countries,
+    ).astype("int32")
+    rows = _property_rows(cube["property_stay_property"], positions)
+    cell = (cube["property_stay_month"][rows] - years[0] * 12) * bins
+    cell = cell + cube["property_stay_nights"][rows]
+    stay_count = np.bincount(
+        cell,
+        weights=cube["property_stay_count"][rows],
+        minlength=len(years) * 12 * bins,
+    ).astype("int32")
+    selected = finish_cube(
+        count.reshape((1,) + shape),
+        sums.reshape((len(METRICS), 1) + shape),
+        years,
+        country_count.reshape(1, len(years), 12, countries),
+        cube["countries"],
+        stay_count.reshape(1, len(years), 12, bins),
+        cube["weekday"],
+    )
+    selected["hotels"] = HOTELS[:1]
+    return selected
+
+
+def finish_cube(count, sums, years, country_count, countries, stay_count, weekday=None):
+    """derives the monthly, mean and distinct-year arrays from daily counts and
+    sums, with the `weekday` lookup of the years if already known
+    """
+    month_count = count.sum(-1)
+    month_sum = sums.sum(-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, sums / count, np.nan)
+        month_mean = np.where(month_count > 0, month_sum / month_count, np.nan)
+    # the valid dates of the (year, month, day) axes are consecutive days
+    weekday = _weekdays(years) if weekday is None else weekday
+    dates = (weekday >= 0).ravel()
+    day_count = count.reshape(count.shape[0], -1)[:, dates]
+    day_sum = sums.reshape(sums.shape[:2] + (-1,))[:, :, dates]
+    day_cum_count = np.zeros(day_count.shape[:1] + (dates.sum() + 1,), dtype="int64")
+    day_cum_sum = np.zeros(day_sum.shape[:2] + (dates.sum() + 1,))
+    np.cumsum(day_count, axis=-1, out=day_cum_count[:, 1:])
+    np.cumsum(day_sum, axis=-1, out=day_cum_sum[:, :, 1:])
+    return {
+        "hotels": HOTELS,
+        "years": years,
+        "metrics": METRICS,
+        "count": count,
+        "sum": sums,
+        "mean": mean,
+        "month_count": month_count,
+        "month_sum": month_sum,
+        "month_mean": month_mean,
+        "month_years": (month_count > 0).sum(1).astype("int8"),
+        "day_years": (count > 0).sum(1).astype("int8"),
+        "weekday": weekday,
+        "countries": countries,
+        "country_count": country_count,
+        "day_cum_count": day_cum_count,
+        "day_cum_sum": day_cum_sum,
+        "stay_count": stay_count,
+    }
+
+
+def _day_position(cube, date):
+    """returns the position of `date` on the day axis of the cumulative
+    arrays, clipped to the days of the cube
+    """
+    # dates, whose differences do not overflow like those of timestamps
+    first = datetime.date(int(cube["years"][0]), 1, 1)
+    days = (pd.Timestamp(date).date() - first).days
+    return min(max(days, 0), cube["day_cum_count"].shape[-1] - 1)
+
+
+def range_totals(cube, hotel, start, end):
+    """returns the bookings of a hotel type arriving from `start` to `end`,
+    with two lookups in the cumulative arrays whatever the length of the range
+
+    Parameters
+    ----------
+    cube :       dictionary produced by `build_cube()`
+    hotel :      position of the hotel type on the hotel axis of the cube
+    start :      first arrival date, included
+    end :        last arrival date, included
+
+    Returns
+    -------
+    tuple:       the number of bookings, and the array of the sums of every
+                 metric of `METRICS`
+    """
+    first = _day_position(cube, start)
+    last = max(_day_position(cube, pd.Timestamp(end) + pd.Timedelta(days=1)), first)
+    count = cube["day_cum_count"][hotel, last] - cube["day_cum_count"][hotel, first]
+    sums = cube["day_cum_sum"][:, hotel, last] - cube["day_cum_sum"][:, hotel, first]
+    return int(count), sums
+
+
+def daily_range(cube, hotel, start, end):
+    """returns the daily bookings of a hotel type from `start` to `end`, see
+    `range_totals()`, clipped to the days of the cube
+
+    Returns
+    -------
+    tuple:       the dates, the array of the number of bookings per date and
+                 the (metric, date) array of the sums
+    """
+    first = _day_position(cube, start)
+    last = max(_day_position(cube, pd.Timestamp(end) + pd.Timedelta(days=1)), first)
+    counts = np.diff(cube["day_cum_count"][hotel, first : last + 1])
+    sums = np.diff(cube["day_cum_sum"][:, hotel, first : last + 1], axis=-1)
+    dates = pd.date_range(
+        pd.Timestamp(year=int(cube["years"][0]), month=1, day=1)
+        + pd.Timedelta(days=first),
+        periods=last - first,
+    )
+    return dates, counts, sums
+
+
+def write_cube(cube, path, source=None):
+    """writes `cube` to the directory `path`, one `.npy` file per array
+
+    Parameters
+    ----------
+    cube :       dictionary produced by `build_cube()`
+    path :       directory to write the cube into
+    source :     content hash of the cleaned data the cube was built from
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = {"source": source, "version": CUBE_VERSION}
+    for key, value in cube.items():
+        if isinstance(value, np.ndarray):
+            # replaces the file rather than overwriting it, as readers can
+            # have it memory mapped
+            file = os.path.join(path, key + ".npy")
+            with open(file + ".new", "wb") as f:
+                np.save(f, value, allow_pickle=False)
+            os.replace(file + ".new", file)
+        else:
+            meta[key] = value
+    replace_json(meta, os.path.join(path, "cube.json"))
+
+
+def read_cube(path, source=None, mmap=False):
+    """reads the cube written by `write_cube()`
+
+    Parameters
+    ----------
+    path :       cube directory
+    source :     if given, the content hash the cube must have been built from
+    mmap :       whether to memory map the arrays read-only, see `read_columns()`
+
+    Returns
+    -------
+    dictionary:  the cube, or None if there is none at `path` for `source` or
+                 it was written by a version with other arrays
+    """
+    try:
+        with open(os.path.join(path, "cube.json")) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if source is not None and meta.pop("source") != source:
+        return None
+    if meta.pop("version", None) != CUBE_VERSION:
+        return None
+    meta.pop("source", None)
+    for key in os.listdir(path):
+        if key.endswith(".npy"):
+            meta[key[:-4]] = np.load(
+                os.path.join(path, key),
+                mmap_mode="r" if mmap else None,
+                allow_pickle=False,
+            )
+    return meta
+
+
+def day_of_week(cube, year, month, days):
+    """returns the day of week names of `days` in `month` of `year`
+
+    Parameters
+    ----------
+    cube :       dictionary produced by `build_cube()`
+    year:        arrival year
+    month:       arrival month, 1 to 12
+    days:        array of days of the month
+
+    Returns
+    -------
+    list:        ex) ["Mon", "Tues"]
+    """
+    years = cube["years"]
+    if years[0] <= year <= years[-1]:
+        weekday = cube["weekday"][year - years[0], month - 1, np.asarray(days) - 1]
+    else:
+        weekday = pd.to_datetime(
+            year * 10000 + month * 100 + np.asarray(days, dtype=int), format="%Y%m%d"
+        ).dayofweek
+    return [DAYS_OF_WEEK[d] if d >= 0 else None for d in weekday]
+
+
+def _month_span(cube, start, stop):
+    """returns the positions of the months `start` to `stop`, (year, month)
+    pairs or None for the first / last month of the cube, on the flattened
+    year and month axes of the cube
+    """
+    years = cube["years"]
+    first = 0 if start is None else (start[0] - years[0]) * 12 + start[1] - 1
+    last = (
+        len(years) * 12 - 1 if stop is None else (stop[0] - years[0]) * 12 + stop[1] - 1
+    )
+    return max(first, 0), min(last, len(years) * 12 - 1) + 1
+
+
+def _top(ids, counts, k):
+    """returns the `k` items with the largest counts, ties in item order"""
+    ids, counts = ids[counts > 0], counts[counts > 0]
+    if len(counts) > k:
+        # keeps the k-th largest count and everything tied with it
+        kth = np.partition(counts, len(counts) - k)[len(counts) - k]
+        ids, counts = ids[counts >= kth], counts[counts >= kth]
+    order = np.lexsort((ids, -counts))[:k]
+    return ids[order], counts[order]
+
+
+def top_countries(cube, hotel, start=None, stop=None, k=10):
+    """returns the `k` countries of origin with the most bookings of a hotel
+    type arriving from the month `start` to the month `stop`
+
+    Parameters
+    ----------
+    cube :       dictionary produced by `build_cube()`
+    hotel :      position of the hotel type on the hotel axis of the cube
+    start :      (year, month) of the first month, None for the first month
+    stop :       (year, month) of the last month, None for the last month
+    k :          number of countries
+
+    Returns
+    -------
+    tuple:       array of positions in `cube["countries"]` and array of their
+                 counts, by decreasing count
+    """
+    first, last = _month_span(cube, start, stop)
+    countries = len(cube["countries"])
+    if first >= last:
+        return np.zeros(0, dtype="int64"), np.zeros(0, dtype="int64")
+    counts = cube["country_count"][hotel].reshape(-1, countries)[first:last]
+    counts = counts.sum(0, dtype="int64")
+    return _top(np.arange(countries), counts, k)
+
+
+def _months(cube, start=None, stop=None, months=None):
+    """returns the mask of the months from `start` to `stop`, see
+    `top_countries()`, restricted to the calendar `months` if given, on the
+    flattened year and month axes of the cube
+    """
+    first, last = _month_span(cube, start, stop)
+    selected = np.zeros(len(cube["years"]) * 12, dtype=bool)
+    selected[first:last] = True
+    if months is not None:
+        selected &= np.isin(np.arange(len(selected)) % 12 + 1, months)
+    return selected
+
+
+def stay_histogram(cube, hotel, start=None, stop=None, months=None):
+    """returns the number of bookings per total nights of a hotel type
+    arriving from the month `start` to the month `stop`
+
+    Parameters
+    ----------
+    cube :       dictionary produced by `build_cube()`
+    hotel :      position of the hotel type on the hotel axis of the cube, the
+                 "All" hotel type already counting the others
+    start :      (year, month) of the first month, None for the first month
+    stop :       (year, month) of the last month, None for the last month
+    months :     calendar months to keep, 1 to 12, None for every month
+
+    Returns
+    -------
+    array:       bookings staying 0, 1, 2, ... nights
+    """
+    stays = cube["stay_count"][hotel]
+    stays = stays.reshape(-1, stays.shape[-1])[_months(cube, start, stop, months)]
+    return stays.sum(0, dtype="int64")
+
+
+def stay_quantiles(histogram, quantiles):
+    """returns the `quantiles` of the total nights of the bookings counted in
+    `histogram`, the smallest number of nights with at least that share of
+    the bookings staying as long or shorter, None if there are no bookings
+    """
+    total = histogram.sum()
+    if total == 0:
+        return [None for _ in quantiles]
+    cumulative = np.cumsum(histogram)
+    return [int(np.searchsorted(cumulative, q * total, side="left")) for q in quantiles]
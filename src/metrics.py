@@ -0,0 +1,163 @@
+"""Histograms of the time spent in each stage of the dashboard callbacks, of the
+response sizes and of the cache counters, exposed in the Prometheus text format
+
+The data wrangling and chart functions time their stages with `stage()`, which
+labels each observation with the callback being run, set by `timed_callback()`.
+The counts are kept per process: under gunicorn each worker serves its own.
+"""
+
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds of the histogram buckets, in seconds and in bytes
+TIME_BUCKETS = [
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+]
+SIZE_BUCKETS = [2**i for i in range(8, 25, 2)]
+
+HELP = {
+    "dashboard_stage_seconds": (
+        "Time spent in one stage of a callback: load, filter, aggregate, stats, "
+        "chart_build or serialize",
+        TIME_BUCKETS,
+    ),
+    "dashboard_callback_seconds": (
+        "Time to compute the outputs of a callback, including output cache hits",
+        TIME_BUCKETS,
+    ),
+    "dashboard_request_seconds": (
+        "Time to answer a dash callback request, including json serialization",
+        TIME_BUCKETS,
+    ),
+    "dashboard_response_bytes": (
+        "Size of the body of a dash callback response",
+        SIZE_BUCKETS,
+    ),
+}
+
+_histograms = {}  # (name, labels) -> [bucket counts..., sum]
+_lock = threading.Lock()
+_caches = {}
+_callback = contextvars.ContextVar("callback", default="none")
+
+
+def observe(name, value, **labels):
+    """adds `value` to the histogram `name` with `labels`, see `HELP`"""
+    buckets = HELP[name][1]
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        counts = _histograms.get(key)
+        if counts is None:
+            counts = _histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+
+@contextmanager
+def stage(name):
+    """times the enclosed block as the stage `name` of the current callback"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(
+            "dashboard_stage_seconds",
+            time.perf_counter() - start,
+            stage=name,
+            callback=_callback.get(),
+        )
+
+
+def timed_callback(func):
+    """decorates a callback to time it and label the stages it runs with its name"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _callback.set(func.__name__)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            observe(
+                "dashboard_callback_seconds",
+                time.perf_counter() - start,
+                callback=func.__name__,
+            )
+            _callback.reset(token)
+
+    return wrapper
+
+
+def register_cache(name, cache):
+    """exposes the counters of the `callback_cache.LRUCache` `cache` as `name`"""
+    _caches[name] = cache
+
+
+def _labels(labels):
+    """returns the Prometheus label set of `labels`, a sequence of pairs"""
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for k, v in labels
+    )
+    return "{" + pairs + "}"
+
+
+def render():
+    """returns every metric in the Prometheus text exposition format"""
+    with _lock:
+        histograms = {key: list(counts) for key, counts in _histograms.items()}
+    lines = []
+    for name, (help_text, buckets) in HELP.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (metric, labels), counts in sorted(histograms.items()):
+            if metric != name:
+                continue
+            total = 0
+            for bound, count in zip(buckets + ["+Inf"], counts):
+                total += count
+                le = labels + (("le", bound if bound == "+Inf" else repr(bound)),)
+                lines.append(f"{name}_bucket{_labels(le)} {total}")
+            lines.append(f"{name}_sum{_labels(labels)} {counts[-1]!r}")
+            lines.append(f"{name}_count{_labels(labels)} {total}")
+    stats = {name: cache.stats() for name, cache in sorted(_caches.items())}
+    for key, kind, help_text in [
+        ("hits", "counter", "Lookups answered from the cache"),
+        ("misses", "counter", "Lookups not found in the cache"),
+        ("evictions", "counter", "Entries evicted to stay within the cache bounds"),
+        ("entries", "gauge", "Entries in the cache"),
+        ("bytes", "gauge", "Approximate size of the cached entries"),
+    ]:
+        name = f"dashboard_cache_{key}" + ("_total" if kind == "counter" else "")
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for cache, values in stats.items():
+            lines.append(f"{name}{_labels([('cache', cache)])} {values[key]}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """drops every observation, the registered caches are kept"""
+    with _lock:
+        _histograms.clear()
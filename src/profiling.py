@@ -0,0 +1,148 @@
+"""Opt-in CPU and allocation profiling of the dashboard callbacks
+
+Profiling is enabled by naming callbacks in the PROFILE_CALLBACKS environment
+variable ("plot_month,histogram_1", or "all"). A share PROFILE_SAMPLE_RATE of
+their calls, and every call of a request with the "X-Profile: <PROFILE_TOKEN>"
+header if PROFILE_TOKEN is set, is then run under cProfile and tracemalloc,
+and written to PROFILE_DIR:
+
+- `<time>-<callback>-<pid>.prof`, the cProfile stats, ex) for `snakeviz`
+- `<time>-<callback>-<pid>.tracemalloc`, the allocation snapshot
+- `<time>-<callback>-<pid>.json`, the inputs, duration, the functions with the
+  most cumulative time and the lines with the most allocated memory
+
+Only the newest PROFILE_KEEP profiles are kept. Outputs served from the
+callback output cache of `app.py` run nothing to profile. Without
+PROFILE_CALLBACKS, `profiled()` returns the callbacks unchanged.
+"""
+
+import cProfile
+import datetime
+import functools
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+
+from flask import has_request_context, request
+
+PROFILE_CALLBACKS = os.environ.get("PROFILE_CALLBACKS", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0.01"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+# profiles kept in PROFILE_DIR, the oldest are deleted
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "100"))
+# secret the X-Profile header must hold, the header is ignored without it
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_HEADER = "X-Profile"
+PROFILE_FILES = [".prof", ".tracemalloc", ".json"]
+
+# one profile at a time, as tracemalloc traces every thread of the process
+_profiling = threading.Lock()
+
+
+def _selected(name):
+    """returns whether the callback `name` is selected by PROFILE_CALLBACKS"""
+    names = {n.strip() for n in PROFILE_CALLBACKS.split(",") if n.strip()}
+    return "all" in names or name in names
+
+
+def _requested():
+    """returns whether the current request asks to be profiled with the
+    PROFILE_TOKEN
+    """
+    if not PROFILE_TOKEN or not has_request_context():
+        return False
+    token = request.headers.get(PROFILE_HEADER, "")
+    return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+def _top_functions(profile, limit=25):
+    """returns the `limit` functions of `profile` with the most cumulative time"""
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue().splitlines()
+
+
+def _write(name, args, kwargs, elapsed, profile, snapshot, peak):
+    """writes the profile, snapshot and summary of one call to PROFILE_DIR"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S.%f")
+    path = os.path.join(PROFILE_DIR, f"{stamp}-{name}-{os.getpid()}")
+    profile.dump_stats(path + ".prof")
+    snapshot.dump(path + ".tracemalloc")
+    allocations = snapshot.statistics("lineno")[:25]
+    summary = {
+        "callback": name,
+        "args": [repr(arg) for arg in args],
+        "kwargs": {key: repr(value) for key, value in kwargs.items()},
+        "seconds": elapsed,
+        "peak_traced_bytes": peak,
+        "top_cumulative": _top_functions(profile),
+        "top_allocations": [str(stat) for stat in allocations],
+    }
+    with open(path + ".json", "w") as f:
+        json.dump(summary, f, indent=1)
+    _prune()
+    return path
+
+
+def _prune():
+    """deletes the files of all but the newest PROFILE_KEEP profiles"""
+    # the names start with the time of the profile
+    names = sorted(
+        name[: -len(".json")]
+        for name in os.listdir(PROFILE_DIR)
+        if name.endswith(".json")
+    )
+    for name in names[: max(len(names) - PROFILE_KEEP, 0)]:
+        for extension in PROFILE_FILES:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name + extension))
+            except FileNotFoundError:
+                # deleted by another worker
+                pass
+
+
+def _profile_call(func, args, kwargs):
+    """runs `func` under cProfile and tracemalloc and writes the results"""
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if started_tracing:
+            tracemalloc.stop()
+        _write(func.__name__, args, kwargs, elapsed, profile, snapshot, peak)
+
+
+def profiled(func):
+    """decorates a callback to profile a sample of its calls, see the module
+    docstring, returning it unchanged if it is not selected by PROFILE_CALLBACKS
+    """
+    if not _selected(func.__name__):
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if random.random() >= PROFILE_SAMPLE_RATE and not _requested():
+            return func(*args, **kwargs)
+        if not _profiling.acquire(blocking=False):
+            return func(*args, **kwargs)
+        try:
+            return _profile_call(func, args, kwargs)
+        finally:
+            _profiling.release()
+
+    return wrapper
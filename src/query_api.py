@@ -0,0 +1,387 @@
+"""Batched query API: the numbers behind the charts as JSON, without rendering
+them
+
+`POST /api/query` takes a batch of queries, ex)
+
+    {"queries": [
+        {"id": "a", "aggregation": "monthly", "hotel_type": "City",
+         "metric": "Average daily rate", "year": 2016},
+        {"id": "b", "aggregation": "daily", "metric": "Reservations",
+         "start": "2016-01-01", "end": "2016-12-31", "points": 100},
+        {"id": "c", "aggregation": "total", "year": 2017, "month": 7,
+         "properties": ["region:Lisbon"]}
+    ]}
+
+and answers with the results in the order of the queries,
+
+    {"data_version": "...", "results": [
+        {"id": "a", "columns": ["Arrival month", ...], "data": [[1, ...], ...]},
+        {"id": "c", "error": "..."},
+        ...
+    ], "queries": 3, "computed": 3}
+
+each computed by the function of `data_wrangling.py` behind its chart, see
+`AGGREGATIONS`. Every query is checked before any is computed, a bad query
+gets an "error" instead of failing the batch. Queries asking for the same
+numbers, once their properties are resolved, are computed once, and the
+queries of a selection of properties share its cube, see
+`data_wrangling._selection()`. The response is streamed one result at a time,
+so that a large batch is neither held in memory nor delayed until its last
+result.
+
+With `Accept: application/vnd.apache.arrow.stream` and pyarrow installed, the
+response is instead one Arrow IPC stream per query, back to back, each with
+the "id" and any "error" of its query in the schema metadata.
+"""
+
+import calendar
+import datetime
+import itertools
+import json
+import logging
+
+from metrics import timed_callback
+from startup import LazyModule
+
+data_wrangling = LazyModule("data_wrangling")
+logger = logging.getLogger(__name__)
+
+# queries per request at most
+MAX_QUERIES = 1000
+# the years pandas has dates for, whole
+YEARS = (1678, 2261)
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+# aggregation -> the chart it is behind and the fields it takes
+AGGREGATIONS = {
+    "monthly": "`year-plot`, a year by month: year",
+    "daily": "`month-plot`, a month by day: year and month, or `range-plot`, "
+    "dates by day: start, end and optionally points",
+    "total": "a metric over dates: start and end, or year and optionally month",
+    "countries": "`hist1`, the top countries: optionally year, month and limit",
+    "stays": "`hist2`, the nights stayed: optionally year and month",
+}
+
+
+class QueryError(ValueError):
+    """a query that cannot be answered, with the reason as its message"""
+
+
+def _integer(query, field, low, high, default=None):
+    """returns the integer `field` of `query`, between `low` and `high`"""
+    value = query.get(field, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise QueryError(f"{field} should be an integer, not {value!r}")
+    if not low <= value <= high:
+        raise QueryError(f"{field} should be from {low} to {high}, not {value}")
+    return value
+
+
+def _date(query, field):
+    """returns the date `field` of `query`, ex) "2016-01-31" """
+    value = query.get(field)
+    try:
+        date = datetime.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        raise QueryError(f"{field} should be a date like 2016-01-31, not {value!r}")
+    if not YEARS[0] <= date.year <= YEARS[1]:
+        raise QueryError(f"{field} should be from {YEARS[0]} to {YEARS[1]}, not {date}")
+    return date
+
+
+def _dates(query):
+    """returns the first and last dates of `query`: its start and end, or the
+    days of its year or of its month
+    """
+    if "start" in query or "end" in query:
+        start, end = _date(query, "start"), _date(query, "end")
+        if start > end:
+            raise QueryError(f"start {start} is after end {end}")
+        return start, end
+    year = _integer(query, "year", *YEARS)
+    if year is None:
+        raise QueryError("either start and end, or year, are needed")
+    month = _integer(query, "month", 1, 12)
+    if month is None:
+        return datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+    last = calendar.monthrange(year, month)[1]
+    return datetime.date(year, month, 1), datetime.date(year, month, last)
+
+
+def _year_month(query):
+    """returns the year and month of `query`, None for every year / the whole
+    year
+    """
+    year = _integer(query, "year", *YEARS)
+    month = _integer(query, "month", 1, 12)
+    if year is None and month is not None:
+        raise QueryError("month needs a year")
+    return year, month
+
+
+def _months(query):
+    """returns the (year, month) pairs of the first and last months of
+    `query`, None for every year / the whole year
+    """
+    year, month = _year_month(query)
+    if year is None:
+        return None, None
+    return (year, month or 1), (year, month or 12)
+
+
+def plan(query):
+    """returns what answers `query`
+
+    Parameters
+    ----------
+    query :      dictionary with an "aggregation" of `AGGREGATIONS`, a
+                 "hotel_type", "All" by default, a "metric", "Reservations"
+                 by default, "properties", see
+                 `data_wrangling.resolve_properties()`, and the fields of the
+                 aggregation
+
+    Returns
+    -------
+    tuple:       key of the numbers asked for, the same for queries asking for
+                 the same numbers, function of `data_wrangling` computing them
+                 and its keyword arguments
+
+    Raises
+    ------
+    QueryError:  if `query` is not a valid query
+    """
+    if not isinstance(query, dict):
+        raise QueryError(f"a query should be an object, not {query!r}")
+    aggregation = query.get("aggregation")
+    if aggregation not in AGGREGATIONS:
+        raise QueryError(
+            f"aggregation should be one of {', '.join(AGGREGATIONS)}, "
+            f"not {aggregation!r}"
+        )
+    hotel_type = query.get("hotel_type", "All")
+    if hotel_type not in ["All", *data_wrangling.HOTEL_TYPES]:
+        raise QueryError(f"unknown hotel_type {hotel_type!r}")
+    metric = query.get("metric", "Reservations")
+    if metric not in ["Reservations", *data_wrangling.METRICS]:
+        raise QueryError(f"unknown metric {metric!r}")
+    properties = query.get("properties") or None
+    if properties is not None:
+        if not isinstance(properties, list) or not all(
+            isinstance(value, str) for value in properties
+        ):
+            raise QueryError("properties should be a list of strings")
+        unknown = sorted(set(properties) - data_wrangling.property_names())
+        if unknown:
+            raise QueryError(f"unknown properties {', '.join(map(repr, unknown))}")
+        properties = tuple(sorted(set(properties)))
+    kwargs = {"hotel_type": hotel_type, "properties": properties}
+
+    if aggregation == "monthly":
+        function = data_wrangling.get_year_data
+        year = _integer(query, "year", *YEARS)
+        if year is None:
+            raise QueryError("monthly needs a year")
+        kwargs.update(y_col=metric, year=year)
+    elif aggregation == "daily" and "start" not in query and "end" not in query:
+        function = data_wrangling.get_month_data
+        year = _integer(query, "year", *YEARS)
+        month = _integer(query, "month", 1, 12)
+        if year is None or month is None:
+            raise QueryError("daily needs a year and a month, or a start and an end")
+        kwargs.update(y_col=metric, year=year, month=month)
+    elif aggregation == "daily":
+        function = data_wrangling.get_range_data
+        start, end = _dates(query)
+        points = _integer(query, "points", 3, 10**6)
+        kwargs.update(y_col=metric, start=str(start), end=str(end), max_points=points)
+    elif aggregation == "total":
+        function = data_wrangling.get_range_total
+        start, end = _dates(query)
+        kwargs.update(y_col=metric, start=str(start), end=str(end))
+    elif aggregation == "countries":
+        function = data_wrangling.top_countries
+        start, stop = _months(query)
+        limit = _integer(query, "limit", 1, 1000, default=10)
+        kwargs.update(start=start, stop=stop, k=limit)
+    else:
+        function = data_wrangling.right_hist_data
+        year, month = _year_month(query)
+        kwargs.update(year=year, month=month)
+
+    # the same properties can be spelt out in many ways, ex) by region, and
+    # once selected their hotel type no longer matters
+    selected = data_wrangling.resolve_properties(properties, hotel_type)
+    same = {**kwargs, "properties": selected}
+    if selected is not None:
+        same["hotel_type"] = None
+    key = (function.__name__, *sorted(same.items()))
+    return key, function, kwargs
+
+
+@timed_callback
+def api_query(function, kwargs):
+    """returns the result of one query, timed as the "api_query" callback"""
+    return function(**kwargs)
+
+
+def to_frame(result, kwargs):
+    """returns the result of a `data_wrangling` function as a data frame"""
+    import pandas as pd
+
+    if isinstance(result, pd.DataFrame):
+        return result
+    # a total
+    return pd.DataFrame({kwargs["y_col"]: [result]})
+
+
+def _json_body(frame=None, error=None):
+    """returns the json of a result without its id,
+    '"columns":[...],"data":[[...],...]' or '"error":"..."', nan as null
+    """
+    if error is not None:
+        return '"error":' + json.dumps(error)
+    columns = []
+    for name in frame.columns:
+        values = frame[name]
+        if values.dtype.kind == "M":
+            values = values.dt.strftime("%Y-%m-%d")
+        values = values.tolist()
+        if frame[name].dtype.kind == "f":
+            values = [None if value != value else value for value in values]
+        columns.append(values)
+    data = [list(row) for row in zip(*columns)]
+    return json.dumps(
+        {"columns": list(frame.columns), "data": data}, separators=(",", ":")
+    )[1:-1]
+
+
+def _json_result(query_id, body):
+    """returns the json of one result, see the module docstring"""
+    return '{"id":' + json.dumps(query_id) + "," + body + "}"
+
+
+def _arrow_body(frame=None, error=None):
+    """returns the Arrow table of a result, any error in its metadata"""
+    import pyarrow as pa
+
+    if error is not None:
+        return pa.table({}).replace_schema_metadata({"error": error})
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+def _arrow_result(query_id, table):
+    """returns the Arrow IPC stream of one result, see the module docstring"""
+    import pyarrow as pa
+
+    metadata = {"id": json.dumps(query_id)}
+    if table.schema.metadata and b"error" in table.schema.metadata:
+        metadata["error"] = table.schema.metadata[b"error"]
+    table = table.replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# format -> encoding of a result, shared by the queries asking for it, and of
+# the result of one query
+FORMATS = {
+    "json": (_json_body, _json_result),
+    "arrow": (_arrow_body, _arrow_result),
+}
+
+
+def _results(queries, plans, form):
+    """yields the result of every query in order in the format `form`,
+    computing and encoding the results shared by several queries once and
+    keeping them until their last query
+    """
+    encode, wrap = FORMATS[form]
+    remaining = {}
+    for planned in plans:
+        if not isinstance(planned, QueryError):
+            remaining[planned[0]] = remaining.get(planned[0], 0) + 1
+    done = {}
+    for query, planned in zip(queries, plans):
+        query_id = query.get("id") if isinstance(query, dict) else None
+        if isinstance(planned, QueryError):
+            yield wrap(query_id, encode(error=str(planned)))
+            continue
+        key, function, kwargs = planned
+        if key not in done:
+            try:
+                done[key] = encode(to_frame(api_query(function, kwargs), kwargs))
+            except QueryError as error:
+                done[key] = encode(error=str(error))
+            except Exception:
+                logger.exception("query %r failed", query)
+                raise
+        body = done[key]
+        remaining[key] -= 1
+        if not remaining[key]:
+            del done[key]
+        yield wrap(query_id, body)
+
+
+def _stream_json(queries, plans):
+    """yields the json response in pieces, see the module docstring"""
+    version = data_wrangling.data_version()
+    results = _results(queries, plans, "json")
+    # the first result is computed before anything is sent, see `answer()`
+    first = next(results, "")
+    yield '{"data_version":' + json.dumps(version) + ',"results":[' + first
+    for result in results:
+        yield "," + result
+    computed = len({planned[0] for planned in plans if isinstance(planned, tuple)})
+    yield f'],"queries":{len(queries)},"computed":{computed}}}'
+
+
+def _error(status, message):
+    """returns the response of a request that cannot be answered"""
+    return status, "application/json", json.dumps({"error": message})
+
+
+def answer(body, accept=""):
+    """returns the response to a batch of queries
+
+    Parameters
+    ----------
+    body :       the json body of the request, {"queries": [...]}
+    accept :     the Accept header of the request, for the Arrow format
+
+    Returns
+    -------
+    tuple:       status code, media type and the body, a string or an
+                 iterator of pieces of it
+
+    A query failing with anything but a `QueryError` is a bug: it is logged,
+    and answered with a 500 if it is the first query computed, else it ends
+    the response before its end, which is then not valid.
+    """
+    queries = body.get("queries") if isinstance(body, dict) else None
+    if not isinstance(queries, list):
+        return _error(400, 'the body should be a json object like {"queries": [...]}')
+    if len(queries) > MAX_QUERIES:
+        return _error(400, f"at most {MAX_QUERIES} queries per request")
+    arrow = ARROW_STREAM in accept
+    if arrow:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return _error(406, "the Arrow format needs pyarrow, ask for json instead")
+    plans = []
+    for query in queries:
+        try:
+            plans.append(plan(query))
+        except QueryError as error:
+            plans.append(error)
+    if arrow:
+        pieces, mimetype = _results(queries, plans, "arrow"), ARROW_STREAM
+    else:
+        pieces, mimetype = _stream_json(queries, plans), "application/json"
+    try:
+        first = next(pieces, None)
+    except Exception:
+        return _error(500, "internal error, see the logs of the server")
+    return 200, mimetype, itertools.chain([] if first is None else [first], pieces)
@@ -0,0 +1,82 @@
+"""Content hashes of the dash callback responses, so that outputs the browser
+already has are not sent again
+
+Every `_dash-update-component` response gets an `ETag`, the hash of its body,
+and an `X-Dash-Output-Hashes` header with the hash of each output. The fetch
+wrapper of `assets/revalidation.js` sends back
+
+- `If-None-Match` with the ETag of the last response to the same request,
+  answered with an empty 304 response if the body would be the same, and
+- `X-Dash-Outputs` with the hashes of the outputs the page holds, whose
+  values are replaced by `{UNCHANGED: hash}` markers when they did not change.
+
+The wrapper puts the values it holds back before dash reads the response.
+Clients without the wrapper send neither header and get full responses.
+"""
+
+import hashlib
+import json
+
+from werkzeug.http import parse_etags
+
+UNCHANGED = "__dash_unchanged__"
+OUTPUTS_HEADER = "X-Dash-Outputs"
+HASHES_HEADER = "X-Dash-Output-Hashes"
+
+
+def content_hash(data):
+    """returns the short hex digest of the bytes `data`"""
+    return hashlib.sha1(data).hexdigest()[:20]
+
+
+def _known_outputs(headers):
+    """returns the "id.property" -> hash dictionary sent by the browser"""
+    try:
+        known = json.loads(headers.get(OUTPUTS_HEADER) or "{}")
+    except ValueError:
+        return {}
+    return known if isinstance(known, dict) else {}
+
+
+def revalidate(response, headers):
+    """adds the content hashes to a dash callback response, and answers with a
+    304, or with markers for the outputs given unchanged by the request
+    `headers`
+
+    Parameters
+    ----------
+    response :   Flask response of a `_dash-update-component` request
+    headers :    headers of the request
+
+    Returns
+    -------
+    the response to send
+    """
+    if response.status_code != 200 or response.mimetype != "application/json":
+        return response
+    from plotly.utils import PlotlyJSONEncoder  # slow to import, see `startup.py`
+
+    body = response.get_data()
+    etag = content_hash(body)
+    if parse_etags(headers.get("If-None-Match")).contains(etag):
+        response = response.__class__(status=304)
+    response.set_etag(etag)
+    response.vary.update(["If-None-Match", OUTPUTS_HEADER])
+    if response.status_code == 304:
+        return response
+    payload = json.loads(body)
+    known = _known_outputs(headers)
+    hashes = {}
+    unchanged = 0
+    for component, props in payload.get("response", {}).items():
+        for prop, value in props.items():
+            output = f"{component}.{prop}"
+            text = json.dumps(value, cls=PlotlyJSONEncoder, sort_keys=True)
+            hashes[output] = content_hash(text.encode())
+            if known.get(output) == hashes[output]:
+                props[prop] = {UNCHANGED: hashes[output]}
+                unchanged += 1
+    response.headers[HASHES_HEADER] = json.dumps(hashes)
+    if unchanged:
+        response.set_data(json.dumps(payload, cls=PlotlyJSONEncoder))
+    return response
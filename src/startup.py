@@ -0,0 +1,77 @@
+"""Cold start of the dashboard
+
+Importing pandas, altair and the data wrangling modules takes most of the time
+to import `app.py`, and none of them is needed to serve the layout. `app.py`
+refers to them through `LazyModule`, imported when a callback first uses them,
+and with STARTUP_WARM `warm_in_background()` imports them, reads the data and
+builds the chart templates in a thread as soon as the app is imported, ahead
+of the first chart request.
+
+`cold_start.py` checks the time to import the app, to serve the first layout
+and to serve the first chart against a budget.
+"""
+
+import importlib
+import logging
+import os
+import threading
+import time
+
+STARTUP_WARM = os.environ.get("STARTUP_WARM", "1") == "1"
+# reports of the start of the app, ex) of WARM_CACHE, for the server to log
+logger = logging.getLogger(__name__)
+
+timings = {}  # warm-up step -> seconds
+
+
+class LazyModule:
+    """stands for the module `name`, imported on first attribute access
+
+    Parameters
+    ----------
+    name :       name of the module, ex) "data_wrangling"
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def load(self):
+        """returns the module, importing it if it was not yet"""
+        # thread-safe, and only a lookup in `sys.modules` once imported
+        return importlib.import_module(self._name)
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+
+def _run(steps):
+    """runs the warm-up `steps`, recording their time in `timings`"""
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - start
+
+
+def warm_in_background(steps):
+    """runs `steps` one after the other in a daemon thread
+
+    A fork waits for the thread to finish, so that forked processes, ex) the
+    gunicorn workers of `--preload`, inherit everything it loaded and none of
+    the locks it could hold.
+
+    Parameters
+    ----------
+    steps :      list of (name, function) pairs, the time of each is kept in
+                 `timings`
+
+    Returns
+    -------
+    the started thread
+    """
+    thread = threading.Thread(target=_run, args=(steps,), name="warm-up", daemon=True)
+    thread.start()
+    os.register_at_fork(before=thread.join)
+    return thread
@@ -0,0 +1,174 @@
+"""Exports every state of the dashboard as static files, to serve read-only
+viewers from any static file server without a Python backend
+
+The outputs of the chart callbacks are computed for every input the controls
+can produce, see `app.input_space()`, in a process pool, see `warmup.py`. Each
+state of a chart is written as two fragments, `<callback>/<n>.html`, the chart
+page, and `<callback>/<n>.json`, its stats strings by element id. `index.json`
+lists the controls and the fragment of every state, and the shell of
+`static_shell`, `index.html` and `shell.js`, swaps the fragments in when the
+controls change. The date range chart is not exported, its inputs are not
+finite, and the charts are exported for all the properties of each hotel type,
+as there are too many subsets of properties.
+
+Usage: python static_export.py [--out OUT] [--processes PROCESSES]
+
+ex) python src/static_export.py --out export
+    python -m http.server --directory export
+"""
+
+import argparse
+import inspect
+import json
+import os
+import shutil
+import time
+
+from warmup import compute
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+SHELL = os.path.join(SRC, "static_shell")
+# the callbacks exported, and the controls of their inputs
+EXPORTED = ["plot_year", "plot_month", "histogram_1", "histogram_2"]
+CONTROLS = ["hotel-type-selection", "y-axis-dropdown"]
+
+
+def state_key(args):
+    """returns the key of the input values `args` in `index.json`, the way
+    `shell.js` writes it with `JSON.stringify`
+    """
+    return json.dumps(list(args), separators=(",", ":"), ensure_ascii=False)
+
+
+def _views(dash_app, names):
+    """returns callback name -> ids of its inputs, chart and stats elements,
+    read from the callbacks registered in `dash_app`
+    """
+    views = {}
+    for output, spec in dash_app.callback_map.items():
+        name = spec["callback"].__name__
+        if name in names:
+            ids = [part.rsplit(".", 1)[0] for part in output.strip(".").split("...")]
+            views[name] = {
+                "inputs": [item["id"] for item in spec["inputs"]],
+                "chart": ids[0],
+                "texts": ids[1:],
+                "states": {},
+            }
+    return views
+
+
+def _controls(app):
+    """returns the options and initial value of each control"""
+    layout = app.app.layout
+    controls = {
+        control: {
+            "options": [
+                {"label": str(option["label"]).strip(), "value": option["value"]}
+                for option in layout[control].options
+            ],
+            "value": layout[control].value,
+        }
+        for control in CONTROLS
+    }
+    # the years of the data, see `update_data_bounds()`
+    options, value, _, _ = inspect.unwrap(app.update_data_bounds)(None, None)
+    controls["year-dropdown"] = {
+        "options": [{"label": str(o["label"]), "value": o["value"]} for o in options],
+        "value": value,
+    }
+    # every property, see `app.input_space()`
+    controls["property-selection"] = {"options": [], "value": []}
+    # the month options depend on the year, see `update_date_dropdown()`
+    months = inspect.unwrap(app.update_date_dropdown)
+    controls["month-dropdown"] = {
+        "options": {
+            str(option["value"]): months(option["value"]) for option in options
+        },
+        "value": layout["month-dropdown"].value,
+    }
+    return controls
+
+
+def _write(path, text):
+    """writes `text` to `path`, returning the number of bytes written"""
+    data = text.encode()
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def export(out, processes=None):
+    """writes the static export of the dashboard to the directory `out`
+
+    Parameters
+    ----------
+    out :        directory of the export, created if needed
+    processes :  number of processes rendering the charts, the number of
+                 CPUs if None
+
+    Returns
+    -------
+    dictionary:  the number of "states", of "files" and of "bytes" written,
+                 and the wall time in "seconds"
+    """
+    # the fragments are html pages, and every chart is computed once
+    os.environ["CHART_MODE"] = "iframe"
+    os.environ.pop("BACKGROUND_CALLBACKS", None)
+    os.environ["STARTUP_WARM"] = "0"
+    import app
+
+    start = time.perf_counter()
+    app.data_version()  # read the data before forking the pool
+    space = app.input_space()
+    space = {name: space[name] for name in EXPORTED}
+    callbacks = {name: app.chart_callbacks[name] for name in EXPORTED}
+    views = _views(app.app, EXPORTED)
+    paths = {
+        (name, args): f"{name}/{i}"
+        for name, cases in space.items()
+        for i, args in enumerate(cases)
+    }
+    for name in EXPORTED:
+        os.makedirs(os.path.join(out, name), exist_ok=True)
+    files = written = 0
+    for name, args, outputs in compute(callbacks, space, processes):
+        path = paths[name, args]
+        chart, *texts = outputs if isinstance(outputs, tuple) else (outputs,)
+        written += _write(os.path.join(out, path + ".html"), chart)
+        files += 1
+        if texts:
+            fragment = dict(zip(views[name]["texts"], texts))
+            written += _write(os.path.join(out, path + ".json"), json.dumps(fragment))
+            files += 1
+        views[name]["states"][state_key(args)] = path
+    index = {"controls": _controls(app), "views": views}
+    written += _write(os.path.join(out, "index.json"), json.dumps(index))
+    for name in os.listdir(SHELL):
+        shutil.copy(os.path.join(SHELL, name), out)
+        written += os.path.getsize(os.path.join(out, name))
+    return {
+        "states": len(paths),
+        "files": files + 1 + len(os.listdir(SHELL)),
+        "bytes": written,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Exports the dashboard as static files"
+    )
+    parser.add_argument("--out", default="export", help="directory of the export")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="processes rendering the charts, the number of CPUs by default",
+    )
+    args = parser.parse_args()
+    report = export(args.out, args.processes)
+    print(
+        f"Exported {report['states']} states as {report['files']} files, "
+        f"{report['bytes'] / 2**20:.1f} MB, in {report['seconds']:.1f} s to {args.out}"
+    )
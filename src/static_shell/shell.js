@@ -0,0 +1,124 @@
+// Shows the static export of the dashboard, see src/static_export.py.
+//
+// index.json lists the controls with their options and, for every chart, the
+// ids of its inputs and outputs and the fragment of each combination of input
+// values. A change of the controls points each chart iframe at the html
+// fragment of the new values and fills its stats from the json fragment.
+(function () {
+  var state = {}; // control id -> selected value
+  var index = null;
+
+  function option(label, value) {
+    var element = document.createElement("option");
+    element.textContent = label;
+    element.value = JSON.stringify(value);
+    return element;
+  }
+
+  function fillSelect(id, options) {
+    var select = document.getElementById(id);
+    var values = options.map(function (o) {
+      return JSON.stringify(o.value);
+    });
+    select.innerHTML = "";
+    options.forEach(function (o) {
+      select.appendChild(option(o.label, o.value));
+    });
+    if (values.indexOf(JSON.stringify(state[id])) === -1 && options.length) {
+      state[id] = options[0].value;
+    }
+    select.value = JSON.stringify(state[id]);
+  }
+
+  function fillRadio(id, options) {
+    var container = document.getElementById(id);
+    options.forEach(function (o) {
+      var label = document.createElement("label");
+      var input = document.createElement("input");
+      input.type = "radio";
+      input.name = id;
+      input.checked = o.value === state[id];
+      input.addEventListener("change", function () {
+        state[id] = o.value;
+        update();
+      });
+      label.style.fontWeight = "normal";
+      label.appendChild(input);
+      label.appendChild(document.createTextNode(" " + o.label));
+      container.appendChild(label);
+    });
+  }
+
+  function fillMonths() {
+    var months = index.controls["month-dropdown"];
+    fillSelect("month-dropdown", months.options[String(state["year-dropdown"])] || []);
+  }
+
+  function show(view) {
+    var key = JSON.stringify(
+      view.inputs.map(function (id) {
+        return state[id];
+      })
+    );
+    var path = view.states[key];
+    var chart = document.getElementById(view.chart);
+    if (!path) {
+      chart.removeAttribute("src");
+      chart.srcdoc =
+        '<p style="font-family: sans-serif; color: gray; text-align: center">' +
+        "No data</p>";
+      view.texts.forEach(function (id) {
+        document.getElementById(id).textContent = "";
+      });
+      return;
+    }
+    chart.removeAttribute("srcdoc");
+    chart.src = path + ".html";
+    if (view.texts.length) {
+      fetch(path + ".json")
+        .then(function (response) {
+          return response.json();
+        })
+        .then(function (texts) {
+          if (chart.getAttribute("src") !== path + ".html") {
+            return; // the controls changed in the meantime
+          }
+          view.texts.forEach(function (id) {
+            document.getElementById(id).textContent = texts[id];
+          });
+        });
+    }
+  }
+
+  function update() {
+    Object.keys(index.views).forEach(function (name) {
+      show(index.views[name]);
+    });
+  }
+
+  fetch("index.json")
+    .then(function (response) {
+      return response.json();
+    })
+    .then(function (data) {
+      index = data;
+      Object.keys(index.controls).forEach(function (id) {
+        state[id] = index.controls[id].value;
+      });
+      fillRadio("hotel-type-selection", index.controls["hotel-type-selection"].options);
+      ["y-axis-dropdown", "year-dropdown"].forEach(function (id) {
+        fillSelect(id, index.controls[id].options);
+      });
+      fillMonths();
+      ["y-axis-dropdown", "year-dropdown", "month-dropdown"].forEach(function (id) {
+        document.getElementById(id).addEventListener("change", function (event) {
+          state[id] = JSON.parse(event.target.value);
+          if (id === "year-dropdown") {
+            fillMonths();
+          }
+          update();
+        });
+      });
+      update();
+    });
+})();
@@ -0,0 +1,410 @@
+"""Generates synthetic hotel bookings with the columns of the raw `hotels.csv`,
+at any number of rows, to measure how the dashboard scales
+
+The distributions follow the published hotel booking demand data: two thirds
+of the bookings are for the city hotel, arrivals peak in the summer (more so at
+the resort), resort stays are longer with a peak at a week, a few countries of
+origin dominate with a long tail, and rates follow the seasons of each hotel.
+
+With --properties, the bookings of each hotel type are spread over that many
+properties in all, of very different sizes, in a `property` column, and the
+region and portfolio of every property are written to `properties.csv` next
+to the bookings, see `hotel_cleaner.py`.
+
+Usage: python synthetic_hotels.py [--rows ROWS] [--out OUT] [--seed SEED]
+                                  [--properties PROPERTIES]
+
+ex) python src/synthetic_hotels.py --rows 1M --out data/raw/hotels.csv
+    python src/synthetic_hotels.py --rows 1M --properties 5000
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = [
+    "hotel",
+    "is_canceled",
+    "lead_time",
+    "arrival_date_year",
+    "arrival_date_month",
+    "arrival_date_week_number",
+    "arrival_date_day_of_month",
+    "stays_in_weekend_nights",
+    "stays_in_week_nights",
+    "adults",
+    "children",
+    "babies",
+    "meal",
+    "country",
+    "market_segment",
+    "distribution_channel",
+    "is_repeated_guest",
+    "previous_cancellations",
+    "previous_bookings_not_canceled",
+    "reserved_room_type",
+    "assigned_room_type",
+    "booking_changes",
+    "deposit_type",
+    "agent",
+    "company",
+    "days_in_waiting_list",
+    "customer_type",
+    "adr",
+    "required_car_parking_spaces",
+    "total_of_special_requests",
+    "reservation_status",
+    "reservation_status_date",
+]
+MONTHS = [
+    "January",
+    "February",
+    "March",
+    "April",
+    "May",
+    "June",
+    "July",
+    "August",
+    "September",
+    "October",
+    "November",
+    "December",
+]
+# same date range as the original data
+FIRST_DATE = "2015-07-01"
+LAST_DATE = "2017-08-31"
+BLOCK_ROWS = 500_000
+
+HOTELS = {"City Hotel": 0.664, "Resort Hotel": 0.336}
+# relative arrivals per month, the resort being more seasonal than the city hotel
+SEASON = {
+    "City Hotel": [0.6, 0.8, 0.9, 1.0, 1.05, 1.0, 1.05, 1.1, 1.0, 1.0, 0.7, 0.65],
+    "Resort Hotel": [0.6, 0.75, 0.85, 0.95, 0.95, 0.95, 1.3, 1.5, 1.0, 1.05, 0.7, 0.8],
+}
+TREND = {2015: 0.8, 2016: 1.0, 2017: 1.1}
+# share of bookings staying 0, 1, 2, ... 14 nights, longer stays are in the tail
+# fmt: off
+NIGHTS = {
+    "City Hotel": [0.005, 0.2, 0.27, 0.25, 0.14, 0.06, 0.03, 0.02,
+                   0.008, 0.005, 0.004, 0.003, 0.002, 0.001, 0.002],
+    "Resort Hotel": [0.01, 0.19, 0.13, 0.13, 0.11, 0.08, 0.05, 0.14,
+                     0.02, 0.02, 0.03, 0.02, 0.01, 0.01, 0.05],
+}
+# fmt: on
+# monthly base rate of each hotel
+RATES = {
+    "City Hotel": [80, 85, 92, 110, 120, 118, 112, 110, 110, 100, 88, 88],
+    "Resort Hotel": [48, 52, 56, 75, 77, 108, 152, 185, 98, 62, 48, 68],
+}
+TOP_COUNTRIES = {
+    "PRT": 0.407,
+    "GBR": 0.102,
+    "FRA": 0.087,
+    "ESP": 0.072,
+    "DEU": 0.061,
+    "ITA": 0.032,
+    "IRL": 0.028,
+    "BEL": 0.020,
+    "BRA": 0.019,
+    "NLD": 0.018,
+    "USA": 0.018,
+    "CHE": 0.014,
+    "CN": 0.011,
+    "AUT": 0.011,
+    "SWE": 0.009,
+    "CHN": 0.008,
+    "POL": 0.008,
+    "ISR": 0.006,
+    "RUS": 0.005,
+    "NOR": 0.005,
+}
+# the rest of the bookings come from these countries, with decreasing shares
+OTHER_COUNTRIES = (
+    "ROU FIN DNK AUS AGO LUX MAR TUR HUN ARG JPN CZE IND KOR GRC DZA SRB HRV MEX "
+    "IRN EST LTU ZAF BGR NZL COL UKR CHL SVN LVA CYP ISL SVK THA NGA TWN SGP IDN "
+    "PHL MYS EGY URY PER LBN SAU VEN ARE TUN BLR QAT MOZ KAZ CPV JOR CMR KWT GEO "
+    "AZE OMN ECU BIH MKD MLT PAK CRI PRI BOL DOM ALB AND ARM BGD CUB GIB IRQ LKA "
+    "PAN VNM ZWE KEN SEN SUR TZA GHA CIV SYR MUS GNB JAM KHM UZB"
+).split()
+MISSING_COUNTRY = 0.004
+
+CHOICES = {
+    "adults": ([0, 1, 2, 3, 4], [0.003, 0.19, 0.75, 0.055, 0.002]),
+    "children": ([0, 1, 2, 3], [0.928, 0.041, 0.03, 0.001]),
+    "babies": ([0, 1, 2], [0.992, 0.0077, 0.0003]),
+    "meal": (["BB", "HB", "SC", "Undefined", "FB"], [0.773, 0.121, 0.089, 0.01, 0.007]),
+    "market_segment": (
+        [
+            "Online TA",
+            "Offline TA/TO",
+            "Groups",
+            "Direct",
+            "Corporate",
+            "Complementary",
+            "Aviation",
+        ],
+        [0.473, 0.203, 0.166, 0.106, 0.044, 0.006, 0.002],
+    ),
+    "deposit_type": (
+        ["No Deposit", "Non Refund", "Refundable"],
+        [0.876, 0.122, 0.002],
+    ),
+    "customer_type": (
+        ["Transient", "Transient-Party", "Contract", "Group"],
+        [0.751, 0.21, 0.034, 0.005],
+    ),
+    "reserved_room_type": (
+        ["A", "D", "E", "F", "G", "B", "C", "H"],
+        [0.72, 0.161, 0.055, 0.024, 0.018, 0.01, 0.008, 0.004],
+    ),
+    "booking_changes": ([0, 1, 2, 3, 4, 5], [0.849, 0.106, 0.032, 0.008, 0.003, 0.002]),
+    "total_of_special_requests": (
+        [0, 1, 2, 3, 4, 5],
+        [0.589, 0.278, 0.109, 0.021, 0.0027, 0.0003],
+    ),
+}
+CANCELLED = {"City Hotel": 0.417, "Resort Hotel": 0.278}
+PARKING = {"City Hotel": 0.025, "Resort Hotel": 0.14}
+REGIONS = [
+    "Algarve",
+    "Lisbon",
+    "Porto",
+    "Madeira",
+    "Azores",
+    "Madrid",
+    "Barcelona",
+    "Seville",
+    "Valencia",
+    "Paris",
+    "Nice",
+    "Rome",
+    "Milan",
+    "London",
+    "Berlin",
+]
+PORTFOLIOS = ["Coastal", "Urban", "Boutique", "Family", "Business", "Luxury"]
+CHANNELS = {
+    "Online TA": "TA/TO",
+    "Offline TA/TO": "TA/TO",
+    "Groups": "TA/TO",
+    "Direct": "Direct",
+    "Corporate": "Corporate",
+    "Complementary": "Direct",
+    "Aviation": "Corporate",
+}
+
+
+def parse_rows(rows):
+    """returns the number of rows of a count like "100k", "1M" or "250000" """
+    scale = {"k": 10**3, "m": 10**6}.get(str(rows)[-1].lower(), 1)
+    return int(float(str(rows).rstrip("kKmM")) * scale)
+
+
+def _countries():
+    """returns the countries of origin and their probabilities"""
+    tail = 1 / np.arange(1, len(OTHER_COUNTRIES) + 1) ** 1.3
+    tail *= (1 - MISSING_COUNTRY - sum(TOP_COUNTRIES.values())) / tail.sum()
+    names = list(TOP_COUNTRIES) + OTHER_COUNTRIES + ["NULL"]
+    probabilities = list(TOP_COUNTRIES.values()) + list(tail) + [MISSING_COUNTRY]
+    return np.array(names, dtype=object), np.array(probabilities)
+
+
+def _arrival_weights(dates, hotel):
+    """returns the probability of arriving on each of `dates` at `hotel`"""
+    weight = np.array(SEASON[hotel])[dates.month - 1]
+    weight = weight * np.array([TREND[y] for y in dates.year])
+    # a few more arrivals at the end of the week
+    weight = weight * np.where(dates.dayofweek >= 4, 1.1, 1.0)
+    weight = weight / np.asarray(dates.days_in_month)
+    return weight / weight.sum()
+
+
+def _choice(rng, name, n):
+    """returns `n` random values of the column `name` from its `CHOICES`"""
+    values, probabilities = CHOICES[name]
+    probabilities = np.array(probabilities) / np.sum(probabilities)
+    return np.array(values)[rng.choice(len(values), n, p=probabilities)]
+
+
+def property_table(properties):
+    """returns the properties of `generate()`, with their hotel, region and
+    portfolio, the same for the same number of properties
+    """
+    rng = np.random.default_rng(properties)
+    names, hotels = [], []
+    for name, share in HOTELS.items():
+        k = max(int(round(properties * share)), 1)
+        names += [f"{name[0]}{i:05d}" for i in range(1, k + 1)]
+        hotels += [name] * k
+    return pd.DataFrame(
+        {
+            "Property": names,
+            "hotel": hotels,
+            "Region": np.array(REGIONS)[rng.integers(0, len(REGIONS), len(names))],
+            "Portfolio": np.array(PORTFOLIOS)[
+                rng.integers(0, len(PORTFOLIOS), len(names))
+            ],
+        }
+    )
+
+
+def _properties(rng, hotel, table):
+    """returns a property of `table` for each booking of `hotel`, the bookings
+    of a hotel type going to few large and many small properties
+    """
+    chosen = np.empty(len(hotel), dtype=object)
+    for name in HOTELS:
+        names = table["Property"][table["hotel"] == name].to_numpy()
+        share = 1 / np.arange(1, len(names) + 1) ** 0.8
+        rows = hotel == name
+        chosen[rows] = names[rng.choice(len(names), rows.sum(), p=share / share.sum())]
+    return chosen
+
+
+def generate(n, seed=0, properties=0):
+    """returns `n` synthetic bookings with the columns of the raw `hotels.csv`
+
+    Parameters
+    ----------
+    n :          number of bookings
+    seed :       seed of the random numbers, the same seed gives the same data
+    properties : number of properties, see `property_table()`, 0 for no
+                 `property` column
+
+    Returns
+    -------
+    dataframe:   synthetic raw hotels data
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(FIRST_DATE, LAST_DATE)
+    hotel = np.where(rng.random(n) < HOTELS["City Hotel"], "City Hotel", "Resort Hotel")
+    arrival = np.empty(n, dtype="datetime64[ns]")
+    nights = np.empty(n, dtype="int64")
+    adr = np.empty(n)
+    cancelled = np.empty(n, dtype="int64")
+    parking = np.empty(n, dtype="int64")
+    for name in HOTELS:
+        rows = hotel == name
+        k = int(rows.sum())
+        day = dates[rng.choice(len(dates), k, p=_arrival_weights(dates, name))]
+        arrival[rows] = day.values
+        share = np.array(NIGHTS[name]) / np.sum(NIGHTS[name])
+        stay = rng.choice(len(share), k, p=share)
+        # the last bucket is the tail of long stays
+        long_stay = stay == len(share) - 1
+        stay[long_stay] += rng.geometric(0.15, long_stay.sum()) - 1
+        nights[rows] = stay
+        rate = np.array(RATES[name])[day.month - 1] * (1 + 0.05 * (day.year - 2016))
+        adr[rows] = rate * rng.gamma(16, 1 / 16, k)
+        cancelled[rows] = rng.random(k) < CANCELLED[name]
+        parking[rows] = (rng.random(k) < PARKING[name]) * (1 + (rng.random(k) < 0.01))
+    arrival = pd.DatetimeIndex(arrival)
+    # nights of Saturday and Sunday count as weekend nights
+    weekday = arrival.dayofweek.values
+    weekend = np.zeros(n, dtype="int64")
+    for night in range(int(nights.max()) + 1 if n else 0):
+        weekend += (night < nights) & ((weekday + night) % 7 >= 5)
+
+    adults = _choice(rng, "adults", n)
+    children = _choice(rng, "children", n).astype("float64")
+    children[rng.random(n) < 3e-5] = np.nan
+    babies = _choice(rng, "babies", n)
+    adr = np.round(adr * (1 + 0.15 * np.nan_to_num(children)), 2)
+    lead_time = np.minimum(rng.exponential(104, n), 737).astype("int64")
+    segment = _choice(rng, "market_segment", n)
+    reserved = _choice(rng, "reserved_room_type", n)
+    upgraded = rng.random(n) < 0.12
+    assigned = np.where(upgraded, _choice(rng, "reserved_room_type", n), reserved)
+    countries, shares = _countries()
+    no_show = rng.random(n) < 0.03
+    status = np.where(
+        cancelled == 1, np.where(no_show, "No-Show", "Canceled"), "Check-Out"
+    )
+    status_date = np.where(
+        cancelled == 1,
+        arrival - pd.to_timedelta(rng.integers(0, lead_time + 1), unit="D"),
+        arrival + pd.to_timedelta(nights, unit="D"),
+    )
+    waiting = np.where(rng.random(n) < 0.03, rng.exponential(50, n), 0).astype("int64")
+    repeated = (rng.random(n) < 0.032).astype("int64")
+    agent = np.where(rng.random(n) < 0.86, rng.integers(1, 536, n).astype(str), "NULL")
+    company = np.where(
+        rng.random(n) < 0.06, rng.integers(6, 544, n).astype(str), "NULL"
+    )
+    hotels = pd.DataFrame(
+        {
+            "hotel": hotel,
+            "is_canceled": cancelled,
+            "lead_time": lead_time,
+            "arrival_date_year": arrival.year,
+            "arrival_date_month": np.array(MONTHS)[arrival.month - 1],
+            "arrival_date_week_number": arrival.isocalendar().week.values,
+            "arrival_date_day_of_month": arrival.day,
+            "stays_in_weekend_nights": weekend,
+            "stays_in_week_nights": nights - weekend,
+            "adults": adults,
+            "children": children,
+            "babies": babies,
+            "meal": _choice(rng, "meal", n),
+            "country": countries[
+                rng.choice(len(countries), n, p=shares / shares.sum())
+            ],
+            "market_segment": segment,
+            "distribution_channel": pd.Series(segment).map(CHANNELS).values,
+            "is_repeated_guest": repeated,
+            "previous_cancellations": repeated * rng.poisson(0.1, n),
+            "previous_bookings_not_canceled": repeated * rng.poisson(3, n),
+            "reserved_room_type": reserved,
+            "assigned_room_type": assigned,
+            "booking_changes": _choice(rng, "booking_changes", n),
+            "deposit_type": _choice(rng, "deposit_type", n),
+            "agent": agent,
+            "company": company,
+            "days_in_waiting_list": waiting,
+            "customer_type": _choice(rng, "customer_type", n),
+            "adr": adr,
+            "required_car_parking_spaces": parking,
+            "total_of_special_requests": _choice(rng, "total_of_special_requests", n),
+            "reservation_status": status,
+            "reservation_status_date": pd.DatetimeIndex(status_date).strftime(
+                "%Y-%m-%d"
+            ),
+        },
+        columns=COLUMNS,
+    )
+    if properties:
+        hotels.insert(
+            1, "property", _properties(rng, hotel, property_table(properties))
+        )
+    return hotels
+
+
+def write_hotels(n, path, seed=0, properties=0):
+    """writes `n` synthetic bookings to the csv file `path`, in blocks of
+    `BLOCK_ROWS` rows so that the memory used does not grow with `n`, and
+    the `properties.csv` of their properties if any
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        for block, start in enumerate(range(0, max(n, 1), BLOCK_ROWS)):
+            rows = generate(min(BLOCK_ROWS, n - start), [seed, block], properties)
+            f.write(rows.to_csv(index=False, header=block == 0, na_rep="NA"))
+    if properties:
+        table = property_table(properties).drop(columns="hotel")
+        table.to_csv(os.path.join(os.path.dirname(path), "properties.csv"), index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates synthetic raw hotels data")
+    parser.add_argument("--rows", default="100k", help="ex) 100k, 1M or 10M")
+    parser.add_argument(
+        "--out", default="data/raw/hotels.csv", help="csv file to write"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--properties", type=int, default=0, help="number of properties, ex) 5000"
+    )
+    args = parser.parse_args()
+    write_hotels(parse_rows(args.rows), args.out, args.seed, args.properties)
@@ -0,0 +1,134 @@
+"""Warm-up of the callback output cache, before the first user asks for a chart
+
+The inputs of the chart callbacks only take a few hundred values: the hotel
+types, the `columns` and the months with data. `warm()` computes the outputs of
+every one of them in a pool of processes forked from the server, so that they
+share its loaded data, and puts them in the cache of the memoized callbacks.
+
+With WARM_CACHE=1, `app.py` warms its cache when it starts. Run gunicorn with
+`--preload` so that the workers are forked with the warm cache rather than each
+warming their own. To time the warm-up and measure its memory:
+
+    python src/warmup.py --processes 4
+"""
+
+import argparse
+import inspect
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+WARM_CACHE = os.environ.get("WARM_CACHE", "0") == "1"
+# inputs computed by one task of the pool
+BATCH_SIZE = 16
+
+_functions = {}  # callback name -> undecorated function run by the pool
+
+
+def _compute(name, batch):
+    """returns the outputs of the callback `name` for each inputs of `batch`"""
+    return [_functions[name](*args) for args in batch]
+
+
+def _peak_rss(who):
+    """returns the peak resident memory of `who`, a `resource.RUSAGE_*`, in bytes"""
+    return resource.getrusage(who).ru_maxrss * 1024  # kilobytes on Linux
+
+
+def compute(callbacks, space, processes=None):
+    """computes the outputs of `callbacks` for every input in `space` in a
+    process pool
+
+    The data must be loaded before, for the pool processes to inherit it.
+
+    Parameters
+    ----------
+    callbacks :  dictionary of callback name -> callback, run without its
+                 decorators
+    space :      dictionary of callback name -> list of input tuples
+    processes :  number of processes of the pool, the number of CPUs if None
+
+    Returns
+    -------
+    generator of (callback name, input tuple, outputs), in the order they
+    are computed
+    """
+    _functions.update(
+        {name: inspect.unwrap(callback) for name, callback in callbacks.items()}
+    )
+    batches = [
+        (name, cases[i : i + BATCH_SIZE])
+        for name, cases in space.items()
+        for i in range(0, len(cases), BATCH_SIZE)
+    ]
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(processes, mp_context=context) as pool:
+        futures = {pool.submit(_compute, *batch): batch for batch in batches}
+        for future in as_completed(futures):
+            name, batch = futures[future]
+            for args, value in zip(batch, future.result()):
+                yield name, args, value
+
+
+def warm(callbacks, space, processes=None):
+    """computes the outputs of the memoized `callbacks` for every input in
+    `space` in a process pool, and puts them in their cache, see `compute()`
+
+    Parameters
+    ----------
+    callbacks :  dictionary of callback name -> callback decorated with
+                 `callback_cache.memoize`, under decorators keeping its
+                 attributes with `functools.wraps`
+    space :      dictionary of callback name -> list of input tuples
+    processes :  number of processes of the pool, the number of CPUs if None
+
+    Returns
+    -------
+    dictionary:  the number of "outputs", the wall time in "seconds", the
+                 "cache" statistics, the peak resident memory of the server in
+                 "server_peak_bytes" and of the largest pool process in
+                 "worker_peak_bytes"
+    """
+    start = time.perf_counter()
+    for name, args, value in compute(callbacks, space, processes):
+        callbacks[name].prime(value, *args)
+    caches = {id(func.cache): func.cache for func in callbacks.values()}
+    return {
+        "outputs": sum(len(cases) for cases in space.values()),
+        "seconds": time.perf_counter() - start,
+        "cache": [cache.stats() for cache in caches.values()],
+        "server_peak_bytes": _peak_rss(resource.RUSAGE_SELF),
+        "worker_peak_bytes": _peak_rss(resource.RUSAGE_CHILDREN),
+    }
+
+
+def describe(report):
+    """returns a one line summary of the `report` of `warm()`"""
+    cached = sum(stats["bytes"] for stats in report["cache"])
+    evicted = sum(stats["evictions"] for stats in report["cache"])
+    return (
+        f"warmed {report['outputs']} outputs in {report['seconds']:.1f} s, "
+        f"cache {cached / 2**20:.1f} MB ({evicted} evicted), "
+        f"peak memory {report['server_peak_bytes'] / 2**20:.0f} MB server, "
+        f"{report['worker_peak_bytes'] / 2**20:.0f} MB per pool process"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="processes of the pool, the number of CPUs by default",
+    )
+    args = parser.parse_args()
+    from app import warm_chart_cache
+
+    print(describe(warm_chart_cache(args.processes)))
+
+
+if __name__ == "__main__":
+    main()
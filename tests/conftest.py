@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# the modules of `src` import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+
+@pytest.fixture(scope="session")
+def dashboard_data(tmp_path_factory):
+    """returns a directory with synthetic bookings cleaned into the
+    `data/processed` the dashboard reads from it
+    """
+    import hotel_cleaner
+    from synthetic_hotels import write_hotels
+
+    root = tmp_path_factory.mktemp("dashboard")
+    raw = root / "data" / "raw"
+    write_hotels(4000, str(raw / "hotels.csv"), seed=5, properties=40)
+    hotel_cleaner.main(
+        raw=[str(raw / "hotels.csv")],
+        out=str(root / "data" / "processed"),
+        properties=str(raw / "properties.csv"),
+    )
+    return root
@@ -0,0 +1,135 @@
+import json
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import background
+
+
+class Executor:
+    """stands for the process pool, the tests run the queued jobs themselves"""
+
+    def __init__(self):
+        self.queued = []
+
+    def submit(self, func, key):
+        self.queued.append(key)
+        return Future()
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(background, "JOB_DB", str(tmp_path / "jobs.sqlite"))
+    executor = Executor()
+    monkeypatch.setattr(background, "_executor", lambda: executor)
+    monkeypatch.setitem(background._callbacks, "square", lambda x: x * x)
+    return executor
+
+
+def watchers(key):
+    db = background._connect()
+    try:
+        return db.execute("SELECT watchers FROM jobs WHERE key = ?", (key,)).fetchone()[
+            0
+        ]
+    finally:
+        db.close()
+
+
+def backdate(key, seconds):
+    db = background._connect()
+    try:
+        db.execute(
+            "UPDATE jobs SET updated = updated - ? WHERE key = ?", (seconds, key)
+        )
+    finally:
+        db.close()
+
+
+def test_job_runs_once_for_every_page(jobs):
+    key = background.job_key("square", [3], "v1")
+    background.submit(key, "square", [3])
+    background.submit(key, "square", [3])
+    assert jobs.queued == [key]
+    assert background.job_status(key) == ("queued", None, 0)
+    assert watchers(key) == 2
+    background.run_job(key)
+    status, result, _ = background.job_status(key)
+    assert (status, json.loads(result)) == ("done", 9)
+
+
+def test_failed_job_keeps_its_error(jobs):
+    key = background.job_key("square", ["x"], "v1")
+    background.submit(key, "square", [None])
+    background.run_job(key)
+    status, error, _ = background.job_status(key)
+    assert status == "failed" and "TypeError" in error
+
+
+def test_job_is_cancelled_when_nobody_waits(jobs):
+    key = background.job_key("square", [4], "v1")
+    background.submit(key, "square", [4])
+    background.submit(key, "square", [4])
+    background.release(key)
+    assert background.job_status(key)[0] == "queued"
+    background.release(key)
+    assert background.job_status(key)[0] == "cancelled"
+    # a cancelled job does not run
+    background.run_job(key)
+    assert background.job_status(key)[0] == "cancelled"
+
+
+def test_requeued_job_counts_every_page(jobs):
+    key = background.job_key("square", [5], "v1")
+    background.submit(key, "square", [5])
+    background.submit(key, "square", [5])
+    # the job was lost, ex) its worker died, and a third page asks for it
+    backdate(key, background.JOB_TIMEOUT + 1)
+    background.submit(key, "square", [5])
+    assert jobs.queued == [key, key]
+    assert watchers(key) == 3
+    background.release(key)
+    assert background.job_status(key)[0] == "queued"
+
+
+def test_old_finished_job_is_queued_again(jobs):
+    key = background.job_key("square", [6], "v1")
+    background.submit(key, "square", [6])
+    background.run_job(key)
+    backdate(key, background.JOB_TTL + 1)
+    background.submit(key, "square", [6])
+    assert background.job_status(key) == ("queued", None, 0)
+    assert jobs.queued == [key, key]
+
+
+def test_missing_job(jobs):
+    assert background.job_status("nothing") == ("missing", None, 0)
+
+
+def test_poll_queues_a_cancelled_job_again(jobs):
+    placeholder = lambda message: [message]
+    version = lambda: "v1"
+    state = background._poll("square", [7], {}, placeholder, version, 1)[-1]
+    key = state["key"]
+    # the job is cancelled, ex) by another page releasing it
+    background.release(key)
+    assert background.job_status(key)[0] == "cancelled"
+    outputs = background._poll("square", [7], state, placeholder, version, 1)
+    assert background.job_status(key)[0] == "queued"
+    assert outputs[-1]["waiting"]
+    background.run_job(key)
+    outputs = background._poll("square", [7], state, placeholder, version, 1)
+    assert outputs[0] == 49 and outputs[-1]["status"] == "done"
+
+
+def test_poll_survives_a_deleted_job(jobs):
+    placeholder = lambda message: [message]
+    version = lambda: "v1"
+    state = background._poll("square", [8], {}, placeholder, version, 1)[-1]
+    db = background._connect()
+    db.execute("DELETE FROM jobs")
+    db.close()
+    outputs = background._poll("square", [8], state, placeholder, version, 1)
+    assert background.job_status(state["key"])[0] == "queued"
+    assert outputs[-1]["status"] == "Queued"
@@ -0,0 +1,114 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import column_store
+import hotel_cleaner
+from column_store import SORT_COLUMNS, read_columns, read_index
+from hotel_cube import read_cube
+from synthetic_hotels import generate, write_hotels
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # several blocks even for a few thousand rows
+    monkeypatch.setattr(column_store, "BLOCK_ROWS", 700)
+
+
+def write_raw(n, path, seed):
+    """writes synthetic raw bookings to `path`, and their properties next to
+    the raw directory, where they are not taken for raw bookings
+    """
+    write_hotels(n, str(path), seed=seed, properties=30)
+    os.replace(path.parent / "properties.csv", path.parent.parent / "properties.csv")
+
+
+def clean(raw, out, full=False):
+    hotel_cleaner.main(
+        raw=[str(raw)],
+        out=str(out),
+        block_mb=0.05,
+        full=full,
+        properties=str(raw.parent / "properties.csv"),
+    )
+
+
+def assert_same_output(first, second):
+    for name in ["clean_hotels.csv", "properties.csv"]:
+        with open(first / name) as f, open(second / name) as g:
+            assert f.read() == g.read(), name
+    with open(first / "clean_hotels" / "schema.json") as f:
+        schema = json.load(f)
+    with open(second / "clean_hotels" / "schema.json") as f:
+        assert json.load(f) == schema
+    for path in [first, second]:
+        assert read_index(str(path / "clean_hotels")) is not None
+    np.testing.assert_array_equal(
+        np.load(first / "clean_hotels" / "row_index.npy"),
+        np.load(second / "clean_hotels" / "row_index.npy"),
+    )
+    cube = read_cube(str(first / "hotel_cube"))
+    other = read_cube(str(second / "hotel_cube"))
+    assert cube.keys() == other.keys()
+    for name, values in cube.items():
+        if isinstance(values, np.ndarray) and values.dtype.kind == "f":
+            # the sums of the appended rows are added in another order
+            np.testing.assert_allclose(values, other[name], rtol=1e-12, err_msg=name)
+        elif isinstance(values, np.ndarray):
+            np.testing.assert_array_equal(values, other[name], err_msg=name)
+        else:
+            assert values == other[name], name
+
+
+def test_incremental_clean_matches_full_clean(tmp_path):
+    raw = tmp_path / "raw"
+    write_raw(3000, raw / "a.csv", seed=1)
+    clean(raw, tmp_path / "incremental")
+    # rows appended to a cleaned file and a new file
+    more = generate(1000, seed=2, properties=30)
+    with open(raw / "a.csv", "a") as f:
+        f.write(more.to_csv(index=False, header=False, na_rep="NA"))
+    write_raw(2000, raw / "b.csv", seed=3)
+    clean(raw, tmp_path / "incremental")
+    clean(raw, tmp_path / "full", full=True)
+    assert_same_output(tmp_path / "incremental", tmp_path / "full")
+
+
+def test_rows_are_sorted_by_day_and_stable(tmp_path):
+    raw = tmp_path / "raw"
+    write_raw(5000, raw / "a.csv", seed=4)
+    clean(raw, tmp_path / "out")
+    hotels = read_columns(str(tmp_path / "out" / "clean_hotels"))
+    written = pd.read_csv(tmp_path / "out" / "clean_hotels.csv")
+    # the csv keeps the rows in raw order
+    written["Hotel type"] = pd.Categorical(
+        written["Hotel type"], categories=hotels["Hotel type"].cat.categories
+    )
+    expected = written.sort_values(SORT_COLUMNS, kind="stable")
+    for column in ["Adults", "Total nights", "Arrival day", "Arrival year"]:
+        np.testing.assert_array_equal(hotels[column], expected[column])
+    np.testing.assert_allclose(
+        hotels["Average daily rate"], expected["Average daily rate"], rtol=1e-6
+    )
+    # every cell of the index covers the rows of its day
+    index = read_index(str(tmp_path / "out" / "clean_hotels"))
+    offsets = index["offsets"]
+    cells = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    hotel, year, month, day = np.unravel_index(
+        cells, (len(index["hotels"]), len(index["years"]), 12, 31)
+    )
+    assert (hotels["Hotel type"].cat.codes == hotel).all()
+    assert (hotels["Arrival year"] == np.array(index["years"])[year]).all()
+    assert (hotels["Arrival month"] == month + 1).all()
+    assert (hotels["Arrival day"] == day + 1).all()
+
+
+def test_sort_needs_no_rows(tmp_path):
+    column_store.write_columns(
+        pd.DataFrame(columns=hotel_cleaner.CLEAN_COLUMNS),
+        str(tmp_path / "empty"),
+    )
+    assert read_columns(str(tmp_path / "empty")).empty
@@ -0,0 +1,195 @@
+import json
+
+import pytest
+
+import data_wrangling
+import query_api
+
+
+@pytest.fixture
+def data(dashboard_data, monkeypatch):
+    monkeypatch.chdir(dashboard_data)
+    data_wrangling.invalidate_cache()
+    data_wrangling._selections.clear()
+    yield
+    data_wrangling.invalidate_cache()
+    data_wrangling._selections.clear()
+
+
+def ask(queries, accept=""):
+    status, mimetype, body = query_api.answer({"queries": queries}, accept)
+    if not isinstance(body, str):
+        body = "".join(body)
+    return status, json.loads(body)
+
+
+@pytest.mark.parametrize(
+    "query, error",
+    [
+        ({"aggregation": "median"}, "aggregation should be one of"),
+        ({"aggregation": "monthly"}, "monthly needs a year"),
+        ({"aggregation": "monthly", "year": "2016"}, "year should be an integer"),
+        ({"aggregation": "monthly", "year": True}, "year should be an integer"),
+        ({"aggregation": "daily", "year": 2016}, "daily needs a year and a month"),
+        ({"aggregation": "daily", "year": 2016, "month": 13}, "month should be from"),
+        ({"aggregation": "daily", "year": 1, "month": 1}, "year should be from 1678"),
+        (
+            {"aggregation": "total", "start": "0001-01-01", "end": "2016-01-01"},
+            "start should be from 1678",
+        ),
+        ({"aggregation": "total"}, "either start and end, or year"),
+        ({"aggregation": "total", "start": "2016-02-01"}, "end should be a date"),
+        (
+            {"aggregation": "total", "start": "2016-02-01", "end": "2016-01-01"},
+            "is after end",
+        ),
+        ({"aggregation": "stays", "month": 7}, "month needs a year"),
+        ({"aggregation": "countries", "limit": 0}, "limit should be from"),
+        (
+            {"aggregation": "monthly", "year": 2016, "hotel_type": "Hostel"},
+            "hotel_type",
+        ),
+        ({"aggregation": "monthly", "year": 2016, "metric": "Pets"}, "unknown metric"),
+        (
+            {"aggregation": "total", "year": 2016, "properties": "region:Lisbon"},
+            "properties should be a list",
+        ),
+        (
+            {"aggregation": "total", "year": 2016, "properties": ["P-none"]},
+            "unknown properties 'P-none'",
+        ),
+        (
+            {"aggregation": "total", "year": 2016, "properties": ["region:Atlantis"]},
+            "unknown properties 'region:Atlantis'",
+        ),
+        ("monthly", "a query should be an object"),
+    ],
+)
+def test_bad_query_gets_an_error(data, query, error):
+    good = {"id": "good", "aggregation": "total", "year": 2016}
+    if isinstance(query, dict):
+        query = {"id": "bad", **query}
+    status, response = ask([good, query, good])
+    assert status == 200
+    first, bad, last = response["results"]
+    assert error in bad["error"]
+    assert "columns" not in bad
+    assert first["id"] == last["id"] == "good" and "data" in first
+    assert response["queries"] == 3 and response["computed"] == 1
+
+
+def test_unknown_property_among_known_ones(data):
+    known = data_wrangling.load_properties()["Property"][0]
+    query = {"aggregation": "total", "year": 2016, "properties": [known, "P-none"]}
+    _, response = ask([query])
+    assert response["results"][0]["error"] == "unknown properties 'P-none'"
+
+
+@pytest.mark.parametrize(
+    "body", [None, [], {"query": []}, {"queries": {"aggregation": "total"}}]
+)
+def test_bad_body(data, body):
+    status, mimetype, text = query_api.answer(body)
+    assert status == 400 and mimetype == "application/json"
+    assert "error" in json.loads(text)
+
+
+def test_too_many_queries(data):
+    queries = [{"aggregation": "total", "year": 2016}] * (query_api.MAX_QUERIES + 1)
+    status, _, text = query_api.answer({"queries": queries})
+    assert status == 400 and "at most" in json.loads(text)["error"]
+
+
+def test_arrow_needs_pyarrow(data):
+    try:
+        import pyarrow  # noqa: F401
+
+        pytest.skip("pyarrow is installed")
+    except ImportError:
+        pass
+    status, _, text = query_api.answer({"queries": []}, accept=query_api.ARROW_STREAM)
+    assert status == 406 and "pyarrow" in json.loads(text)["error"]
+
+
+def test_same_numbers_are_computed_once(data):
+    table = data_wrangling.load_properties()
+    region = table["Region"][0]
+    ids = sorted(table["Property"][table["Region"] == region])
+    total = {"aggregation": "total", "year": 2016}
+    queries = [
+        {"id": 1, **total},
+        {"id": 2, **total, "metric": "Reservations", "hotel_type": "All"},
+        {"id": 3, **total, "properties": [f"region:{region}"]},
+        {"id": 4, **total, "properties": ids},
+        # the hotel type of a selection of properties does not change its numbers
+        {"id": 5, **total, "properties": ids, "hotel_type": "All"},
+        {"id": 6, "aggregation": "total", "start": "2016-01-01", "end": "2016-12-31"},
+        {"id": 7, "aggregation": "stays", "year": 2016},
+        {"id": 8, "aggregation": "stays", "year": 2016, "month": None},
+    ]
+    status, response = ask(queries)
+    assert status == 200
+    results = response["results"]
+    assert [result["id"] for result in results] == list(range(1, 9))
+    assert response["computed"] == 3
+    assert results[0]["data"] == results[1]["data"] == results[5]["data"]
+    assert results[2]["data"] == results[3]["data"] == results[4]["data"]
+    assert results[6]["data"] == results[7]["data"]
+
+
+def test_results_match_the_charts(data):
+    queries = [
+        {"aggregation": "monthly", "hotel_type": "City", "year": 2016},
+        {"aggregation": "daily", "year": 2016, "month": 2, "metric": "Adults"},
+        {"aggregation": "total", "year": 2016, "month": 2, "metric": "Adults"},
+        {"aggregation": "countries", "year": 2016, "limit": 3},
+    ]
+    _, response = ask(queries)
+    year, month, total, countries = response["results"]
+    expected = data_wrangling.get_year_data("City", "Reservations", 2016)
+    assert year["columns"] == list(expected.columns)
+    assert len(year["data"]) == len(expected)
+    days = data_wrangling.get_range_data("All", "Adults", "2016-02-01", "2016-02-29")
+    assert total["data"] == [[pytest.approx(days["Adults"].sum())]]
+    assert len(month["data"]) == 2 * 29  # the average and the year of leap 2016
+    assert len(countries["data"]) == 3
+
+
+def test_nan_is_null(data):
+    # no booking arrives that far in the future, so there is no average rate
+    query = {"aggregation": "total", "year": 2030, "metric": "Average daily rate"}
+    _, response = ask([query])
+    assert response["results"][0]["data"] == [[None]]
+
+
+@pytest.mark.parametrize("year", query_api.YEARS)
+def test_years_far_from_the_data(data, year):
+    queries = [
+        {"aggregation": "monthly", "year": year},
+        {"aggregation": "daily", "year": year, "month": 12},
+        {"aggregation": "daily", "start": f"{year}-01-01", "end": f"{year}-12-31"},
+        {"aggregation": "total", "year": year},
+        {"aggregation": "countries", "year": year},
+        {"aggregation": "stays", "year": year, "month": 1},
+    ]
+    status, response = ask(queries)
+    assert status == 200
+    assert all("error" not in result for result in response["results"])
+
+
+def test_failing_query_is_a_server_error(data, monkeypatch, caplog):
+    def fail(**kwargs):
+        raise ZeroDivisionError("internal details")
+
+    monkeypatch.setattr(data_wrangling, "get_range_total", fail)
+    status, _, text = query_api.answer(
+        {"queries": [{"aggregation": "total", "year": 2016}]}
+    )
+    assert status == 500 and "internal details" not in text
+    assert "ZeroDivisionError" in caplog.text
+    # after the first result, the response is cut short instead
+    queries = [{"aggregation": "stays"}, {"aggregation": "total", "year": 2016}]
+    status, _, pieces = query_api.answer({"queries": queries})
+    assert status == 200
+    with pytest.raises(ZeroDivisionError):
+        "".join(pieces)